@@ -0,0 +1,176 @@
+# Compiles stopword profiles (see stopword-profiles.json) from the .txt files in stopword-chunks folder
+#
+# Each profile names the chunks it is made of (glob patterns, optionally extending another profile), so e.g. Twitter slang
+# is only removed when tagging tweets. Entries are normalised the way the tagger tokenizes documents (see tokenize in
+# tagger.py), since stopwords are checked against its tokens rather than raw text:
+#   - lowercased, with punctuation removed: 'good-looking' -> 'goodlooking', '#goodfriday' -> 'goodfriday'
+#   - entries that NLTK's word tokenizer splits into several words become phrases: "you're" -> 'you re'; the joined
+#     form ('youre', as produced by the fast tokenizer) is kept as a word too
+#   - entries left with no letters (e.g. punctuation.txt) are dropped, as the tagger never keeps such tokens
+#
+# Each build writes <out-dir>/<profile>-<hash>.bin, named after a SHA-256 of its contents, and <out-dir>/<profile>.json,
+# a manifest with the version no. (incremented whenever the contents change), the hash and the chunks it was built from.
+# The tagger reads the manifest of the profile it is given, then loads the artifact (see load_stop_words_profile in
+# tagger.py). Layout of the artifact:
+#   header: magic bytes b'STOPWRD2', no. of words (uint32), length of words blob (uint32), no. of phrases (uint32),
+#           length of phrases blob (uint32), SHA-256 of words blob + phrases blob (32 bytes)
+#   blobs:  words sorted and joined by newlines; phrases (words joined by spaces) sorted and joined by newlines; UTF-8
+import argparse
+import hashlib
+import string
+import struct
+import fnmatch
+import json
+import time
+import re
+import os
+
+from nltk.tokenize import NLTKWordTokenizer
+
+STOPWORDS_MAGIC = b'STOPWRD2'
+STOPWORDS_HEADER = struct.Struct('<8sIIII32s')
+
+# Same as the tagger's punctuation removal, for both of its tokenizers
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+FAST_TABLE = {**PUNCTUATION_TABLE, **str.maketrans('‘’‚“”„–—…•', ' ' * 10)}
+
+def read_chunk(name):
+    # Most chunks are UTF-8, but some were saved as cp1252 (e.g. 'vis-à-vis')
+    with open(name, 'rb') as f:
+        raw = f.read()
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252')
+
+def resolve_chunks(profiles, name, chunksDir):
+    '''
+    Returns:
+        list: returns the sorted file names of the chunks of a profile, including those of the profiles it extends
+    '''
+    profile = profiles[name]
+    chunks = set(resolve_chunks(profiles, profile['extends'], chunksDir)) if ('extends' in profile) else set()
+    available = [name for name in os.listdir(chunksDir) if name.endswith('.txt')]
+    for pattern in profile['chunks']:
+        matched = fnmatch.filter(available, pattern)
+        if (len(matched) < 1):
+            raise ValueError(f'Profile {name}: no chunk matches {pattern}')
+        chunks.update(matched)
+    return sorted(chunks)
+
+def normalise(entries):
+    '''
+    Normalise raw stopword entries into the words and phrases the tagger matches tokens against
+
+    Returns:
+        tuple: returns the sorted words, the sorted phrases (tuples of words), and the no. of entries dropped
+    '''
+    tokenizer = NLTKWordTokenizer()
+    words, phrases, dropped = set(), set(), 0
+    for entry in entries:
+        entry = entry.strip().lower()
+        if (entry == ''):
+            continue
+        joined = ''.join(entry.translate(FAST_TABLE).split())
+        tokens = tuple(w for w in (t.translate(PUNCTUATION_TABLE) for t in tokenizer.tokenize(entry)) if (w != ''))
+
+        if (joined.isalpha()):
+            words.add(joined)
+        if (len(tokens) > 1 and all(w.isalpha() for w in tokens)):
+            phrases.add(tokens)
+        elif (len(tokens) == 1 and tokens[0].isalpha()):
+            words.add(tokens[0])
+        elif (not joined.isalpha()):
+            dropped += 1
+
+    # A phrase made only of stopwords is removed word by word anyway
+    phrases = [phrase for phrase in phrases if (not all(w in words for w in phrase))]
+    return sorted(words), sorted(phrases), dropped
+
+def write_compiled(path, words, phrases):
+    wordsBlob = '\n'.join(words).encode('utf-8')
+    phrasesBlob = '\n'.join(' '.join(phrase) for phrase in phrases).encode('utf-8')
+    digest = hashlib.sha256(wordsBlob + phrasesBlob).digest()
+    with open(path, 'wb') as f:
+        f.write(STOPWORDS_HEADER.pack(STOPWORDS_MAGIC, len(words), len(wordsBlob), len(phrases), len(phrasesBlob), digest))
+        f.write(wordsBlob)
+        f.write(phrasesBlob)
+    return digest.hex()
+
+def build_profile(profiles, name, chunksDir, outDir, keep):
+    '''
+    Compile a profile into a hashed artifact and update its manifest; the artifact is left as is if unchanged
+
+    Returns:
+        dict: returns the manifest of the profile
+    '''
+    chunks = resolve_chunks(profiles, name, chunksDir)
+    entries, chunkHashes = [], {}
+    for chunk in chunks:
+        text = read_chunk(os.path.join(chunksDir, chunk))
+        entries += re.split(r'[;,\s\n]\s*', text)
+        chunkHashes[chunk] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    words, phrases, dropped = normalise(entries)
+
+    manifestPath = os.path.join(outDir, f'{name}.json')
+    previous = None
+    if (os.path.exists(manifestPath)):
+        with open(manifestPath, 'r') as f:
+            previous = json.load(f)
+
+    tmpPath = os.path.join(outDir, f'{name}.bin.tmp')
+    digest = write_compiled(tmpPath, words, phrases)
+    filename = f'{name}-{digest[:12]}.bin'
+    os.replace(tmpPath, os.path.join(outDir, filename))
+
+    unchanged = (previous is not None and previous['sha256'] == digest)
+    manifest = {
+        'profile': name,
+        'version': previous['version'] if (unchanged) else (previous['version'] + 1 if (previous) else 1),
+        'built': previous['built'] if (unchanged) else round(time.time()),
+        'file': filename,
+        'sha256': digest,
+        'words': len(words),
+        'phrases': len(phrases),
+        'dropped': dropped,
+        'chunks': chunkHashes,
+        'description': profiles[name].get('description', ''),
+        'history': ([] if (previous is None) else previous['history'] if (unchanged) else [previous['file']] + previous['history'])[:keep - 1]
+    }
+
+    # The manifest is replaced atomically, so a tagger starting mid-build sees either the old artifact or the new one
+    with open(f'{manifestPath}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f'{manifestPath}.tmp', manifestPath)
+
+    # Keep the artifacts of the last keep versions, so that a profile can be rolled back by editing its manifest. Only
+    # this profile's own artifacts, <name>-<hash>.bin, are removed: not those of a profile named e.g. news-lite
+    current = set([filename] + manifest['history'])
+    pattern = re.compile(rf'{re.escape(name)}-[0-9a-f]{{12}}\.bin')
+    for other in os.listdir(outDir):
+        if (pattern.fullmatch(other) and other not in current):
+            os.remove(os.path.join(outDir, other))
+
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile stopword profiles into hashed artifacts the tagger loads at startup')
+    parser.add_argument('profiles', nargs='*', help='profiles to build; defaults to every profile')
+    parser.add_argument('--profiles-file', help='profile definitions', default='./stopword-profiles.json')
+    parser.add_argument('--chunks-dir', help='folder of stopword chunks', default='./stopword-chunks')
+    parser.add_argument('--out-dir', help='folder to write artifacts and manifests to; copy it to tagger/src/utils/stopwords', default='./compiled')
+    parser.add_argument('--keep', type=int, help='no. of versions of each profile kept', default=3)
+    args = parser.parse_args()
+
+    with open(args.profiles_file, 'r') as f:
+        profiles = json.load(f)
+    unknown = [name for name in args.profiles if (name not in profiles)]
+    if (len(unknown) > 0):
+        parser.error(f"unknown profile(s): {', '.join(unknown)}; choose from {', '.join(profiles)}")
+
+    if (not os.path.exists(args.out_dir)):
+        os.makedirs(args.out_dir)
+
+    for name in args.profiles or list(profiles):
+        manifest = build_profile(profiles, name, args.chunks_dir, args.out_dir, args.keep)
+        print(f"{name} v{manifest['version']}: {manifest['words']} words, {manifest['phrases']} phrases, {manifest['dropped']} entries dropped -> {manifest['file']}")
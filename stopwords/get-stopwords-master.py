@@ -1,17 +1,47 @@
 # Gets master stopword list from all stopword
 # .txt files in stopword-chunks folder
+#
+# Writes both stopwords-master.txt and stopwords-master.bin; the .bin artifact is a compiled form of the same stopwords
+# that the tagger loads at startup without the delimiter parsing of the .txt (see load_compiled_stop_words in tagger.py).
+# Layout:
+#   header: magic bytes b'STOPWRD1', no. of stopwords (uint32), length of blob (uint32), SHA-256 of blob (32 bytes)
+#   blob:   stopwords sorted, deduplicated, without empty strings, joined by newlines and encoded in UTF-8
 import glob
 import re
+import struct
+import hashlib
+
+STOPWORDS_MAGIC = b'STOPWRD1'
+STOPWORDS_HEADER = struct.Struct('<8sII32s')
+
+def read_chunk(name):
+    # Most chunks are UTF-8, but some were saved as cp1252 (e.g. 'vis-à-vis')
+    with open(name, 'rb') as f:
+        raw = f.read()
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252')
+
+def write_compiled(path, stop_words):
+    blob = '\n'.join(stop_words).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(STOPWORDS_HEADER.pack(STOPWORDS_MAGIC, len(stop_words), len(blob), hashlib.sha256(blob).digest()))
+        f.write(blob)
 
 stop_words = set()
 
 files = glob.glob('./stopword-chunks/*.txt')
 for name in files:
-    with open(name, 'r') as f:
-        text = f.read()
-        words = re.split(r'[;,\s\n]\s*', text)
-        stop_words.update(words)
+    text = read_chunk(name)
+    words = re.split(r'[;,\s\n]\s*', text)
+    stop_words.update(words)
 
-with open('./stopwords-master.txt', 'w') as f:
+stop_words.discard('')
+stop_words = sorted(stop_words)
+
+with open('./stopwords-master.txt', 'w', encoding='utf-8') as f:
     for word in stop_words:
-        f.write(f'{word}\n')
\ No newline at end of file
+        f.write(f'{word}\n')
+
+write_compiled('./stopwords-master.bin', stop_words)
@@ -1,35 +1,216 @@
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from sklearn.datasets import fetch_20newsgroups
-from sklearn.decomposition import NMF, LatentDirichletAllocation
+# Benchmark runner comparing LDA and NMF at corpus scale: documents are streamed in chunks (from 20 newsgroups, text
+# files or an Elasticsearch index) and both models are fitted out of core, LDA with partial_fit and NMF with
+# MiniBatchNMF, each in its own process. Wall time, peak RSS and topic coherence are reported for each model, so the
+# production model can be chosen on measured cost at the size of our corpus
 
-def display_topics(model, feature_names, no_top_words):
-    for topic_idx, topic in enumerate(model.components_):
-        print("Topic %d:" % (topic_idx))
-        print(" ".join([feature_names[i] for i in topic.argsort()[:-no_top_words - 1:-1]]))
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.decomposition import MiniBatchNMF, LatentDirichletAllocation
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+import argparse
+import json
+import time
+import sys
+import os
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
 
-dataset = fetch_20newsgroups(shuffle=True, random_state=1, remove=('headers', 'footers', 'quotes'))
-documents = dataset.data
+# Hashed vectorizer of the tagger (bounded memory however large the vocabulary); every process hashes terms the same way
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tagger', 'src'))
+from hashing import HashedCountVectorizer
 
-no_features = 1000
+def stream_documents(args):
+    '''
+    Generator of the documents of the chosen source, one string at a time; never holds more than the source does
 
-# NMF is able to use tf-idf
-tfidf_vectorizer = TfidfVectorizer(max_df=0.95, min_df=2, max_features=no_features, stop_words='english')
-tfidf = tfidf_vectorizer.fit_transform(documents)
-tfidf_feature_names = tfidf_vectorizer.get_feature_names()
+    Args:
+        args (Namespace): parsed arguments; source, and path or es_index/nodes
 
-# LDA can only use raw term counts for LDA because it is a probabilistic graphical model
-tf_vectorizer = CountVectorizer(max_df=0.95, min_df=2, max_features=no_features, stop_words='english')
-tf = tf_vectorizer.fit_transform(documents)
-tf_feature_names = tf_vectorizer.get_feature_names()
+    Yields:
+        str: the documents, up to args.max_docs of them
+    '''
+    def documents():
+        if (args.source == 'newsgroups'):
+            from sklearn.datasets import fetch_20newsgroups
+            yield from fetch_20newsgroups(shuffle=True, random_state=1, remove=('headers', 'footers', 'quotes')).data
+        elif (args.source == 'files'):
+            # A directory of documents, one per file, or a single file of documents, one per line
+            if (os.path.isdir(args.path)):
+                for name in sorted(os.listdir(args.path)):
+                    with open(os.path.join(args.path, name), 'r', encoding='utf-8', errors='ignore') as f:
+                        yield f.read()
+            else:
+                with open(args.path, 'r', encoding='utf-8', errors='ignore') as f:
+                    for line in f:
+                        yield line
+        else:
+            from elasticsearch import Elasticsearch
+            from elasticsearch.helpers import scan
+            es = Elasticsearch(args.nodes)
+            for hit in scan(es, index=args.es_index, query={'query': {'match_all': {}}, '_source': 'content'}, size=args.chunk_size, scroll='10m'):
+                yield hit['_source'].get('content', '')
 
-no_topics = 20
+    return islice(documents(), args.max_docs or None)
 
-# Run NMF
-nmf = NMF(n_components=no_topics, random_state=1, alpha=.1, l1_ratio=.5, init='nndsvd').fit(tfidf)
+def stream_chunks(args, vectorizer, passes=1):
+    '''
+    Generator of hashed term counts of the documents, one chunk of args.chunk_size documents at a time
 
-# Run LDA
-lda = LatentDirichletAllocation(n_topics=no_topics, max_iter=5, learning_method='online', learning_offset=50.,random_state=0).fit(tf)
+    Yields:
+        scipy.sparse.csr_matrix: term counts of a chunk
+    '''
+    for _ in range(passes):
+        docs = stream_documents(args)
+        chunk = list(islice(docs, args.chunk_size))
+        while (len(chunk) > 0):
+            yield vectorizer.partial_fit(chunk)
+            chunk = list(islice(docs, args.chunk_size))
 
-no_top_words = 10
-display_topics(nmf, tfidf_feature_names, no_top_words)
-display_topics(lda, tf_feature_names, no_top_words)
\ No newline at end of file
+def umass_coherence(components, args, vectorizer, top_words=10):
+    '''
+    Mean UMass coherence of the topics over the first args.coherence_docs documents: for each pair of top words of a
+    topic, log((no. of documents with both + 1) / no. of documents with the higher ranked word). Closer to 0 is better
+
+    Returns:
+        float: returns the mean coherence across topics
+    '''
+    top = np.argsort(components, axis=1)[:, :-top_words - 1:-1]
+    words = np.unique(top)
+    column = {j: i for i, j in enumerate(words)}
+
+    # Binary document-word occurrences of the top words only, so memory is bounded by the no. of top words
+    coDocs = np.zeros((len(words), len(words)))
+    sample = islice(stream_documents(args), args.coherence_docs or None)
+    for chunk in iter(lambda: list(islice(sample, args.chunk_size)), []):
+        occurs = (vectorizer.transform(chunk)[:, words] > 0).astype(np.float64)
+        coDocs += (occurs.T @ occurs).toarray()
+
+    scores = []
+    for topic in top:
+        score = 0.0
+        for i in range(1, len(topic)):
+            for j in range(i):
+                wi, wj = column[topic[i]], column[topic[j]]
+                if (coDocs[wj, wj] > 0):
+                    score += np.log((coDocs[wi, wj] + 1) / coDocs[wj, wj])
+        scores.append(score)
+
+    return float(np.mean(scores))
+
+def peak_rss_mb():
+    '''
+    Returns:
+        float: returns the peak RSS in MB of this process; on Windows, its peak working set if psutil is installed, and
+               None otherwise
+    '''
+    if (resource is not None):
+        # ru_maxrss is in KB on Linux, but in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if (sys.platform == 'darwin') else 1024)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return info.peak_wset / (1024 * 1024) if (hasattr(info, 'peak_wset')) else None
+
+def fit_model(name, args):
+    '''
+    Fit one model out of core over the document stream; run in its own process, so its peak RSS is its own
+
+    Args:
+        name (str): lda or nmf
+        args (Namespace): parsed arguments
+
+    Returns:
+        dict: returns model name, no. of documents, wall time, peak RSS, coherence and top words of each topic
+    '''
+    start = time.time()
+    vectorizer = HashedCountVectorizer(n_features=args.hash_features, stop_words='english')
+    numDocs = 0
+
+    if (name == 'lda'):
+        # LDA can only use raw term counts for LDA because it is a probabilistic graphical model
+        model = LatentDirichletAllocation(n_components=args.topics, learning_method='online', learning_offset=50., total_samples=args.total_samples, random_state=0)
+        for tf in stream_chunks(args, vectorizer, args.passes):
+            model.partial_fit(tf)
+            numDocs += tf.shape[0]
+    else:
+        # NMF is able to use tf-idf; document frequencies take one pass over the stream, bounded by the no. of features
+        docFreq = np.zeros(args.hash_features)
+        for tf in stream_chunks(args, vectorizer):
+            docFreq += np.bincount(tf.indices, minlength=args.hash_features)
+            numDocs += tf.shape[0]
+        tfidf = TfidfTransformer().fit(np.zeros((1, args.hash_features)))
+        tfidf.idf_ = np.log((1 + numDocs) / (1 + docFreq)) + 1
+
+        model = MiniBatchNMF(n_components=args.topics, batch_size=args.chunk_size, init='nndsvda', alpha_W=.1, l1_ratio=.5, random_state=1)
+        for tf in stream_chunks(args, vectorizer, args.passes):
+            model.partial_fit(tfidf.transform(tf))
+        numDocs *= args.passes
+
+    wallTime = time.time() - start
+    feature_names = vectorizer.get_feature_names()
+    # Features no document was hashed to have no name, and must not rank among the top words
+    components = np.where(feature_names != '', model.components_, -1)
+
+    return {
+        'model': name,
+        'docs': numDocs,
+        'wall_seconds': wallTime,
+        'peak_rss_mb': peak_rss_mb(),
+        'coherence_umass': umass_coherence(components, args, vectorizer, args.top_words),
+        'topics': [[feature_names[i] for i in topic.argsort()[:-args.top_words - 1:-1]] for topic in components]
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark LDA against NMF, both fitted out of core over a stream of documents')
+    parser.add_argument('--source', help='newsgroups: 20 newsgroups; files: --path; es: --es-index', default='newsgroups', choices=['newsgroups', 'files', 'es'])
+    parser.add_argument('--path', help='directory of documents (one per file), or file of documents (one per line)')
+    parser.add_argument('--es-index', help='Elasticsearch index to stream the content field of', default='documents')
+    parser.add_argument('--nodes', nargs='+', help='Elasticsearch nodes', default=['127.0.0.1:9200'])
+    parser.add_argument('--max-docs', type=int, help='max no. of documents streamed; 0 streams every document', default=0)
+    parser.add_argument('--chunk-size', type=int, help='no. of documents vectorized and fitted at a time', default=2000)
+    parser.add_argument('--passes', type=int, help='no. of passes over the stream', default=1)
+    parser.add_argument('--topics', type=int, help='no. of topics', default=20)
+    parser.add_argument('--hash-features', type=int, help='no. of features terms are hashed into', default=2**16)
+    parser.add_argument('--total-samples', type=int, help='estimated no. of documents in the corpus; scales the LDA online updates', default=1000000)
+    parser.add_argument('--coherence-docs', type=int, help='no. of documents, from the start of the stream, to measure coherence over', default=10000)
+    parser.add_argument('--top-words', type=int, help='no. of top words per topic, for coherence and display', default=10)
+    parser.add_argument('--models', nargs='+', help='models to fit, each in its own process', default=['lda', 'nmf'], choices=['lda', 'nmf'])
+    parser.add_argument('--serial', help='fit the models one after the other instead of in parallel, e.g. to time each without contention', action='store_true')
+    parser.add_argument('--show-topics', help='print the top words of every topic', action='store_true')
+    parser.add_argument('--output', help='file to save the results to as JSON')
+    args = parser.parse_args()
+
+    if (args.source == 'files' and not args.path):
+        parser.error('argument --path: required with --source files')
+
+    if (args.serial):
+        # A new process for every model: peak RSS covers the whole life of a process, so a reused one would report the
+        # larger of both models' peaks for the second
+        results = []
+        for name in args.models:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(fit_model, name, args).result())
+    else:
+        with ProcessPoolExecutor(max_workers=len(args.models)) as executor:
+            results = list(executor.map(fit_model, args.models, [args] * len(args.models)))
+
+    print(f"{'model':<6} {'docs':>9} {'wall (s)':>10} {'peak RSS (MB)':>14} {'UMass coherence':>16}")
+    for result in results:
+        rss = f"{result['peak_rss_mb']:>14.1f}" if (result['peak_rss_mb'] is not None) else f"{'n/a':>14}"
+        print(f"{result['model']:<6} {result['docs']:>9} {result['wall_seconds']:>10.1f} {rss} {result['coherence_umass']:>16.3f}")
+
+    if (args.show_topics):
+        for result in results:
+            print(f"\n{result['model'].upper()}")
+            for topic_idx, words in enumerate(result['topics']):
+                print("Topic %d:" % (topic_idx))
+                print(" ".join(words))
+
+    if (args.output):
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
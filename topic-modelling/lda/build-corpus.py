@@ -0,0 +1,298 @@
+# Builds the training corpus of the gensim LDA model (see LDA.ipynb) as a streaming, multi-process pipeline. Documents
+# flow through each stage one chunk at a time, so no stage holds the whole corpus in memory, and the output of every
+# stage is cached on disk under a key hashed from its input and parameters, so a model refresh only reruns the stages
+# whose input or settings changed
+#
+# Stages, as in the notebook:
+#   tokens:   emails, whitespace runs and single quotes removed, then gensim's simple_preprocess (deacc); spread over
+#             --workers processes
+#   nostops:  stopwords removed (nltk's, --extra-stopwords and the --stopwords files), checked against a frozenset
+#   phrases:  bigram (and with --ngrams 3, trigram) Phrases learnt over the tokens in one streamed pass each, then frozen
+#   lemmas:   phrases applied to nostops, then lemmatized by spaCy's nlp.pipe over --workers processes, keeping the
+#             --pos tags; --no-lemmatize stops after the phrases
+#   corpus:   gensim Dictionary of the lemmas, and their doc2bow corpus serialized in the Matrix Market format, which
+#             gensim streams from disk for training
+#
+# Stage outputs are JSON lines of token lists, <cache-dir>/<stage>-<key>.jsonl, written to a temporary file and renamed
+# once complete, so an interrupted build never leaves a partial stage behind. <out-dir>/corpus.json is a manifest of the
+# latest build: paths of the corpus, the dictionary and the lemmatized texts (for coherence), with the key of each stage
+from gensim.utils import simple_preprocess
+from gensim.models.phrases import Phrases
+from gensim.corpora import Dictionary, MmCorpus
+
+from multiprocessing import Pool
+from itertools import islice
+import argparse
+import hashlib
+import pickle
+import glob
+import json
+import time
+import re
+import os
+
+EMAIL_PATTERN = re.compile(r'\S*@\S*\s?')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+class JsonLines:
+    '''
+    Re-iterable stream of the token lists of a stage output, read from disk on every pass (gensim's Phrases and
+    Dictionary take such streams in place of lists)
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+def stage_key(*parts):
+    '''
+    Returns:
+        str: returns the cache key of a stage, hashed from the keys of its inputs and its parameters
+    '''
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def hash_input(path):
+    '''
+    Returns:
+        str: returns a SHA-256 of the input documents, a file or every file of a directory, read in blocks
+    '''
+    sha = hashlib.sha256()
+    paths = sorted(os.path.join(path, name) for name in os.listdir(path)) if (os.path.isdir(path)) else [path]
+    for name in paths:
+        sha.update(os.path.basename(name).encode('utf-8'))
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+def read_documents(path, field):
+    '''
+    Generator of the raw documents of the input: a JSON file of records as read by pandas (e.g. newsgroups.json), a
+    JSON lines file, or a directory of documents, one per file
+
+    Args:
+        path (str): input path
+        field (str): field of each record holding the document
+
+    Yields:
+        str: the documents
+    '''
+    if (os.path.isdir(path)):
+        for name in sorted(os.listdir(path)):
+            with open(os.path.join(path, name), 'r', encoding='utf-8', errors='ignore') as f:
+                yield f.read()
+    elif (path.endswith('.jsonl')):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line).get(field) or ''
+    else:
+        # Only the raw documents are held; every stage after this one streams
+        import pandas as pd
+        yield from (str(doc) for doc in pd.read_json(path)[field].values)
+
+def clean(doc):
+    '''
+    Returns:
+        list: returns the tokens of a raw document, with emails, whitespace runs and single quotes removed first
+    '''
+    doc = EMAIL_PATTERN.sub('', doc)
+    doc = WHITESPACE_PATTERN.sub(' ', doc)
+    doc = doc.replace("'", '')
+    return simple_preprocess(doc, deacc=True)
+
+def parallel_map(fn, items, workers, chunk_size):
+    '''
+    Generator applying fn to every item over a pool of worker processes, in order. Items are handed to the pool one
+    chunk at a time, so at most one chunk of inputs and outputs is in memory, however long the stream (Pool.imap alone
+    would read the whole stream ahead)
+
+    Yields:
+        obj: the result of fn on each item
+    '''
+    if (workers <= 1):
+        yield from map(fn, items)
+        return
+
+    items = iter(items)
+    with Pool(workers) as pool:
+        for chunk in iter(lambda: list(islice(items, chunk_size)), []):
+            yield from pool.imap(fn, chunk, chunksize=max(1, chunk_size // (workers * 4)))
+
+def load_stop_words(args):
+    '''
+    Returns:
+        frozenset: returns nltk's stopwords of args.nltk_stopwords (if set), args.extra_stopwords and the words of the
+                   files matching args.stopwords
+    '''
+    stop_words = set(args.extra_stopwords)
+    if (args.nltk_stopwords):
+        from nltk.corpus import stopwords
+        stop_words.update(stopwords.words(args.nltk_stopwords))
+    for pattern in args.stopwords:
+        for name in sorted(glob.glob(pattern)):
+            with open(name, 'r', encoding='utf-8', errors='ignore') as f:
+                stop_words.update(re.split(r'[;,\s\n]\s*', f.read()))
+    stop_words.discard('')
+    return frozenset(stop_words)
+
+def lemmatize(docs, args):
+    '''
+    Generator lemmatizing token lists with spaCy, in batches of args.batch_size over args.workers processes
+
+    Yields:
+        list: the lemmas of each document whose part of speech is in args.pos
+    '''
+    import spacy
+    nlp = spacy.load(args.spacy_model, disable=['parser', 'ner'])
+    allowed = frozenset(args.pos)
+    for doc in nlp.pipe((' '.join(tokens) for tokens in docs), batch_size=args.batch_size, n_process=args.workers):
+        yield [token.lemma_ for token in doc if (token.pos_ in allowed)]
+
+def spacy_version(args):
+    '''
+    Returns:
+        str: returns the versions of spaCy and its model, which lemmas depend on
+    '''
+    import spacy
+    return f"{spacy.__version__}/{args.spacy_model}-{spacy.util.get_package_version(args.spacy_model)}"
+
+class Builder:
+    '''
+    Runs the stages of the corpus build, reusing the cached output of every stage whose key is unchanged
+
+    Args:
+        args (Namespace): parsed arguments
+
+    Attributes:
+        keys (dict): stage -> cache key
+        timings (dict): stage -> seconds taken; 0 for stages read from cache
+    '''
+    def __init__(self, args):
+        self.args = args
+        self.keys = {}
+        self.timings = {}
+
+    def path(self, stage, extension='jsonl'):
+        return os.path.join(self.args.cache_dir, f'{stage}-{self.keys[stage]}.{extension}')
+
+    def run(self, stage, key, build, extension='jsonl'):
+        '''
+        Run a stage unless its output is cached; build takes the path to write to
+
+        Returns:
+            str: returns the path of the stage's output
+        '''
+        self.keys[stage] = key
+        path = self.path(stage, extension)
+        if (os.path.exists(path)):
+            print(f'{stage}: cached ({key})')
+            self.timings[stage] = 0
+            return path
+
+        start = time.time()
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        build(tmpPath)
+        os.replace(tmpPath, path)
+        self.timings[stage] = time.time() - start
+        print(f'{stage}: built in {self.timings[stage]:.1f}s ({key})')
+        return path
+
+    def write_docs(self, path, docs):
+        with open(path, 'w', encoding='utf-8') as f:
+            for tokens in docs:
+                f.write(json.dumps(tokens))
+                f.write('\n')
+
+    def build(self):
+        '''
+        Returns:
+            dict: returns the manifest of the build
+        '''
+        args = self.args
+        inputKey = stage_key(hash_input(args.input), args.field)
+
+        tokensPath = self.run('tokens', stage_key(inputKey, 'tokens'), lambda path: self.write_docs(
+            path, parallel_map(clean, read_documents(args.input, args.field), args.workers, args.chunk_size)))
+
+        stop_words = load_stop_words(args)
+        nostopsPath = self.run('nostops', stage_key(self.keys['tokens'], sorted(stop_words)), lambda path: self.write_docs(
+            path, ([word for word in tokens if (word not in stop_words)] for tokens in JsonLines(tokensPath))))
+
+        # As in the notebook, phrases are learnt before stopwords are removed, so they may span a stopword's position
+        def build_phrases(path):
+            bigram = Phrases(JsonLines(tokensPath), min_count=args.min_count, threshold=args.threshold).freeze()
+            models = [bigram]
+            if (args.ngrams == 3):
+                models.append(Phrases(bigram[JsonLines(tokensPath)], threshold=args.threshold).freeze())
+            with open(path, 'wb') as f:
+                pickle.dump(models, f)
+        phrasesPath = self.run('phrases', stage_key(self.keys['tokens'], args.min_count, args.threshold, args.ngrams), build_phrases, 'pkl')
+
+        def apply_phrases():
+            with open(phrasesPath, 'rb') as f:
+                models = pickle.load(f)
+            for tokens in JsonLines(nostopsPath):
+                for model in models:
+                    tokens = model[tokens]
+                yield tokens
+
+        if (args.lemmatize):
+            lemmasKey = stage_key(self.keys['nostops'], self.keys['phrases'], spacy_version(args), sorted(args.pos))
+            lemmasPath = self.run('lemmas', lemmasKey, lambda path: self.write_docs(path, lemmatize(apply_phrases(), args)))
+        else:
+            lemmasPath = self.run('lemmas', stage_key(self.keys['nostops'], self.keys['phrases']), lambda path: self.write_docs(path, apply_phrases()))
+
+        def build_corpus(path):
+            id2word = Dictionary(JsonLines(lemmasPath))
+            id2word.save(self.path('corpus', 'id2word'))
+            MmCorpus.serialize(path, (id2word.doc2bow(tokens) for tokens in JsonLines(lemmasPath)), id2word=id2word)
+            # serialize() saves its index next to the temporary file; keep it next to the final one
+            os.replace(f'{path}.index', f"{self.path('corpus', 'mm')}.index")
+        corpusPath = self.run('corpus', stage_key(self.keys['lemmas']), build_corpus, 'mm')
+
+        manifest = {
+            'input': os.path.abspath(args.input),
+            'corpus': os.path.abspath(corpusPath),
+            'id2word': os.path.abspath(self.path('corpus', 'id2word')),
+            'texts': os.path.abspath(lemmasPath),
+            'keys': self.keys,
+            'timings': self.timings,
+            'built': round(time.time())
+        }
+        with open(os.path.join(args.out_dir, 'corpus.json.tmp'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(os.path.join(args.out_dir, 'corpus.json.tmp'), os.path.join(args.out_dir, 'corpus.json'))
+
+        return manifest
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build the doc2bow training corpus of the gensim LDA model, streaming and caching every stage')
+    parser.add_argument('--input', help='documents: JSON file of records (as read by pandas), JSON lines file, or directory of documents (one per file)', default='newsgroups.json')
+    parser.add_argument('--field', help='field of each record holding the document', default='content')
+    parser.add_argument('--out-dir', help='folder to write the corpus.json manifest to', default='.')
+    parser.add_argument('--cache-dir', help='folder of cached stage outputs', default='./corpus-cache')
+    parser.add_argument('-w', '--workers', type=int, help='no. of processes tokenizing and lemmatizing', default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, help='no. of documents handed to the tokenizing processes at a time', default=10000)
+    parser.add_argument('--batch-size', type=int, help='no. of documents per spaCy nlp.pipe batch', default=1000)
+    parser.add_argument('--stopwords', nargs='*', help='glob patterns of stopword .txt files', default=['../../stopwords/stopword-chunks/*.txt'])
+    parser.add_argument('--nltk-stopwords', help="language of nltk's stopwords to include; empty to leave them out", default='english')
+    parser.add_argument('--extra-stopwords', nargs='*', help='more stopwords', default=['from', 'subject', 're', 'edu', 'use'])
+    parser.add_argument('--ngrams', type=int, help='2: bigrams; 3: bigrams and trigrams', default=2, choices=[2, 3])
+    parser.add_argument('--min-count', type=int, help='min count of a phrase', default=5)
+    parser.add_argument('--threshold', type=float, help='score threshold of a phrase; higher means fewer phrases', default=100)
+    parser.add_argument('--no-lemmatize', dest='lemmatize', help='skip spaCy lemmatization', action='store_false')
+    parser.add_argument('--spacy-model', help='spaCy model used to lemmatize', default='en_core_web_sm')
+    parser.add_argument('--pos', nargs='+', help='parts of speech kept by lemmatization', default=['NOUN', 'ADJ', 'VERB', 'ADV'])
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    for folder in [args.out_dir, args.cache_dir]:
+        if (not os.path.exists(folder)):
+            os.makedirs(folder)
+
+    manifest = Builder(args).build()
+    print(f"Corpus: {manifest['corpus']}; dictionary: {manifest['id2word']}; {sum(manifest['timings'].values()):.1f}s in total")
@@ -0,0 +1,41 @@
+# Exports the topic-term matrix of the saved gensim LDA model (lda_model) into a topic index: top term ids and weights
+# of every topic, top topics of every term, and the vocabulary with a hash table of term -> term id, in one binary file
+# that is memory-mapped at query time (see topic_index.py in tagger/src), so that a search service can expand "More Like
+# This" queries or label topics without loading gensim or pandas
+#
+# --csv also writes the top terms of every topic as in doc2vec-input.ipynb (topic_id,term0,...), the input of topic
+# labelling with doc2vec
+from gensim.models import LdaModel
+
+import argparse
+import time
+import csv
+import sys
+import os
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tagger', 'src'))
+from topic_index import write_topic_index, TopicIndex
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the topic-term matrix of a gensim LDA model into a memory-mappable topic index')
+    parser.add_argument('--model', help='file path of the saved gensim model', default='./lda_model')
+    parser.add_argument('--output', help='file path of the topic index', default='./lda-topic-index.bin')
+    parser.add_argument('--top-k', type=int, help='no. of top terms kept per topic', default=30)
+    parser.add_argument('--term-topics', type=int, help='no. of top topics kept per term', default=3)
+    parser.add_argument('--csv', help='also write the top terms of every topic to this CSV file, e.g. lda-gensim-output.csv')
+    args = parser.parse_args()
+
+    start = time.time()
+    lda = LdaModel.load(args.model, mmap='r')
+    vocab = [lda.id2word[term_id] for term_id in range(lda.num_terms)]
+    digest = write_topic_index(args.output, lda.get_topics(), vocab, args.top_k, args.term_topics)
+    print(f'{lda.num_topics} topics, {len(vocab)} terms -> {args.output} ({os.path.getsize(args.output) / 1024:.1f} KB, sha256 {digest[:12]}) in {time.time() - start:.1f}s')
+
+    if (args.csv):
+        index = TopicIndex(args.output)
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['topic_id'] + [f'term{i}' for i in range(index.top_k)])
+            for topic in range(index.num_topics):
+                writer.writerow([topic] + [term for term, _ in index.topic_terms(topic)])
+        index.close()
@@ -0,0 +1,206 @@
+# Model selection harness for the gensim LDA model: sweeps num_topics (and alpha, eta) over the corpus built by
+# build-corpus.py, training one model per process, and writes a table comparing held-out perplexity and topic coherence
+# of every run, so the no. of topics can be picked in minutes instead of one notebook run per candidate
+#
+# Evaluation is on a reference sample of --sample-docs documents held out of training. Its inverted index (term -> the
+# sorted sample documents containing it) is computed once, saved as .npy arrays and memory-mapped by every run, so the
+# runs share one copy of it in the page cache and each coherence is a few intersections per topic instead of a pass over
+# the texts. Coherences are computed over whole documents ("boolean document") rather than gensim's sliding windows of
+# 110 words, which is what makes the precomputed index possible: c_v here matches gensim's CoherenceModel with a
+# window_size longer than any document
+from gensim.models import LdaModel
+from gensim.corpora import Dictionary, MmCorpus
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import numpy as np
+import argparse
+import hashlib
+import random
+import json
+import time
+import csv
+import os
+
+EPSILON = 1e-12 # as in gensim.topic_coherence
+
+class Excluding:
+    '''
+    Re-iterable stream of a corpus without the documents at the given indices (the held-out sample)
+    '''
+    def __init__(self, corpus, excluded):
+        self.corpus = corpus
+        self.excluded = frozenset(excluded)
+
+    def __len__(self):
+        return len(self.corpus) - len(self.excluded)
+
+    def __iter__(self):
+        for i, doc in enumerate(self.corpus):
+            if (i not in self.excluded):
+                yield doc
+
+def sample_indices(numDocs, sampleDocs, seed):
+    return sorted(random.Random(seed).sample(range(numDocs), min(sampleDocs, numDocs)))
+
+def build_reference(manifest, sample, path):
+    '''
+    Save the inverted index of the sampled texts: indices.npy holds the sample documents containing each term, in
+    order of term id, sorted, with term i's from indptr.npy[i] to indptr.npy[i+1]
+
+    Args:
+        manifest (dict): corpus.json of build-corpus.py
+        sample (list): sorted indices of the sample documents in the corpus
+        path (str): folder to save the index to
+    '''
+    id2word = Dictionary.load(manifest['id2word'])
+    wanted = iter(sample)
+    nextIdx = next(wanted, None)
+    postings = [[] for _ in range(len(id2word))]
+    with open(manifest['texts'], 'r', encoding='utf-8') as f:
+        sampleNo = 0
+        for i, line in enumerate(f):
+            if (i != nextIdx):
+                continue
+            for word_id in set(id2word.doc2idx(json.loads(line))):
+                if (word_id >= 0):
+                    postings[word_id].append(sampleNo)
+            sampleNo += 1
+            nextIdx = next(wanted, None)
+
+    if (not os.path.exists(path)):
+        os.makedirs(path)
+    np.save(os.path.join(path, 'indptr.npy'), np.concatenate([[0], np.cumsum([len(docs) for docs in postings])]).astype(np.int64))
+    np.save(os.path.join(path, 'indices.npy'), np.fromiter((doc for docs in postings for doc in docs), dtype=np.int32))
+    with open(os.path.join(path, 'reference.json'), 'w') as f:
+        json.dump({'docs': len(sample)}, f)
+
+class Reference:
+    '''
+    Inverted index of the reference sample, memory-mapped
+
+    Args:
+        path (str): folder the index was saved to by build_reference()
+    '''
+    def __init__(self, path):
+        self.indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'reference.json'), 'r') as f:
+            self.num_docs = json.load(f)['docs']
+
+    def docs(self, word_id):
+        return self.indices[self.indptr[word_id]:self.indptr[word_id + 1]]
+
+    def npmi(self, word_ids):
+        '''
+        Returns:
+            np.ndarray: returns the NPMI of every pair of the given words, over the documents of the sample, as per
+                        gensim's log_ratio_measure(normalize=True); 0 for pairs with a word absent from the sample
+        '''
+        docs = [self.docs(word_id) for word_id in word_ids]
+        counts = np.array([len(d) for d in docs], dtype=np.float64)
+        co = np.diag(counts)
+        for i in range(len(docs)):
+            for j in range(i):
+                co[i, j] = co[j, i] = len(np.intersect1d(docs[i], docs[j], assume_unique=True))
+
+        p, pCo = counts / self.num_docs, co / self.num_docs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            npmi = np.log((pCo + EPSILON) / np.outer(p, p)) / -np.log(pCo + EPSILON)
+        npmi[(counts == 0)[:, np.newaxis] | (counts == 0)[np.newaxis, :]] = 0
+        return npmi
+
+    def coherence(self, topics):
+        '''
+        Args:
+            topics (list): list of the top word ids of each topic
+
+        Returns:
+            dict: returns c_v (NPMI context vectors of each word against the whole topic, compared by cosine) and
+                  c_npmi (mean NPMI of the pairs of each topic), each averaged over topics
+        '''
+        cv, cnpmi = [], []
+        for word_ids in topics:
+            npmi = self.npmi(word_ids)
+            # Context vector of each word is its row; of the whole topic, the sum of the rows (gamma = 1)
+            topic = npmi.sum(axis=0)
+            norms = np.linalg.norm(npmi, axis=1) * np.linalg.norm(topic)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cv.append(np.nanmean(npmi @ topic / norms))
+            cnpmi.append(npmi[np.tril_indices(len(word_ids), -1)].mean())
+        return {'c_v': float(np.nanmean(cv)), 'c_npmi': float(np.mean(cnpmi))}
+
+def evaluate(config, args, manifest, referencePath, heldout):
+    '''
+    Train and evaluate one model; run in its own process
+
+    Args:
+        config (dict): num_topics, alpha and eta
+        args (Namespace): parsed arguments; passes, chunksize, coherence_words and seed
+        manifest (dict): corpus.json of build-corpus.py
+        referencePath (str): folder of the reference index
+        heldout (list): indices of the held-out sample in the corpus
+
+    Returns:
+        dict: returns the config with training seconds, held-out log perplexity and perplexity, c_v and c_npmi
+    '''
+    corpus, id2word = MmCorpus(manifest['corpus']), Dictionary.load(manifest['id2word'])
+    start = time.time()
+    model = LdaModel(Excluding(corpus, heldout), id2word=id2word, num_topics=config['num_topics'], alpha=config['alpha'],
+                     eta=config['eta'], passes=args.passes, chunksize=args.chunksize, eval_every=None, random_state=args.seed)
+    seconds = time.time() - start
+
+    bound = model.log_perplexity([corpus[i] for i in heldout])
+    topics = [[word_id for word_id, _ in model.get_topic_terms(topic, topn=args.coherence_words)] for topic in range(model.num_topics)]
+    return {
+        **config,
+        'train_seconds': round(seconds, 1),
+        'log_perplexity': bound,
+        'perplexity': 2 ** -bound,
+        **Reference(referencePath).coherence(topics)
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep num_topics and priors of the gensim LDA model in parallel, comparing held-out perplexity and coherence')
+    parser.add_argument('--manifest', help='corpus.json written by build-corpus.py', default='./corpus.json')
+    parser.add_argument('--topics', type=int, nargs='+', help='no. of topics to try', default=[5, 10, 15, 20, 30, 40])
+    parser.add_argument('--alpha', nargs='+', help='document-topic priors to try: symmetric, asymmetric or auto', default=['symmetric'])
+    parser.add_argument('--eta', nargs='+', help='topic-word priors to try: symmetric or auto', default=['symmetric'])
+    parser.add_argument('--passes', type=int, help='no. of passes of each run', default=2)
+    parser.add_argument('--chunksize', type=int, help='no. of documents per training chunk', default=2000)
+    parser.add_argument('--sample-docs', type=int, help='no. of documents held out of training and evaluated on', default=5000)
+    parser.add_argument('--coherence-words', type=int, help='no. of top words per topic scored for coherence', default=20)
+    parser.add_argument('--seed', type=int, help='random state of the sample and the models', default=100)
+    parser.add_argument('-j', '--jobs', type=int, help='no. of runs in parallel, one process each', default=os.cpu_count())
+    parser.add_argument('--cache-dir', help='folder of reference indices, reused by later sweeps over the same corpus and sample', default='./corpus-cache')
+    parser.add_argument('--output', help='file to write the comparison table to, as CSV', default='./lda-selection.csv')
+    args = parser.parse_args()
+
+    with open(args.manifest, 'r') as f:
+        manifest = json.load(f)
+
+    heldout = sample_indices(len(MmCorpus(manifest['corpus'])), args.sample_docs, args.seed)
+    key = hashlib.sha256(json.dumps([manifest['keys'], args.sample_docs, args.seed]).encode('utf-8')).hexdigest()[:16]
+    referencePath = os.path.join(args.cache_dir, f'reference-{key}')
+    if (not os.path.exists(os.path.join(referencePath, 'reference.json'))):
+        start = time.time()
+        build_reference(manifest, heldout, referencePath)
+        print(f'Reference index of {len(heldout)} documents built in {time.time() - start:.1f}s')
+
+    configs = [{'num_topics': topics, 'alpha': alpha, 'eta': eta} for topics, alpha, eta in product(args.topics, args.alpha, args.eta)]
+    print(f'Running {len(configs)} configurations, {args.jobs} at a time...')
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        n = len(configs)
+        results = list(executor.map(evaluate, configs, [args] * n, [manifest] * n, [referencePath] * n, [heldout] * n))
+
+    # Higher coherence is better; perplexity tends to keep falling with more topics, so it is a tie-breaker at most
+    results.sort(key=lambda result: -result['c_v'])
+    columns = ['num_topics', 'alpha', 'eta', 'c_v', 'c_npmi', 'perplexity', 'log_perplexity', 'train_seconds']
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print(f"{'topics':>6} {'alpha':>10} {'eta':>10} {'c_v':>7} {'c_npmi':>7} {'perplexity':>11} {'train (s)':>9}")
+    for result in results:
+        print(f"{result['num_topics']:>6} {result['alpha']:>10} {result['eta']:>10} {result['c_v']:>7.3f} {result['c_npmi']:>7.3f} {result['perplexity']:>11.1f} {result['train_seconds']:>9.1f}")
@@ -0,0 +1,188 @@
+# Trains the gensim LDA model (lda_model, as used by the tagger's gensim backend) over the corpus built by
+# build-corpus.py. The corpus is streamed from its Matrix Market file on every pass instead of being held in memory, and
+# the E-step is spread over worker processes with LdaMulticore, so training over the full index uses every core with
+# memory bounded by the model and a few chunks per worker. Time per pass and peak memory are reported, and --tune picks
+# the no. of workers and chunksize with the highest throughput on a sample of the corpus before training
+#
+# alpha='auto' (as in the notebook) is only supported by the single-core LdaModel, which is used for it, as for
+# --workers 1; --distributed trains LdaModel over gensim's Pyro4 dispatcher and workers, which must already be running
+from gensim.models import LdaModel, LdaMulticore
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.utils import ClippedCorpus
+
+from itertools import product
+import argparse
+import json
+import time
+import sys
+import os
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+class TimedCorpus:
+    '''
+    Wraps a corpus to time the passes made over it: gensim iterates the corpus once per pass, so every pass starts when
+    the corpus is iterated again, and the last one ends with training
+
+    Attributes:
+        starts (list): time.time() at the start of each pass
+        rss (list): peak RSS in MB of the training process at the end of each pass
+    '''
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.starts = []
+        self.rss = []
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __iter__(self):
+        self.starts.append(time.time())
+        yield from self.corpus
+        self.rss.append(peak_rss_mb())
+
+    def passes(self, end):
+        '''
+        Returns:
+            list: returns seconds taken by each pass, given the time training ended
+        '''
+        return [later - start for start, later in zip(self.starts, self.starts[1:] + [end])]
+
+def peak_rss_mb(children=False):
+    '''
+    Returns:
+        float: returns the peak RSS in MB of this process, or with children, of the largest of its terminated child
+               processes (the workers); on Windows, the peak working set of this process if psutil is installed, and
+               None otherwise
+    '''
+    if (resource is not None):
+        # ru_maxrss is in KB on Linux, but in bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if (children) else resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024 if (sys.platform == 'darwin') else 1024)
+    if (children):
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return info.peak_wset / (1024 * 1024) if (hasattr(info, 'peak_wset')) else None
+
+def format_mb(mb):
+    return f'{mb:.1f} MB' if (mb is not None) else 'n/a'
+
+def load_corpus(args):
+    '''
+    Returns:
+        tuple: returns the streamed corpus and its dictionary, from args.manifest or args.corpus and args.id2word
+    '''
+    corpusPath, id2wordPath = args.corpus, args.id2word
+    if (not corpusPath):
+        with open(args.manifest, 'r') as f:
+            manifest = json.load(f)
+        corpusPath, id2wordPath = manifest['corpus'], manifest['id2word']
+    return MmCorpus(corpusPath), Dictionary.load(id2wordPath)
+
+def train(args, corpus, id2word, workers, chunksize, passes):
+    '''
+    Train a model over a streamed corpus
+
+    Args:
+        args (Namespace): parsed arguments; topics, alpha, distributed and seed
+        corpus (iterable): bag-of-words corpus; iterated once per pass
+        id2word (Dictionary): dictionary of the corpus
+        workers (int): no. of worker processes; 1 trains with the single-core LdaModel
+        chunksize (int): no. of documents per chunk, the unit of work of a worker
+        passes (int): no. of passes over the corpus
+
+    Returns:
+        tuple: returns the model, and a dict of total seconds, seconds of each pass and peak RSS in MB at each pass
+    '''
+    timed = TimedCorpus(corpus)
+    start = time.time()
+    # eval_every=None: perplexity is estimated once after training rather than on chunks as they are processed
+    if (workers > 1 and args.alpha != 'auto' and not args.distributed):
+        model = LdaMulticore(timed, num_topics=args.topics, id2word=id2word, workers=workers, chunksize=chunksize, passes=passes,
+                             alpha=args.alpha, eval_every=None, random_state=args.seed, per_word_topics=True)
+    else:
+        model = LdaModel(timed, num_topics=args.topics, id2word=id2word, chunksize=chunksize, passes=passes, alpha=args.alpha,
+                         eval_every=None, random_state=args.seed, per_word_topics=True, distributed=args.distributed)
+    end = time.time()
+
+    return model, {
+        'seconds': end - start,
+        'pass_seconds': timed.passes(end),
+        'pass_peak_rss_mb': timed.rss
+    }
+
+def tune(args, corpus, id2word):
+    '''
+    Time one pass over the first args.tune_docs documents for every combination of args.tune_workers and
+    args.tune_chunksize
+
+    Returns:
+        list: returns dicts of workers, chunksize, seconds and docs/sec, fastest first
+    '''
+    sample = ClippedCorpus(corpus, args.tune_docs)
+    numDocs = len(sample)
+    results = []
+    for workers, chunksize in product(args.tune_workers, args.tune_chunksize):
+        _, stats = train(args, sample, id2word, workers, chunksize, 1)
+        results.append({'workers': workers, 'chunksize': chunksize, 'seconds': stats['seconds'], 'docs_per_sec': numDocs / stats['seconds']})
+        print(f"workers {workers:>3}, chunksize {chunksize:>6}: {numDocs / stats['seconds']:>9.1f} docs/s")
+    return sorted(results, key=lambda result: -result['docs_per_sec'])
+
+if __name__ == '__main__':
+    cores = os.cpu_count()
+    parser = argparse.ArgumentParser(description='Train the gensim LDA model over the streamed corpus of build-corpus.py, on every core')
+    parser.add_argument('--manifest', help='corpus.json written by build-corpus.py', default='./corpus.json')
+    parser.add_argument('--corpus', help='Matrix Market corpus to train on instead of the manifest\'s')
+    parser.add_argument('--id2word', help='gensim Dictionary of --corpus')
+    parser.add_argument('--output', help='file path to save the model to', default='./lda_model')
+    parser.add_argument('--topics', type=int, help='no. of topics', default=20)
+    parser.add_argument('--passes', type=int, help='no. of passes over the corpus', default=10)
+    parser.add_argument('--alpha', help="document-topic prior: symmetric, asymmetric, or auto (learnt; single-core only)", default='symmetric')
+    parser.add_argument('-w', '--workers', type=int, help='no. of worker processes; the main process dispatches chunks and merges results, so one less than the no. of cores', default=max(1, cores - 1))
+    parser.add_argument('--chunksize', type=int, help='no. of documents per chunk handed to a worker', default=2000)
+    parser.add_argument('--distributed', help="train over gensim's Pyro4 cluster of LDA workers", action='store_true')
+    parser.add_argument('--seed', type=int, help='random state', default=100)
+    parser.add_argument('--tune', help='pick --workers and --chunksize by timing one pass over a sample of the corpus with each combination of --tune-workers and --tune-chunksize', action='store_true')
+    parser.add_argument('--tune-docs', type=int, help='no. of documents of the tuning sample', default=20000)
+    parser.add_argument('--tune-workers', type=int, nargs='+', help='no. of workers tried by --tune', default=sorted(set([1, max(1, cores // 2), max(1, cores - 1)])))
+    parser.add_argument('--tune-chunksize', type=int, nargs='+', help='chunksizes tried by --tune', default=[500, 2000, 5000])
+    parser.add_argument('--perplexity-docs', type=int, help='no. of documents the perplexity of the trained model is estimated on; 0 skips it', default=5000)
+    parser.add_argument('--report', help='file to save the timings and memory of the run to as JSON; memory is null where it cannot be measured (on Windows without psutil)')
+    args = parser.parse_args()
+
+    if (args.corpus and not args.id2word):
+        parser.error('argument --corpus: requires --id2word')
+
+    corpus, id2word = load_corpus(args)
+    print(f'Corpus of {len(corpus)} documents, {len(id2word)} terms')
+    report = {'docs': len(corpus), 'terms': len(id2word)}
+
+    if (args.tune):
+        report['tuning'] = tune(args, corpus, id2word)
+        args.workers, args.chunksize = report['tuning'][0]['workers'], report['tuning'][0]['chunksize']
+        print(f'Training with {args.workers} workers, chunksize {args.chunksize}')
+
+    model, stats = train(args, corpus, id2word, args.workers, args.chunksize, args.passes)
+    model.save(args.output)
+    report.update({'workers': args.workers, 'chunksize': args.chunksize, **stats})
+    report['peak_rss_mb'] = peak_rss_mb()
+    report['workers_peak_rss_mb'] = peak_rss_mb(children=True)
+
+    print(f"{'pass':>4} {'seconds':>9} {'docs/s':>9} {'peak RSS':>14}")
+    for i, (seconds, rss) in enumerate(zip(stats['pass_seconds'], stats['pass_peak_rss_mb'])):
+        print(f"{i + 1:>4} {seconds:>9.1f} {len(corpus) / seconds:>9.1f} {format_mb(rss):>14}")
+    print(f"Trained in {stats['seconds']:.1f}s; peak RSS {format_mb(report['peak_rss_mb'])}, {format_mb(report['workers_peak_rss_mb'])} per worker")
+
+    if (args.perplexity_docs):
+        report['log_perplexity'] = model.log_perplexity(ClippedCorpus(corpus, args.perplexity_docs))
+        print(f"Per-word log perplexity bound over {min(len(corpus), args.perplexity_docs)} documents: {report['log_perplexity']:.3f}")
+
+    if (args.report):
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,135 @@
+# Asyncio tagging: one search_after stream per primary shard of the index, all driven concurrently by an event loop, so
+# that a single tagger process keeps several shards (and the nodes holding them) busy instead of making one round trip
+# at a time. The pinned elasticsearch client (6.x) has no async API, so its blocking calls run on a thread pool sized to
+# the client's connection pool, and the CPU-bound tagging runs on its own executor thread (which spreads documents across
+# the TaggerPool's worker processes, if any)
+
+# Imports
+from elasticsearch.client import IndicesClient
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from pipeline import count_docs
+
+# Function Definitions
+def get_num_shards(es, esIndex):
+    '''
+    Function to get the no. of primary shards of an index
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+
+    Returns:
+        int: returns no. of primary shards
+    '''
+    settings = IndicesClient.get_settings(es, index=esIndex, name='index.number_of_shards')
+    return int(next(iter(settings.values()))['settings']['index']['number_of_shards'])
+
+# Class Definitions
+class AsyncTagger:
+    '''
+    Tags every document needing tags by streaming each shard concurrently; within a shard, the next page is fetched
+    while the current one is tagged and written
+
+    Args:
+        es (obj): elasticsearch object reference; its connection pool should allow at least io_threads connections per node
+                  (see connectDB() in tagger.py)
+        esIndex (str): Elasticsearch index of concern
+        stream (function): takes a shard number and returns an iterator of batches of that shard's documents needing tags,
+                           e.g. stream_documents() in tagger.py with preference '_shards:<shard>'; streaming stops at the
+                           first empty batch
+        tag (function): takes a batch and returns the list of update actions for it (see get_actions() in tagger.py)
+        write (function): takes a list of update actions and writes them to ES (see BulkWriter.write() in writer.py)
+        rootLogger (obj): reference of rootLogger object
+        shards (list): shard numbers to stream; if None, every primary shard of the index
+        io_threads (int): max no. of concurrent ES requests
+        should_stop (function): checked before fetching each page; if it returns True, no more pages are fetched and the
+                                pages already fetched are tagged and written before run() returns
+        metrics (Metrics): optional metrics registry to record fetch latencies and fetched document counts in
+
+    Attributes:
+        docs (int): no. of documents tagged so far
+    '''
+    def __init__(self, es, esIndex, stream, tag, write, rootLogger, shards=None, io_threads=8, should_stop=None, metrics=None):
+        self.es = es
+        self.esIndex = esIndex
+        self.tag = tag
+        self.write = write
+        self.stream = stream
+        self.rootLogger = rootLogger
+        self.shards = shards
+        self.io_threads = io_threads
+        self.should_stop = should_stop
+        self.metrics = metrics
+        self.docs = 0
+
+    async def _fetch(self, loop, batches):
+        start = time.time()
+        batch = await loop.run_in_executor(self.io_executor, next, batches, [])
+        if (self.metrics is not None):
+            self.metrics.observe('fetch_seconds', time.time() - start)
+            self.metrics.inc('docs_fetched_total', count_docs(batch))
+        return batch
+
+    async def _tag_shard(self, loop, shard):
+        batches = self.stream(shard)
+        fetching = loop.create_task(self._fetch(loop, batches))
+
+        while (True):
+            batch = await fetching
+            numDocs = count_docs(batch)
+            if (numDocs < 1):
+                self.rootLogger.info(f'Shard {shard}: no more documents to tag')
+                return
+
+            if (self.should_stop is not None and self.should_stop()):
+                self.rootLogger.info(f'Shard {shard}: stopping; no more pages will be fetched')
+                fetching = None
+            else:
+                fetching = loop.create_task(self._fetch(loop, batches))
+
+            actions = await loop.run_in_executor(self.tag_executor, self.tag, batch)
+            await loop.run_in_executor(self.io_executor, self.write, actions)
+            self.docs += numDocs
+            self.rootLogger.info(f'Shard {shard}: tagged {numDocs} document(s); {self.docs} in total')
+
+            if (fetching is None):
+                return
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        shards = self.shards if (self.shards is not None) else range(await loop.run_in_executor(self.io_executor, get_num_shards, self.es, self.esIndex))
+        self.rootLogger.info(f'Tagging shards {list(shards)} concurrently...')
+
+        tasks = [loop.create_task(self._tag_shard(loop, shard)) for shard in shards]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On failure of one shard, stop the others; requests already running on the executors are waited for in run()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        '''
+        Tag every shard until no documents need tagging, or until should_stop() returns True and the pages in flight have
+        been written
+
+        Returns:
+            int: returns no. of documents tagged
+        '''
+        start = time.time()
+        self.io_executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='es-io')
+        self.tag_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tag')
+        try:
+            asyncio.run(self._run())
+        finally:
+            self.io_executor.shutdown(wait=True)
+            self.tag_executor.shutdown(wait=True)
+
+        end = time.time()
+        self.rootLogger.info(f'Async tagging finished: {self.docs} docs in {end-start:.1f}s ({self.docs / max(end-start, 1e-9):.1f} docs/s)')
+        return self.docs
@@ -0,0 +1,183 @@
+# Adaptive batch sizing: rather than a fixed -b, the no. of documents fetched per batch and sent per bulk request are
+# adjusted as the tagger runs, from the measured latency of each stage, the size of the documents, and the rate at which
+# the cluster rejects bulk writes. A quiet cluster is made full use of, and a busy one is backed off from, without
+# having to pick a batch size up front
+
+# Imports
+import threading
+import time
+
+from pipeline import count_docs
+
+# Class Definitions
+class BatchController:
+    '''
+    Adjusts the batch size (documents per fetch) and bulk size (documents per bulk request) after every batch written
+
+    The seconds per document of each stage (fetch, tag, write) are smoothed with an exponentially weighted moving
+    average. The batch size moves towards the no. of documents the slowest stage gets through in target_seconds; it
+    grows by at most a factor of growth per batch, shrinks as fast as needed, and is capped so that the content of a
+    batch stays within max_batch_bytes. The bulk size moves towards the no. of documents written in bulk_target_seconds
+    per bulk request, the same way. If more than max_rejection_rate of a batch's documents are rejected by the cluster
+    (429), both sizes are halved and neither grows for the next cooldown batches; as in TCP congestion control, growth
+    is gradual and backing off is immediate.
+
+    Safe to use from the pipeline and asyncio threads; sizes are read once per request, so a change applies from the
+    next one.
+
+    Args:
+        initial (int): initial batch size
+        min_size (int): min batch size
+        max_size (int): max batch size; up to 10000 (the index's max_result_window)
+        target_seconds (float): target seconds of the slowest stage per batch
+        max_batch_bytes (int): max bytes of document content per batch
+        bulk_size (int): initial bulk size
+        bulk_min (int): min bulk size
+        bulk_max (int): max bulk size
+        bulk_target_seconds (float): target seconds per bulk request
+        max_rejection_rate (float): fraction of a batch's documents which may be rejected before backing off
+        cooldown (int): no. of batches neither size grows for after backing off
+        growth (float): max factor either size grows by per batch
+        smoothing (float): weight of the latest batch in the moving averages, from 0 to 1
+        rootLogger (obj): optional reference of rootLogger object, to log size changes to
+        metrics (Metrics): optional metrics registry to export the sizes to as gauges
+
+    Attributes:
+        size (int): current batch size
+        bulk_size (int): current bulk size
+        seconds_per_doc (dict): stage -> moving average of seconds per document
+        bytes_per_doc (float): moving average of bytes of content per document; None until a batch is fetched
+    '''
+    def __init__(self, initial, min_size=10, max_size=10000, target_seconds=10, max_batch_bytes=256 * 1024 * 1024,
+                 bulk_size=500, bulk_min=50, bulk_max=5000, bulk_target_seconds=2, max_rejection_rate=0.01, cooldown=3,
+                 growth=1.5, smoothing=0.3, rootLogger=None, metrics=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_batch_bytes = max_batch_bytes
+        self.bulk_min = bulk_min
+        self.bulk_max = bulk_max
+        self.bulk_target_seconds = bulk_target_seconds
+        self.max_rejection_rate = max_rejection_rate
+        self.cooldown = cooldown
+        self.growth = growth
+        self.smoothing = smoothing
+        self.rootLogger = rootLogger
+
+        self.size = min(max(initial, min_size), max_size)
+        self.bulk_size = min(max(bulk_size, bulk_min), bulk_max)
+        self.seconds_per_doc = {}
+        self.bytes_per_doc = None
+        self.held = 0 # batches left before the sizes may grow again
+        self.lock = threading.Lock()
+
+        if (metrics is not None):
+            metrics.gauge('batch_size', lambda: self.size)
+            metrics.gauge('bulk_chunk_size', lambda: self.bulk_size)
+
+    def __call__(self):
+        # Batch generators in tagger.py take the batch size as an int, or a function returning it before every request
+        return self.size
+
+    def _smooth(self, average, value):
+        return value if (average is None) else (1 - self.smoothing) * average + self.smoothing * value
+
+    def observe(self, stage, docs, seconds, nbytes=None):
+        '''
+        Record the seconds a stage took over a batch
+
+        Args:
+            stage (str): fetch, tag or write
+            docs (int): no. of documents of the batch
+            seconds (float): seconds taken
+            nbytes (int): bytes of content of the batch, if known (fetch stage)
+        '''
+        if (docs < 1):
+            return
+        with self.lock:
+            self.seconds_per_doc[stage] = self._smooth(self.seconds_per_doc.get(stage), seconds / docs)
+            if (nbytes is not None):
+                self.bytes_per_doc = self._smooth(self.bytes_per_doc, nbytes / docs)
+
+    def observe_bulk(self, docs, seconds, rejected):
+        '''
+        Record a batch written by the BulkWriter, and adjust both sizes for the next batches
+
+        Args:
+            docs (int): no. of documents of the batch
+            seconds (float): seconds spent sending the batch, excluding producing its actions
+            rejected (int): no. of rejections by the cluster while writing the batch, retries included
+        '''
+        self.observe('write', docs, seconds)
+        if (docs < 1):
+            return
+
+        with self.lock:
+            size, bulk_size = self.size, self.bulk_size
+            if (rejected / docs > self.max_rejection_rate):
+                reason = f'{rejected} of {docs} document(s) rejected'
+                self.size = max(self.min_size, self.size // 2)
+                self.bulk_size = max(self.bulk_min, self.bulk_size // 2)
+                self.held = self.cooldown
+            else:
+                slowest = max(self.seconds_per_doc, key=self.seconds_per_doc.get)
+                reason = f'{slowest} is the slowest stage at {self.seconds_per_doc[slowest] * 1000:.2f}ms per document'
+                self.size = self._toward(self.size, self.target_seconds / max(self.seconds_per_doc[slowest], 1e-6), self.min_size, self.max_size)
+                if (self.bytes_per_doc):
+                    self.size = max(self.min_size, min(self.size, int(self.max_batch_bytes / self.bytes_per_doc)))
+                self.bulk_size = self._toward(self.bulk_size, self.bulk_target_seconds / max(self.seconds_per_doc['write'], 1e-6), self.bulk_min, self.bulk_max)
+                self.held = max(0, self.held - 1)
+
+        if (self.rootLogger is not None and (size, bulk_size) != (self.size, self.bulk_size)):
+            self.rootLogger.info(f'Batch size {size} -> {self.size}, bulk size {bulk_size} -> {self.bulk_size} ({reason})')
+
+    def _toward(self, size, ideal, min_size, max_size):
+        ideal = int(ideal)
+        if (ideal > size):
+            ideal = size if (self.held > 0) else min(ideal, int(size * self.growth) + 1)
+        return min(max(ideal, min_size), max_size)
+
+    def watch(self, batches):
+        '''
+        Generator passing batches through as is, recording the time taken to fetch each and the size of its documents
+
+        Args:
+            batches (iterator): batches of ES _search results, e.g. from stream_documents() in tagger.py
+
+        Yields:
+            list: the batches
+        '''
+        batches = iter(batches)
+        while (True):
+            start = time.time()
+            res_responses = next(batches, None)
+            end = time.time()
+            if (res_responses is None):
+                return
+            nbytes = sum(len(hit.get('_source', {}).get('content') or '') for res in res_responses for hit in res['hits']['hits'])
+            self.observe('fetch', count_docs(res_responses), end - start, nbytes)
+            yield res_responses
+
+    def timed(self, stage, docs, items):
+        '''
+        Generator passing items through as is, recording the time taken to produce them all as the stage's time; used
+        to time lazily produced update actions (see get_actions() in tagger.py)
+
+        Args:
+            stage (str): stage name
+            docs (int): no. of documents the items are for
+            items (iterable): items to pass through
+
+        Yields:
+            obj: the items
+        '''
+        items = iter(items)
+        seconds = 0.0
+        while (True):
+            start = time.time()
+            item = next(items, None)
+            seconds += time.time() - start
+            if (item is None):
+                break
+            yield item
+        self.observe(stage, docs, seconds)
@@ -0,0 +1,279 @@
+# In-process stand-in for the Elasticsearch client, used to benchmark the tagger without a cluster.
+# Supports the subset of the API and query DSL that tagger.py uses: count, search (with sort, search_after,
+# function_score random sampling, _shards search preference, and sliced scrolls), msearch, bulk, and get and index with
+# version checks, as well as indices refresh and get_settings. Network latency and 429 rejections of bulk items can be
+# simulated
+
+# Imports
+from elasticsearch.serializer import JSONSerializer
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+from functools import cmp_to_key
+from collections import Counter
+import threading
+import random
+import zlib
+import time
+import json
+
+# Class Definitions
+class FakeTransport:
+    '''
+    Minimal transport: provides the serializer used by the bulk helpers, and accepts the requests made through
+    namespaced clients (e.g. IndicesClient.refresh); only the no. of shards is returned for index settings
+    '''
+    def __init__(self, es):
+        self.es = es
+        self.serializer = JSONSerializer()
+
+    def perform_request(self, method, url, *args, **kwargs):
+        self.es.requests[f'{method} {url}'] += 1
+        if ('/_settings' in url):
+            index = url.strip('/').split('/')[0]
+            return {index: {'settings': {'index': {'number_of_shards': str(self.es.shards)}}}}
+        return {}
+
+class FakeElasticsearch:
+    '''
+    In-memory Elasticsearch holding the documents of one or more indices
+
+    Args:
+        hits (list): documents to load, as dicts with _index, _id and _source (see synthetic_corpus.generate_hits)
+        latency (dict): seconds to sleep per request, by operation, e.g. {'search': 0.01, 'bulk': 0.05}
+        reject_rate (float): probability of each bulk item being rejected with a 429
+        seed (int): random seed for rejections
+        shards (int): no. of shards documents are routed to by _id; searches with preference '_shards:<n>' only match shard n
+
+    Attributes:
+        requests (Counter): no. of requests made, by operation
+    '''
+    def __init__(self, hits=None, latency=None, reject_rate=0.0, seed=0, shards=1):
+        self.indices = {}
+        self.latency = latency or {}
+        self.reject_rate = reject_rate
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.shards = shards
+        self.versions = Counter() # (index, _id) -> version
+        self.scrolls = {} # scroll id -> hits left to return
+        self.lock = threading.Lock()
+        self.transport = FakeTransport(self)
+
+        for hit in (hits or []):
+            self.indices.setdefault(hit['_index'], {})[hit['_id']] = dict(hit['_source'])
+            self.versions[(hit['_index'], hit['_id'])] = 1
+
+    def _request(self, op):
+        self.requests[op] += 1
+        if (self.latency.get(op)):
+            time.sleep(self.latency[op])
+
+    # Query DSL
+    def _matches(self, doc_id, source, query):
+        if (not query or 'match_all' in query):
+            return True
+        if ('function_score' in query):
+            return self._matches(doc_id, source, query['function_score'].get('query'))
+        if ('ids' in query):
+            return doc_id in query['ids']['values']
+        if ('term' in query):
+            field, value = next(iter(query['term'].items()))
+            value = value['value'] if isinstance(value, dict) else value
+            return (doc_id if (field == '_id') else source.get(field)) == value
+        if ('exists' in query):
+            return source.get(query['exists']['field']) is not None
+        if ('range' in query):
+            field, bounds = next(iter(query['range'].items()))
+            value = source.get(field)
+            if (value is None):
+                return False
+            return all([
+                ('lt' not in bounds or value < bounds['lt']),
+                ('lte' not in bounds or value <= bounds['lte']),
+                ('gt' not in bounds or value > bounds['gt']),
+                ('gte' not in bounds or value >= bounds['gte'])
+            ])
+        if ('bool' in query):
+            clauses = query['bool']
+            def as_list(clause):
+                return clause if isinstance(clause, list) else [clause]
+
+            if (not all([self._matches(doc_id, source, q) for q in as_list(clauses.get('must', [])) + as_list(clauses.get('filter', []))])):
+                return False
+            if (any([self._matches(doc_id, source, q) for q in as_list(clauses.get('must_not', []))])):
+                return False
+            should = as_list(clauses.get('should', []))
+            return len(should) == 0 or any([self._matches(doc_id, source, q) for q in should])
+
+        raise NotImplementedError(f'Query not supported by FakeElasticsearch: {query}')
+
+    def _shard_of(self, doc_id):
+        return zlib.crc32(doc_id.encode('utf-8')) % self.shards
+
+    def _sort_fields(self, sort):
+        fields = []
+        for clause in sort:
+            if isinstance(clause, str):
+                fields.append((clause, 'asc'))
+            else:
+                field, options = next(iter(clause.items()))
+                fields.append((field, options['order'] if isinstance(options, dict) else options))
+        return fields
+
+    def _compare(self, a, b, fields):
+        # Missing values sort last, whatever the order, as in ES
+        for (field, order), x, y in zip(fields, a, b):
+            if (x == y):
+                continue
+            if (x is None or y is None):
+                return 1 if (x is None) else -1
+            return (1 if (x > y) else -1) * (-1 if (order == 'desc') else 1)
+        return 0
+
+    def _filter_source(self, source, source_filter):
+        if (source_filter is None or source_filter is True):
+            return dict(source)
+        fields = [source_filter] if isinstance(source_filter, str) else source_filter
+        return {field: source[field] for field in fields if (field in source)}
+
+    def _search(self, index, body, preference=None, scroll=False):
+        '''
+        Returns:
+            tuple: returns the _search response, and if scroll is set, every hit matched (else None)
+        '''
+        body = body or {}
+        docs = self.indices.get(index, {})
+        matched = [(doc_id, source) for doc_id, source in docs.items() if self._matches(doc_id, source, body.get('query'))]
+        if (preference is not None and preference.startswith('_shards:')):
+            shards = [int(shard) for shard in preference.split(':')[1].split('|')[0].split(',')]
+            matched = [(doc_id, source) for doc_id, source in matched if (self._shard_of(doc_id) in shards)]
+        if ('slice' in body):
+            matched = [(doc_id, source) for doc_id, source in matched if (zlib.adler32(doc_id.encode('utf-8')) % body['slice']['max'] == body['slice']['id'])]
+        total = len(matched)
+
+        if ('function_score' in body.get('query', {})):
+            random.Random(body['query']['function_score'].get('random_score', {}).get('seed', 0)).shuffle(matched)
+
+        sortValues = None
+        if ('sort' in body and body['sort'] != ['_doc']):
+            fields = self._sort_fields(body['sort'])
+            sortValues = {doc_id: [doc_id if (field == '_id') else source.get(field) for field, order in fields] for doc_id, source in matched}
+            matched.sort(key=cmp_to_key(lambda a, b: self._compare(sortValues[a[0]], sortValues[b[0]], fields)))
+
+            if ('search_after' in body):
+                matched = [(doc_id, source) for doc_id, source in matched if self._compare(sortValues[doc_id], body['search_after'], fields) > 0]
+
+        start = body.get('from', 0)
+        page = matched if (scroll) else matched[start:start + body.get('size', 10)]
+
+        hits = []
+        for doc_id, source in page:
+            hit = {'_index': index, '_type': '_doc', '_id': doc_id, '_score': None, '_source': self._filter_source(source, body.get('_source'))}
+            if (sortValues is not None):
+                hit['sort'] = sortValues[doc_id]
+            hits.append(hit)
+
+        res = {'took': 0, 'timed_out': False, 'hits': {'total': total, 'max_score': None, 'hits': hits}, 'status': 200}
+        return (res, hits) if (scroll) else (res, None)
+
+    def _page(self, res, size, left):
+        # Next page of a scroll: the hits matched when the scroll started, whatever has changed since
+        res = dict(res, hits=dict(res['hits'], hits=left[:size]))
+        return res, left[size:]
+
+    # API
+    def count(self, index=None, body=None, **kwargs):
+        self._request('count')
+        with self.lock:
+            docs = self.indices.get(index, {})
+            query = (body or {}).get('query')
+            return {'count': sum([self._matches(doc_id, source, query) for doc_id, source in docs.items()])}
+
+    def search(self, index=None, body=None, preference=None, scroll=None, **kwargs):
+        self._request('search')
+        with self.lock:
+            res, hits = self._search(index, body, preference, scroll is not None)
+            if (scroll is None):
+                return res
+
+            scroll_id = f'scroll_{len(self.scrolls)}'
+            size = (body or {}).get('size', 10)
+            res, left = self._page(res, size, hits)
+            self.scrolls[scroll_id] = (res, size, left)
+            return dict(res, _scroll_id=scroll_id)
+
+    def scroll(self, scroll_id=None, scroll=None, **kwargs):
+        self._request('scroll')
+        with self.lock:
+            if (self.scrolls.get(scroll_id) is None):
+                raise NotFoundError(404, 'search_context_missing_exception', {})
+            res, size, left = self.scrolls[scroll_id]
+            res, left = self._page(res, size, left)
+            self.scrolls[scroll_id] = (res, size, left)
+            return dict(res, _scroll_id=scroll_id)
+
+    def clear_scroll(self, scroll_id=None, **kwargs):
+        self._request('clear_scroll')
+        with self.lock:
+            self.scrolls[scroll_id] = None
+            return {'succeeded': True}
+
+    def msearch(self, body=None, **kwargs):
+        self._request('msearch')
+        with self.lock:
+            return {'responses': [self._search(body[i]['index'], body[i+1])[0] for i in range(0, len(body), 2)]}
+
+    def get(self, index=None, id=None, doc_type='_doc', **kwargs):
+        self._request('get')
+        with self.lock:
+            if (id not in self.indices.get(index, {})):
+                raise NotFoundError(404, 'not_found', {'_index': index, '_id': id, 'found': False})
+            return {'_index': index, '_type': doc_type, '_id': id, '_version': self.versions[(index, id)], 'found': True, '_source': dict(self.indices[index][id])}
+
+    def index(self, index=None, body=None, id=None, doc_type='_doc', op_type='index', version=None, **kwargs):
+        self._request('index')
+        with self.lock:
+            docs = self.indices.setdefault(index, {})
+            if (op_type == 'create' and id in docs):
+                raise ConflictError(409, 'version_conflict_engine_exception', {'reason': 'document already exists'})
+            if (version is not None and self.versions[(index, id)] != version):
+                raise ConflictError(409, 'version_conflict_engine_exception', {'reason': f'current version [{self.versions[(index, id)]}] is different than the one provided [{version}]'})
+
+            docs[id] = dict(body)
+            self.versions[(index, id)] += 1
+            return {'_index': index, '_type': doc_type, '_id': id, '_version': self.versions[(index, id)], 'result': 'created' if (self.versions[(index, id)] == 1) else 'updated'}
+
+    def bulk(self, body=None, **kwargs):
+        self._request('bulk')
+        lines = [line for line in (body.split('\n') if isinstance(body, str) else body) if line]
+        lines = [json.loads(line) if isinstance(line, str) else line for line in lines]
+
+        items = []
+        with self.lock:
+            i = 0
+            while (i < len(lines)):
+                op_type, meta = next(iter(lines[i].items()))
+                data = lines[i+1] if (op_type != 'delete') else None
+                i += 1 if (op_type == 'delete') else 2
+
+                item = {'_index': meta.get('_index'), '_type': meta.get('_type', '_doc'), '_id': meta.get('_id')}
+                docs = self.indices.setdefault(meta.get('_index'), {})
+
+                if (self.reject_rate > 0 and self.rng.random() < self.reject_rate):
+                    item.update({'status': 429, 'error': {'type': 'es_rejected_execution_exception', 'reason': 'rejected by FakeElasticsearch'}})
+                elif (op_type == 'update' and meta.get('_id') not in docs):
+                    item.update({'status': 404, 'error': {'type': 'document_missing_exception', 'reason': 'document missing'}})
+                elif (op_type == 'update'):
+                    docs[meta['_id']].update(data['doc'])
+                    self.versions[(meta.get('_index'), meta['_id'])] += 1
+                    item.update({'status': 200, 'result': 'updated'})
+                elif (op_type == 'delete'):
+                    item.update({'status': 200 if (docs.pop(meta.get('_id'), None) is not None) else 404, 'result': 'deleted'})
+                else: # index / create
+                    docs[meta['_id']] = dict(data)
+                    self.versions[(meta.get('_index'), meta['_id'])] += 1
+                    item.update({'status': 201, 'result': 'created'})
+
+                items.append({op_type: item})
+
+        return {'took': 0, 'errors': any([not (200 <= list(item.values())[0]['status'] < 300) for item in items]), 'items': items}
@@ -0,0 +1,76 @@
+# Synthetic corpus generator for benchmarking the tagger: documents are drawn word by word from the word frequencies
+# of a seed text (by default the PDF-extracted speech used in tests/tagger_test.py), with lengths following a
+# log-normal distribution like the mix of short web pages and long speeches in the index
+
+# Imports
+from collections import Counter
+import random
+import math
+import time
+
+# Function Definitions
+def load_seed_text():
+    '''
+    Function to load the default seed text: the long speech used in tests/tagger_test.py
+
+    Returns:
+        str: returns seed text
+    '''
+    import os, sys
+    sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+    from tagger_test import doc
+
+    return doc
+
+def generate_documents(n, median_words=900, sigma=0.6, empty_fraction=0.0, seed_text=None, seed=0):
+    '''
+    Function to generate synthetic documents
+
+    Args:
+        n (int): no. of documents
+        median_words (int): median no. of words per document
+        sigma (float): spread of the log-normal length distribution; 0 makes every document median_words long
+        empty_fraction (float): fraction of documents which are empty
+        seed_text (str): text whose words (with their capitalisation and punctuation) and frequencies documents are drawn from
+        seed (int): random seed; the same arguments always generate the same documents
+
+    Returns:
+        list: returns list of document strings
+    '''
+    rng = random.Random(seed)
+    counts = Counter((seed_text if (seed_text is not None) else load_seed_text()).split())
+    words, weights = list(counts.keys()), list(counts.values())
+
+    docs = []
+    for i in range(n):
+        if (rng.random() < empty_fraction):
+            docs.append('')
+            continue
+
+        length = max(1, round(rng.lognormvariate(math.log(median_words), sigma)))
+        docs.append(' '.join(rng.choices(words, weights=weights, k=length)))
+
+    return docs
+
+def generate_hits(docs, index='documents', start_time=None):
+    '''
+    Function to wrap documents as ES documents, in the form stored by FakeElasticsearch
+
+    Args:
+        docs (list): list of document strings
+        index (str): index name
+        start_time (int): lastIndexed (epoch milliseconds) of the first document; each following document is 1s later
+
+    Returns:
+        list: returns list of dicts with _index, _id and _source
+    '''
+    start_time = start_time if (start_time is not None) else int(time.time() * 1000)
+
+    return [{
+        '_index': index,
+        '_id': f'synthetic_{i}',
+        '_source': {
+            'content': doc,
+            'lastIndexed': start_time + i * 1000
+        }
+    } for i, doc in enumerate(docs)]
@@ -0,0 +1,239 @@
+'''
+Benchmark of the tagger: measures docs/sec, per-document latency and peak memory of each stage (preprocessing, tag
+extraction, get_actions, bulk writing, and the full fetch -> tag -> write loop) on a synthetic corpus served by an
+in-process fake Elasticsearch, and writes the results as JSON so that runs can be compared
+
+Usage (from the benchmarks folder):
+    python tagger-benchmark.py --output results.json
+    python tagger-benchmark.py --output new.json --compare results.json
+'''
+# Imports
+import sys, os
+import argparse
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+import logging
+import subprocess
+
+sys.dont_write_bytecode = True
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import tagger # tagger.py
+from pipeline import TaggingPipeline
+from async_tagger import AsyncTagger
+from writer import BulkWriter
+from fake_es import FakeElasticsearch
+from synthetic_corpus import generate_documents, generate_hits
+
+# Set from --memory; tracing allocations slows Python code down several times, so it is off by default
+TRACE_MEMORY = False
+
+# Function Definitions
+def measure(fn, numDocs, per_doc=None):
+    '''
+    Function to run a benchmark stage once, tracking its wall time, and peak memory if TRACE_MEMORY is set
+
+    Args:
+        fn (function): stage to run; called with no arguments
+        numDocs (int): no. of documents processed by the stage
+        per_doc (list): if given, fn is instead called once per item of this list, and per-document latencies are reported
+
+    Returns:
+        dict: returns docs, seconds, docs_per_sec, peak_mem_mb (None if not traced), and latency percentiles in ms if per_doc is given
+    '''
+    latencies = []
+    if (TRACE_MEMORY):
+        tracemalloc.start()
+    start = time.perf_counter()
+    if (per_doc is None):
+        fn()
+    else:
+        for item in per_doc:
+            t = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - t)
+    end = time.perf_counter()
+    peak = None
+    if (TRACE_MEMORY):
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    result = {
+        'docs': numDocs,
+        'seconds': end - start,
+        'docs_per_sec': numDocs / (end - start) if (end > start) else 0.0,
+        'peak_mem_mb': peak
+    }
+    if (len(latencies) > 0):
+        latencies.sort()
+        result['latency_ms'] = {
+            'mean': statistics.mean(latencies) * 1000,
+            'p50': latencies[len(latencies) // 2] * 1000,
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            'max': latencies[-1] * 1000
+        }
+
+    return result
+
+def run_benchmarks(args, rootLogger):
+    docs = generate_documents(args.docs, args.median_words, args.sigma, args.empty_fraction, seed=args.seed)
+    stop_words = tagger.load_stop_words(args.stopwords)
+    nonEmpty = [doc for doc in docs if (doc.replace(' ', '') != '')]
+    results = {}
+
+    # Preprocessing
+    results['preprocess_text'] = measure(lambda doc: tagger.preprocess_text(doc, stop_words, args.tokenizer), len(docs), per_doc=docs)
+    results['preprocess_batch'] = measure(lambda: tagger.preprocess_batch(docs, stop_words, args.tokenizer), len(docs))
+    processed = [' '.join(tokens) for tokens in tagger.preprocess_batch(nonEmpty, stop_words, args.tokenizer)]
+
+    # Tag extraction; LDA is only run on the first few documents as it takes seconds per document
+    ldaDocs = processed[:args.lda_docs]
+    results['perform_LDA'] = measure(lambda text: tagger.perform_LDA(text, args.f, args.i, args.lo, args.tw), len(ldaDocs), per_doc=ldaDocs)
+    results['extract_counts'] = measure(lambda text: tagger.extract_tags(text, 'counts', None, args.f, args.i, args.lo, args.tw), len(processed), per_doc=processed)
+    idf_table = tagger.build_idf_table(processed)
+    results['extract_tfidf'] = measure(lambda text: tagger.extract_tags(text, 'tfidf', idf_table, args.f, args.i, args.lo, args.tw), len(processed), per_doc=processed)
+    model = idf_table if (args.backend == 'tfidf') else None
+
+    # get_actions over the whole corpus as a single batch
+    pool = tagger.TaggerPool(args.workers, stop_words, args.f, args.i, args.lo, args.tw, rootLogger, model, args.backend, args.tokenizer) if (args.workers > 1) else None
+    res_responses = [{'hits': {'hits': generate_hits(docs)}}]
+    def tag(res_responses):
+        return [j for j in tagger.get_actions(res_responses, 'documents', rootLogger, stop_words, args.f, args.i, args.lo, args.tw, pool, model, args.backend, args.tokenizer)]
+    results['get_actions'] = measure(lambda: tag(res_responses), len(docs))
+    actions = tag(res_responses)
+
+    # Bulk writing against the fake ES, with simulated latency and rejections
+    def fake_es():
+        return FakeElasticsearch(generate_hits(docs), latency={'search': args.latency, 'msearch': args.latency, 'bulk': args.latency}, reject_rate=args.reject_rate, seed=args.seed, shards=args.shards)
+    es = fake_es()
+    writer = BulkWriter(es, rootLogger, chunk_size=args.bulk_chunk_size, threads=args.bulk_threads, initial_backoff=0.01)
+    results['bulk'] = measure(lambda: writer.write(iter(actions)), len(actions))
+    results['bulk']['requests'] = es.requests['bulk']
+
+    # Full loop: stream documents from the fake ES, tag them and write tags back, sequentially, pipelined, then per shard with asyncio
+    def end_to_end(mode):
+        es = fake_es()
+        writer = BulkWriter(es, rootLogger, chunk_size=args.bulk_chunk_size, threads=args.bulk_threads, initial_backoff=0.01)
+        batches = tagger.stream_documents(es, 'documents', args.b, 0)
+        if (mode == 'async'):
+            AsyncTagger(es, 'documents', lambda shard: tagger.stream_documents(es, 'documents', args.b, 0, preference=f'_shards:{shard}'),
+                        tag, writer.write, rootLogger, io_threads=args.io_threads).run()
+        elif (mode == 'pipelined'):
+            TaggingPipeline(batches, tag, writer.write, rootLogger, queue_size=args.queue_size).run()
+        else:
+            for res_responses in batches:
+                writer.write(tagger.get_actions(res_responses, 'documents', rootLogger, stop_words, args.f, args.i, args.lo, args.tw, pool, model, args.backend, args.tokenizer))
+    results['end_to_end'] = measure(lambda: end_to_end('sequential'), len(docs))
+    results['end_to_end_pipelined'] = measure(lambda: end_to_end('pipelined'), len(docs))
+    results['end_to_end_async'] = measure(lambda: end_to_end('async'), len(docs))
+
+    if (pool is not None):
+        pool.shutdown()
+
+    return results
+
+def compare(results, baseline, tolerance):
+    '''
+    Function to compare the docs/sec of each stage against a previous run
+
+    Args:
+        results (dict): results of this run
+        baseline (dict): results of a previous run
+        tolerance (float): fraction by which docs/sec may drop before it counts as a regression
+
+    Returns:
+        list: returns the names of stages which regressed
+    '''
+    regressions = []
+    print(f"\n{'stage':<24} {'baseline':>12} {'current':>12} {'change':>8}")
+    for stage, result in results.items():
+        if (stage not in baseline):
+            continue
+        before, after = baseline[stage]['docs_per_sec'], result['docs_per_sec']
+        change = (after - before) / before if (before > 0) else 0.0
+        flag = ''
+        if (change < -tolerance):
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f'{stage:<24} {before:12.1f} {after:12.1f} {change:+8.1%}{flag}')
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Synthetic corpus
+    parser.add_argument('--docs', type=int, help='no. of synthetic documents', default=200)
+    parser.add_argument('--median-words', type=int, help='median no. of words per document', default=900)
+    parser.add_argument('--sigma', type=float, help='spread of the log-normal document length distribution', default=0.6)
+    parser.add_argument('--empty-fraction', type=float, help='fraction of empty documents', default=0.05)
+    parser.add_argument('--seed', type=int, help='random seed', default=0)
+    parser.add_argument('--stopwords', help='stopwords file', default='../utils/stopwords-master.txt')
+
+    # Tagger parameters, as per tagger.py
+    parser.add_argument('-b', type=int, help='batch size', default=100)
+    parser.add_argument('-f', type=int, help='max no. of features of LDA', default=1000)
+    parser.add_argument('-i', type=int, help='no. of iterations of LDA', default=1000)
+    parser.add_argument('-tw', type=int, help='top k words for a topic to be obtained', default=10)
+    parser.add_argument('-lo', type=int, help='learning offset for LDA', default=50)
+    parser.add_argument('--lda-docs', type=int, help='no. of documents perform_LDA is benchmarked on', default=5)
+    parser.add_argument('--backend', help='tag extraction backend used by get_actions and end-to-end', default='counts', choices=['lda', 'counts', 'tfidf'])
+    parser.add_argument('--tokenizer', help='tokenizer used in preprocessing', default='fast', choices=['nltk', 'fast'])
+    parser.add_argument('-w', '--workers', type=int, help='no. of tagging worker processes', default=1)
+    parser.add_argument('--queue-size', type=int, help='max no. of batches waiting between two pipeline stages', default=2)
+    parser.add_argument('--bulk-chunk-size', type=int, help='max no. of documents per bulk request', default=500)
+    parser.add_argument('--bulk-threads', type=int, help='no. of threads sending bulk requests', default=1)
+    parser.add_argument('--io-threads', type=int, help='max no. of concurrent ES requests of the asyncio tagger', default=8)
+
+    # Fake ES
+    parser.add_argument('--latency', type=float, help='simulated latency of each ES request, in seconds', default=0.005)
+    parser.add_argument('--shards', type=int, help='no. of shards of the fake index; the asyncio tagger streams each concurrently', default=4)
+    parser.add_argument('--reject-rate', type=float, help='simulated probability of a bulk item being rejected with a 429', default=0.0)
+
+    # Output
+    parser.add_argument('--memory', help='trace peak memory of each stage; slows the stages down', action='store_true')
+    parser.add_argument('--output', help='file to write JSON results to')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, help='drop in docs/sec of a stage that counts as a regression', default=0.1)
+
+    args = parser.parse_args()
+    TRACE_MEMORY = args.memory
+
+    rootLogger = logging.getLogger()
+    rootLogger.setLevel(logging.WARNING) # keeps the pipeline's progress reports and other INFO logs out of the benchmark output
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    results = run_benchmarks(args, rootLogger)
+    report = {
+        'meta': {
+            'timestamp': round(time.time()),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+
+    print(f"{'stage':<24} {'docs':>6} {'seconds':>9} {'docs/s':>10} {'p95 ms':>9} {'peak MB':>9}")
+    for stage, result in results.items():
+        p95 = result['latency_ms']['p95'] if ('latency_ms' in result) else float('nan')
+        print(f"{stage:<24} {result['docs']:6d} {result['seconds']:9.3f} {result['docs_per_sec']:10.1f} {p95:9.2f} {result['peak_mem_mb'] if (result['peak_mem_mb'] is not None) else float('nan'):9.1f}")
+
+    if (args.output):
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if (args.compare):
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        if (len(compare(results, baseline, args.tolerance)) > 0):
+            sys.exit(1)
@@ -0,0 +1,108 @@
+# Durable progress of a tagging run, so that a run stopped by work hours (or killed) resumes where it left off the
+# next night: the search_after cursor of each stream, the documents fetched but not yet written, and running counts.
+# The checkpoint is a small JSON file, replaced atomically on every update so a crash never leaves it half-written
+
+# Imports
+import threading
+import json
+import time
+import os
+
+# Class Definitions
+class Checkpoint:
+    '''
+    Progress of a tagging run, saved to path after every batch fetched and every batch written
+
+    A checkpoint is only resumed by a run with the same key (e.g. same index, ingestion mode and re-tag timestamp);
+    otherwise it is discarded and the run starts afresh.
+
+    Args:
+        path (str): file path of the checkpoint
+        key (dict): settings a resumed run must share with the run that saved the checkpoint
+
+    Attributes:
+        cursors (dict): stream name -> sort values of the last document fetched from that stream
+        in_flight (dict): _id -> None of documents fetched but not yet written, in order fetched
+        counts (dict): no. of documents fetched, written and failed since the checkpoint was started
+        resumed (bool): True if progress was loaded from a previous run
+    '''
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+        self.cursors = {}
+        self.in_flight = {}
+        self.counts = {'fetched': 0, 'written': 0, 'failed': 0}
+        self.resumed = False
+
+        if (os.path.exists(path)):
+            with open(path, 'r') as f:
+                saved = json.load(f)
+            if (saved.get('key') == key):
+                self.cursors = saved['cursors']
+                self.in_flight = dict.fromkeys(saved['in_flight'])
+                self.counts = saved['counts']
+                self.resumed = True
+
+        dirname = os.path.dirname(path)
+        if (dirname and not os.path.exists(dirname)):
+            os.makedirs(dirname)
+
+    def _save(self):
+        tmpPath = f'{self.path}.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump({
+                'key': self.key,
+                'updated': round(time.time()),
+                'cursors': self.cursors,
+                'in_flight': list(self.in_flight),
+                'counts': self.counts
+            }, f)
+        os.replace(tmpPath, self.path)
+
+    def track(self, batches, stream=None):
+        '''
+        Generator passing batches through, recording each batch's documents as in flight (and the stream's cursor) before
+        handing it on
+
+        Args:
+            batches (iterator): batches of ES _search results (see stream_documents() in tagger.py)
+            stream (str): name of the stream whose cursor is recorded, as the sort values of each batch's last document;
+                          None for batches with no meaningful cursor (msearch, scroll)
+
+        Yields:
+            list: the batches
+        '''
+        for batch in batches:
+            hits = [hit for res in batch for hit in res['hits']['hits']]
+            with self.lock:
+                self.in_flight.update(dict.fromkeys([hit['_id'] for hit in hits]))
+                self.counts['fetched'] += len(hits)
+                if (stream is not None and len(hits) > 0 and 'sort' in hits[-1]):
+                    self.cursors[stream] = hits[-1]['sort']
+                self._save()
+            yield batch
+
+    def done(self, ids, written, failed):
+        '''
+        Record documents as no longer in flight once their batch has been written
+
+        Args:
+            ids (list): _ids of the documents of the batch
+            written (int): no. of documents written
+            failed (int): no. of documents which failed to be written
+        '''
+        with self.lock:
+            for doc_id in ids:
+                self.in_flight.pop(doc_id, None)
+            self.counts['written'] += written
+            self.counts['failed'] += failed
+            self._save()
+
+    def finish(self):
+        '''
+        Delete the checkpoint once the run has tagged everything, so that the next run starts afresh
+        '''
+        with self.lock:
+            if (os.path.exists(self.path)):
+                os.remove(self.path)
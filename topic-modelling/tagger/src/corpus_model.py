@@ -0,0 +1,335 @@
+# Corpus-level LDA model: one multi-topic LDA is trained on a sample of the index and saved, after which each document
+# is tagged with a single transform() instead of fitting an LDA per document (see perform_LDA in tagger.py).
+# An online model is additionally updated with partial_fit on every batch tagged, over a bounded vocabulary that new
+# terms enter as they become frequent, and saved as versioned snapshots. Either model can instead hash terms into a fixed
+# no. of features (see hashing.py), so that no vocabulary has to be managed at all
+
+# Imports
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.base import clone
+from scipy.special import psi
+
+from collections import Counter
+import copy
+import os
+import joblib
+import numpy as np
+
+from hashing import HashedCountVectorizer
+
+# Vocabulary entries of an online model's free slots; never produced by the vectorizer's analyzer, so never counted
+FREE_SLOT = '\x00free'
+
+# Function Definitions
+def train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=2, max_df=0.95, hash_features=None):
+    '''
+    Function to train a multi-topic sk-learn LDA over a corpus of documents
+
+    Args:
+        docs (list): list of preprocessed document strings to train on
+        n_topics (int): number of topics
+        max_features (int): number of features used in LDA
+        max_iter (int): number of passes over the corpus
+        learning_offset (int): learning offset
+        min_df (int/float): ignore terms found in fewer documents than this
+        max_df (int/float): ignore terms found in more documents than this
+        hash_features (int): if given, hash terms into this no. of features instead of building a vocabulary (see
+                             hashing.py); max_features, min_df and max_df then do not apply
+
+    Returns:
+        dict: returns the corpus model; holds the fitted vectorizer, LDA, feature names and normalised topic-word matrix
+    '''
+    # LDA can only use raw term counts for LDA because it is a probabilistic graphical model
+    if (hash_features):
+        tf_vectorizer = HashedCountVectorizer(n_features=hash_features, stop_words='english')
+    else:
+        tf_vectorizer = CountVectorizer(max_df=max_df, min_df=min_df, max_features=max_features, stop_words='english')
+    tf = tf_vectorizer.fit_transform(docs)
+
+    lda = LatentDirichletAllocation(n_components=n_topics, max_iter=max_iter, learning_method='online', learning_offset=learning_offset, random_state=0).fit(tf)
+
+    return build_corpus_model(tf_vectorizer, lda)
+
+def build_corpus_model(tf_vectorizer, lda):
+    '''
+    Function to bundle a fitted vectorizer and LDA into a corpus model, precomputing what is needed at tagging time
+
+    Args:
+        tf_vectorizer (obj): fitted CountVectorizer or HashedCountVectorizer
+        lda (obj): fitted LatentDirichletAllocation
+
+    Returns:
+        dict: returns the corpus model
+    '''
+    # p(word | topic); rows of components_ are unnormalised pseudo-counts
+    topic_word = lda.components_ / lda.components_.sum(axis=1)[:, np.newaxis]
+
+    return {
+        'vectorizer': tf_vectorizer,
+        'lda': lda,
+        'feature_names': np.array(tf_vectorizer.get_feature_names()),
+        'topic_word': topic_word
+    }
+
+def save_corpus_model(model, path):
+    '''
+    Function to save a corpus model to disk
+
+    Args:
+        model (dict): corpus model returned by train_corpus_LDA()
+        path (str): file path to save to
+    '''
+    dirname = os.path.dirname(path)
+    if (dirname and not os.path.exists(dirname)):
+        os.makedirs(dirname)
+
+    joblib.dump(model, path)
+
+def load_corpus_model(path):
+    '''
+    Function to load a corpus model saved by save_corpus_model()
+
+    Args:
+        path (str): file path of saved model
+
+    Returns:
+        dict: returns the corpus model
+    '''
+    return joblib.load(path)
+
+def top_k_per_row(tf, scores, k):
+    '''
+    Function to select the k highest scored entries of every row of a sparse matrix in one vectorized pass
+
+    Rows are laid out side by side in a dense (no. of rows, longest row) matrix, so that np.argpartition finds the top k
+    of every row at once; only those k are then sorted, rather than every entry of every row.
+
+    Args:
+        tf (scipy.sparse.csr_matrix): matrix whose stored entries are scored, e.g. the term counts of a batch
+        scores (np.ndarray): score of each stored entry of tf, in the order of tf.indices
+        k (int): no. of entries to select per row
+
+    Returns:
+        np.ndarray: returns the columns of the top k entries of each row, highest first, of shape (no. of rows, k);
+                    rows with fewer than k entries are padded with -1
+    '''
+    n = tf.shape[0]
+    lengths = np.diff(tf.indptr)
+    width = max(int(lengths.max(initial=0)), 1)
+    rows = np.repeat(np.arange(n), lengths)
+
+    padded = np.full((n, width), -np.inf)
+    padded[rows, np.arange(tf.nnz) - tf.indptr[rows]] = scores
+
+    columns = np.full((n, k), -1, dtype=np.int64)
+    kk = min(k, width)
+    if (kk < 1 or tf.nnz < 1):
+        return columns
+
+    top = np.argpartition(-padded, kk - 1, axis=1)[:, :kk]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(padded, top, axis=1), axis=1, kind='stable'), axis=1)
+
+    # Positions past the end of a row hold padding, and are left as -1
+    valid = np.take_along_axis(padded, top, axis=1) > -np.inf
+    positions = np.where(valid, tf.indptr[:-1, np.newaxis] + top, 0)
+    columns[:, :kk] = np.where(valid, tf.indices[positions], -1)
+
+    return columns
+
+def infer_corpus_LDA(docs, model, top_words):
+    '''
+    Function to tag a batch of documents using a trained corpus model, in one transform() over the whole batch
+
+    Words of each document are ranked by p(word | document) = sum over topics of p(topic | document) * p(word | topic),
+    so tags stay specific to the document while being drawn from the topics it belongs to. Only the words present in
+    a document are scored, as one vectorized operation over the stored entries of the batch's term count matrix.
+
+    Args:
+        docs (list): list of preprocessed document strings
+        model (dict): corpus model returned by train_corpus_LDA() or load_corpus_model()
+        top_words (int): number of top words per document
+
+    Returns:
+        tuple: returns the topic distribution of each document, of shape (no. of documents, no. of topics), the
+               feature indices of the top words of each document, of shape (no. of documents, top_words) padded
+               with -1, and the top words themselves, of the same shape padded with ''
+    '''
+    if (len(docs) < 1):
+        return np.zeros((0, model['lda'].n_components)), np.full((0, top_words), -1, dtype=np.int64), np.full((0, top_words), '', dtype=object)
+
+    tf = model['vectorizer'].transform(docs).tocsr()
+    doc_topic = model['lda'].transform(tf)
+
+    rows = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+    scores = (doc_topic[rows] * model['topic_word'][:, tf.indices].T).sum(axis=1)
+    word_idx = top_k_per_row(tf, scores, top_words)
+
+    tags = np.full(word_idx.shape, '', dtype=object)
+    if (isinstance(model['vectorizer'], HashedCountVectorizer)):
+        for i, doc in enumerate(docs):
+            found = word_idx[i][word_idx[i] >= 0]
+            tags[i, :len(found)] = model['vectorizer'].lookup(found, doc)
+    else:
+        tags[word_idx >= 0] = model['feature_names'][word_idx[word_idx >= 0]]
+
+    return doc_topic, word_idx, tags
+
+def perform_corpus_LDA(doc, model, top_words):
+    '''
+    Function to tag a document using a trained corpus model; see infer_corpus_LDA() to tag a batch at once
+
+    Args:
+        doc (str): document (preprocessed) to tag
+        model (dict): corpus model returned by train_corpus_LDA() or load_corpus_model()
+        top_words (int): number of top words to display
+
+    Returns:
+        list: returns list of lists of tags extracted, in the same format as perform_LDA()
+    '''
+    # Only words present in the document (and in the model's vocabulary) can be tags
+    _, word_idx, tags = infer_corpus_LDA([doc], model, top_words)
+    return [tags[0][word_idx[0] >= 0].tolist()]
+
+def _set_components(lda, components):
+    # transform() and partial_fit() use exp(E[log p(word | topic)]), which sk-learn only refreshes when it fits
+    lda.components_ = components
+    lda.exp_dirichlet_component_ = np.exp(psi(components) - psi(components.sum(axis=1))[:, np.newaxis])
+    lda.n_features_in_ = components.shape[1]
+
+def make_online(model, capacity):
+    '''
+    Function to turn a corpus model into an online model, which update_corpus_model() can keep training
+
+    The vocabulary is padded with free slots up to capacity; sk-learn's LDA has a fixed no. of features, so the
+    vocabulary grows into these slots, and stays bounded by evicting the weakest terms once they run out. A hashed model
+    has no vocabulary to grow, and is used as is.
+
+    Args:
+        model (dict): corpus model returned by train_corpus_LDA() or load_corpus_model()
+        capacity (int): max no. of terms in the vocabulary; at least the size of the model's vocabulary
+
+    Returns:
+        dict: returns the online model; a corpus model with the additional keys version and docs_seen
+    '''
+    if (isinstance(model['vectorizer'], HashedCountVectorizer)):
+        return {**build_corpus_model(copy.deepcopy(model['vectorizer']), copy.deepcopy(model['lda'])), 'version': 0, 'docs_seen': 0}
+
+    vocabulary = dict(model['vectorizer'].vocabulary_)
+    lda = copy.deepcopy(model['lda'])
+    padding = capacity - len(vocabulary)
+    if (padding > 0):
+        vocabulary.update({f'{FREE_SLOT}{i}': len(vocabulary) + i for i in range(padding)})
+        _set_components(lda, np.hstack([lda.components_, np.full((lda.n_components, padding), lda.topic_word_prior_)]))
+
+    # Vocabulary is fixed from here on, so document frequency limits no longer apply
+    vectorizer = clone(model['vectorizer']).set_params(vocabulary=vocabulary, min_df=1, max_df=1.0, max_features=None)
+    vectorizer.fit([])
+
+    return {**build_corpus_model(vectorizer, lda), 'version': 0, 'docs_seen': 0}
+
+def update_corpus_model(model, docs, min_count=2, max_new_terms=100):
+    '''
+    Function to update an online model with a batch of documents, in place
+
+    Terms not in the vocabulary that occur in at least min_count documents of the batch are added first, into free slots
+    or else in place of the terms with the least weight across topics (which are not in the batch). The LDA is then
+    updated with one partial_fit() over the batch. A hashed model only updates its reverse index, as every term already
+    has a feature.
+
+    Args:
+        model (dict): online model returned by make_online() or load_model_snapshot()
+        docs (list): list of preprocessed document strings
+        min_count (int): min no. of documents of the batch a new term must occur in to be added
+        max_new_terms (int): max no. of terms added per update
+
+    Returns:
+        dict: returns the updated model, with its version incremented
+    '''
+    docs = [doc for doc in docs if (doc.strip() != '')]
+    if (len(docs) < 1):
+        return model
+
+    vectorizer, lda = model['vectorizer'], model['lda']
+    if (isinstance(vectorizer, HashedCountVectorizer)):
+        lda.partial_fit(vectorizer.partial_fit(docs))
+        return {**build_corpus_model(vectorizer, lda), 'version': model['version'] + 1, 'docs_seen': model['docs_seen'] + len(docs)}
+
+    vocabulary = dict(vectorizer.vocabulary_)
+    analyzer = vectorizer.build_analyzer()
+    docFreq = Counter(term for doc in docs for term in set(analyzer(doc)))
+
+    newTerms = [term for term, count in docFreq.most_common() if (count >= min_count and term not in vocabulary)][:max_new_terms]
+    if (len(newTerms) > 0):
+        free = [vocabulary[term] for term in vocabulary if term.startswith(FREE_SLOT)]
+        if (len(free) < len(newTerms)):
+            # Evict the weakest terms the batch does not use
+            inBatch = set(vocabulary[term] for term in docFreq if (term in vocabulary))
+            weights = lda.components_.sum(axis=0)
+            evictable = [j for j in np.argsort(weights) if (j not in inBatch and j not in free)]
+            free += evictable[:len(newTerms) - len(free)]
+        slots = free[:len(newTerms)]
+
+        columns = {j: term for term, j in vocabulary.items()}
+        for term, j in zip(newTerms, slots):
+            del vocabulary[columns[j]]
+            vocabulary[term] = j
+
+        # New terms start from the prior, as if never seen
+        components = lda.components_.copy()
+        components[:, slots] = lda.topic_word_prior_
+        _set_components(lda, components)
+
+        vectorizer = clone(vectorizer).set_params(vocabulary=vocabulary)
+        vectorizer.fit([])
+
+    lda.partial_fit(vectorizer.transform(docs))
+
+    return {**build_corpus_model(vectorizer, lda), 'version': model['version'] + 1, 'docs_seen': model['docs_seen'] + len(docs)}
+
+def save_model_snapshot(model, directory, keep=5):
+    '''
+    Function to save an online model as a versioned snapshot, and point LATEST at it; only the last keep snapshots are kept
+
+    Args:
+        model (dict): online model
+        directory (str): directory of snapshots
+        keep (int): no. of snapshots kept
+
+    Returns:
+        str: returns the file path of the snapshot
+    '''
+    if (not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    filename = f"corpus_lda-v{model['version']:06d}.joblib"
+    save_corpus_model(model, os.path.join(directory, filename))
+
+    # Readers only ever see a complete snapshot: LATEST is replaced atomically once the snapshot is written
+    latestPath = os.path.join(directory, 'LATEST')
+    with open(f'{latestPath}.tmp', 'w') as f:
+        f.write(filename)
+    os.replace(f'{latestPath}.tmp', latestPath)
+
+    snapshots = sorted([name for name in os.listdir(directory) if (name.startswith('corpus_lda-v') and name.endswith('.joblib'))])
+    for name in snapshots[:-keep]:
+        os.remove(os.path.join(directory, name))
+
+    return os.path.join(directory, filename)
+
+def load_model_snapshot(directory):
+    '''
+    Function to load the latest snapshot saved by save_model_snapshot()
+
+    Args:
+        directory (str): directory of snapshots
+
+    Returns:
+        dict: returns the online model; None if no snapshot has been saved
+    '''
+    latestPath = os.path.join(directory, 'LATEST')
+    if (not os.path.exists(latestPath)):
+        return None
+
+    with open(latestPath, 'r') as f:
+        return load_corpus_model(os.path.join(directory, f.read().strip()))
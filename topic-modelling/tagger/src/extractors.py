@@ -0,0 +1,132 @@
+# Fast, deterministic alternatives to LDA for extracting tags from a single document.
+# With n_components=1, the top words of perform_LDA in tagger.py are essentially the document's highest-count terms,
+# so ranking terms by count (or by tf-idf against a corpus IDF table) gives similar tags without fitting a model
+
+# Imports
+from sklearn.feature_extraction.text import CountVectorizer
+
+from collections import Counter
+import os
+import math
+import heapq
+import joblib
+
+# Same tokenisation and stopwords as the CountVectorizer used by perform_LDA, built once
+_analyzer = CountVectorizer(stop_words='english').build_analyzer()
+
+# Function Definitions
+def top_terms(scores, top_words):
+    '''
+    Function to rank terms by score, breaking ties alphabetically so results are deterministic
+
+    Args:
+        scores (dict): term -> score
+        top_words (int): number of top words to return
+
+    Returns:
+        list: returns list of the top terms
+    '''
+    return [term for term, score in heapq.nsmallest(top_words, scores.items(), key=lambda kv: (-kv[1], kv[0]))]
+
+def perform_counts(doc, top_words):
+    '''
+    Function to tag a document with its highest-count terms
+
+    Args:
+        doc (str): document (preprocessed) to tag
+        top_words (int): number of top words to display
+
+    Returns:
+        list: returns list of lists of tags extracted, in the same format as perform_LDA()
+    '''
+    return [top_terms(Counter(_analyzer(doc)), top_words)]
+
+def build_idf_table(docs):
+    '''
+    Function to compute the inverse document frequency of each term over a corpus;
+    uses the same smoothed idf as sk-learn's TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+
+    Args:
+        docs (list): list of preprocessed document strings
+
+    Returns:
+        dict: returns the IDF table; 'idf' maps term -> idf, 'default' is the idf of terms unseen in the corpus
+    '''
+    df = Counter()
+    for doc in docs:
+        df.update(set(_analyzer(doc)))
+
+    n = len(docs)
+    return {
+        'idf': {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()},
+        'default': math.log(1 + n) + 1,
+        'n_docs': n
+    }
+
+def save_idf_table(idf_table, path):
+    '''
+    Function to save an IDF table to disk
+
+    Args:
+        idf_table (dict): IDF table returned by build_idf_table()
+        path (str): file path to save to
+    '''
+    dirname = os.path.dirname(path)
+    if (dirname and not os.path.exists(dirname)):
+        os.makedirs(dirname)
+
+    joblib.dump(idf_table, path)
+
+def load_idf_table(path):
+    '''
+    Function to load an IDF table saved by save_idf_table()
+
+    Args:
+        path (str): file path of saved IDF table
+
+    Returns:
+        dict: returns the IDF table
+    '''
+    return joblib.load(path)
+
+def perform_tfidf(doc, idf_table, top_words):
+    '''
+    Function to tag a document with its highest tf-idf terms
+
+    Args:
+        doc (str): document (preprocessed) to tag
+        idf_table (dict): IDF table returned by build_idf_table() or load_idf_table()
+        top_words (int): number of top words to display
+
+    Returns:
+        list: returns list of lists of tags extracted, in the same format as perform_LDA()
+    '''
+    idf = idf_table['idf']
+    default = idf_table['default']
+    scores = {term: count * idf.get(term, default) for term, count in Counter(_analyzer(doc)).items()}
+
+    return [top_terms(scores, top_words)]
+
+def tag_agreement(reference, candidate):
+    '''
+    Function to measure how closely one set of tags matches another, e.g. a fast backend against perform_LDA()
+
+    Args:
+        reference (list): list of tag lists, one per document
+        candidate (list): list of tag lists, one per document, in the same order
+
+    Returns:
+        dict: returns 'exact' (fraction of documents with identical tag sets) and 'overlap' (mean fraction of reference tags found)
+    '''
+    exact = 0
+    overlap = 0
+    for ref, cand in zip(reference, candidate):
+        ref, cand = set(ref), set(cand)
+        exact += (ref == cand)
+        overlap += len(ref & cand) / len(ref) if (len(ref) > 0) else (len(cand) == 0)
+
+    n = max(len(reference), 1)
+    return {
+        'exact': exact / n,
+        'overlap': overlap / n
+    }
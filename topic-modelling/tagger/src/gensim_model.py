@@ -0,0 +1,115 @@
+# Inference with the gensim LDA model saved in topic-modelling/lda (lda_model, with its .state, .expElogbeta.npy and
+# .id2word files). The model's large arrays are opened memory-mapped and read-only, so every worker process of the
+# TaggerPool shares one copy of them in the page cache instead of loading its own; the model pickles as its path only,
+# and each worker re-opens it on unpickling
+
+# Imports
+from gensim.models import LdaModel
+from gensim.utils import simple_preprocess
+
+import scipy.sparse as sp
+import numpy as np
+import glob
+import os
+
+from corpus_model import top_k_per_row
+
+# Class Definitions
+class GensimLDA:
+    '''
+    Read-only gensim LDA model, opened memory-mapped, with batched inference
+
+    The normalised topic-word matrix p(word | topic) is not saved by gensim as an array of its own (it is derived from
+    the pickled training state), so it is computed once and saved alongside the model as <path>.topic_word.npy, then
+    memory-mapped like expElogbeta. The training state is dropped once loaded, as inference does not use it.
+
+    Args:
+        path (str): file path of the saved gensim model
+        mmap (str): numpy mmap mode of the model's arrays; None loads them into memory
+
+    Attributes:
+        lda (LdaModel): the gensim model
+        topic_word (np.ndarray): p(word | topic), of shape (no. of topics, no. of words)
+    '''
+    def __init__(self, path, mmap='r'):
+        self.path = path
+        self.mmap = mmap
+        self._load()
+
+    def _load(self):
+        self.lda = LdaModel.load(self.path, mmap=self.mmap)
+
+        topicWordPath = f'{self.path}.topic_word.npy'
+        if (not os.path.exists(topicWordPath)):
+            # Written to a temporary file first, so that workers loading concurrently never map a partial file
+            tmpPath = f'{self.path}.topic_word.{os.getpid()}.tmp.npy'
+            np.save(tmpPath, self.lda.get_topics().astype(np.float32))
+            os.replace(tmpPath, topicWordPath)
+        self.topic_word = np.load(topicWordPath, mmap_mode=self.mmap)
+        self.lda.state = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'mmap': self.mmap}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load()
+
+    def files(self):
+        '''
+        Returns:
+            list: returns the paths of the files the model was saved as: the model itself, and the .state, .id2word and
+                  array files gensim saves alongside it; not the topic-word matrix derived from them
+        '''
+        derived = f'{self.path}.topic_word.'
+        return [self.path] + sorted(path for path in glob.glob(f'{glob.escape(self.path)}.*') if not (path.startswith(derived)))
+
+    def tokenize(self, doc):
+        '''
+        Returns:
+            list: returns the tokens of a raw document, as the model was trained on (gensim's simple_preprocess)
+        '''
+        return simple_preprocess(doc, deacc=True)
+
+    def infer_topics(self, docs, top_words=10):
+        '''
+        Infer the topic distribution of a batch of documents, and the top words of each
+
+        Topic distributions come from one pass of gensim's variational inference over the whole batch. Words of a
+        document are ranked by p(word | document) = sum over topics of p(topic | document) * p(word | topic), as for
+        the corpus model (see infer_corpus_LDA() in corpus_model.py).
+
+        Args:
+            docs (list): list of documents, each a list of tokens or a raw string (tokenized with tokenize())
+            top_words (int): no. of top words per document; 0 skips top word extraction
+
+        Returns:
+            tuple: returns the topic distribution of each document as an np.ndarray of shape (no. of documents, no. of
+                   topics), and a list of lists of the top words of each document
+        '''
+        bows = [self.lda.id2word.doc2bow(self.tokenize(doc) if (isinstance(doc, str)) else doc) for doc in docs]
+        if (len(bows) < 1):
+            return np.zeros((0, self.lda.num_topics)), []
+
+        gamma, _ = self.lda.inference(bows)
+        doc_topic = gamma / gamma.sum(axis=1)[:, np.newaxis]
+
+        # Every word of every document is scored at once, over the stored entries of the batch's term count matrix
+        lengths = [len(bow) for bow in bows]
+        counts = [count for bow in bows for _, count in bow]
+        word_ids = [word_id for bow in bows for word_id, _ in bow]
+        tf = sp.csr_matrix((counts, word_ids, np.concatenate([[0], np.cumsum(lengths)])), shape=(len(bows), self.topic_word.shape[1]))
+        rows = np.repeat(np.arange(len(bows)), lengths)
+        scores = (doc_topic[rows] * self.topic_word[:, tf.indices].T).sum(axis=1)
+
+        tags = [[self.lda.id2word[int(word_id)] for word_id in row if (word_id >= 0)] for row in top_k_per_row(tf, scores, top_words)]
+
+        return doc_topic, tags
+
+    def topic_words(self, topic, top_words=10):
+        '''
+        Returns:
+            list: returns the top words of a topic, by p(word | topic)
+        '''
+        top = np.argsort(self.topic_word[topic])[:-top_words - 1:-1]
+        return [self.lda.id2word[int(word_id)] for word_id in top]
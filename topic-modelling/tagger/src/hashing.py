@@ -0,0 +1,129 @@
+# Bounded-vocabulary vectorization: terms are hashed into a fixed no. of features instead of being looked up in a
+# vocabulary dict, so the memory of the vocabulary stays fixed however many distinct terms are fitted. A reverse index
+# keeps, for every feature, the most frequent term hashed to it, so that features can still be turned back into readable
+# tags. The term counts returned still grow with the no. of documents; fit out of core with partial_fit() to bound those
+
+# Imports
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.utils import murmurhash3_32
+
+from collections import Counter
+from itertools import islice
+import scipy.sparse as sp
+import numpy as np
+
+# Function Definitions
+def _identity(tokens):
+    # Documents are analysed once up front, so the hashing vectorizer is handed token lists as is
+    return tokens
+
+# Class Definitions
+class HashedCountVectorizer:
+    '''
+    Drop-in replacement for the CountVectorizer of the corpus model: term counts over a fixed feature space
+
+    Features are the absolute murmurhash3 of each term modulo n_features, as in sk-learn's HashingVectorizer.
+    The reverse index holds one term and one count per feature: when several terms collide, a weighted majority vote
+    keeps the one seen most often (exactly, if it makes up the majority of the feature's occurrences).
+
+    Args:
+        n_features (int): no. of features; more features mean fewer collisions but larger models
+        stop_words (str/list): stopwords dropped by the analyzer, as per CountVectorizer
+        chunk_size (int): no. of documents analysed at a time by fit_transform() and transform(), which accept iterators,
+                          so only one chunk of token lists is ever held in memory; the term counts they return are of
+                          every document, in one matrix
+
+    Attributes:
+        terms (list): feature -> term kept by the reverse index; None for features never seen
+        counts (np.ndarray): feature -> vote count of that term
+    '''
+    def __init__(self, n_features=2**16, stop_words='english', chunk_size=10000):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.chunk_size = chunk_size
+        self.terms = [None] * n_features
+        self.counts = np.zeros(n_features, dtype=np.int64)
+        self._analyzer = CountVectorizer(stop_words=stop_words).build_analyzer()
+        self._hasher = HashingVectorizer(n_features=n_features, analyzer=_identity, alternate_sign=False, norm=None)
+
+    def build_analyzer(self):
+        return self._analyzer
+
+    def feature(self, term):
+        '''
+        Returns:
+            int: returns the feature a term is hashed to
+        '''
+        return abs(murmurhash3_32(term, positive=False)) % self.n_features
+
+    def partial_fit(self, docs):
+        '''
+        Update the reverse index with a batch of documents
+
+        Args:
+            docs (list): list of document strings
+
+        Returns:
+            scipy.sparse.csr_matrix: returns the term counts of the batch, as per transform()
+        '''
+        tokens = [self._analyzer(doc) for doc in docs]
+
+        for term, count in Counter(token for doc in tokens for token in doc).items():
+            j = self.feature(term)
+            if (self.terms[j] == term):
+                self.counts[j] += count
+            elif (self.counts[j] >= count):
+                self.counts[j] -= count
+            else:
+                self.terms[j] = term
+                self.counts[j] = count - self.counts[j]
+
+        return self._hasher.transform(tokens)
+
+    def _chunks(self, docs):
+        docs = iter(docs)
+        chunk = list(islice(docs, self.chunk_size))
+        while (len(chunk) > 0):
+            yield chunk
+            chunk = list(islice(docs, self.chunk_size))
+
+    def fit_transform(self, docs, y=None):
+        return sp.vstack([self.partial_fit(chunk) for chunk in self._chunks(docs)] or [sp.csr_matrix((0, self.n_features))], format='csr')
+
+    def fit(self, docs, y=None):
+        for chunk in self._chunks(docs):
+            self.partial_fit(chunk)
+        return self
+
+    def transform(self, docs):
+        '''
+        Args:
+            docs (list): list (or iterator) of document strings
+
+        Returns:
+            scipy.sparse.csr_matrix: returns term counts, of shape (no. of documents, n_features)
+        '''
+        return sp.vstack([self._hasher.transform([self._analyzer(doc) for doc in chunk]) for chunk in self._chunks(docs)] or [sp.csr_matrix((0, self.n_features))], format='csr')
+
+    def get_feature_names(self):
+        '''
+        Returns:
+            np.ndarray: returns the term of each feature as per the reverse index; '' for features never seen
+        '''
+        return np.array([term if (term is not None) else '' for term in self.terms], dtype=object)
+
+    def lookup(self, features, doc=None):
+        '''
+        Args:
+            features (list): list of features
+            doc (str): if given, features are named after the document's own (most frequent) term hashed to them, so that
+                       a collision never names a term the document does not contain; the reverse index names the rest
+
+        Returns:
+            list: returns the term of each feature
+        '''
+        local = {}
+        if (doc is not None):
+            for term, _ in Counter(self._analyzer(doc)).most_common()[::-1]:
+                local[self.feature(term)] = term
+        return [local.get(j) or self.terms[j] or '' for j in features]
@@ -0,0 +1,256 @@
+# Coordination of tagger instances sharing an index: the index is split into N slices (see scroll_documents() in
+# tagger.py), and each instance claims a slice at a time through a lease document in a small lease index. Leases are
+# renewed by a heartbeat while the slice is tagged; if an instance crashes, its lease expires and the slice is claimed
+# by another instance, which only has the documents still untagged left to tag. Claims use optimistic concurrency
+# (document versions), so two instances can never hold the same slice. A slice is only marked finished once the writer
+# has acknowledged every document fetched from it, so a crash while its last pages are in flight leaves it to be claimed
+
+# Imports
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+import threading
+import socket
+import time
+import os
+
+# Class Definitions
+class SliceLeases:
+    '''
+    Leases over the slices of an index, stored as one document per slice in leaseIndex
+
+    A slice is claimable if it has no lease, if its lease has expired without the slice being finished, or if it was
+    finished before this instance started (i.e. on a previous night)
+
+    Args:
+        es (obj): elasticsearch object reference
+        leaseIndex (str): index holding the lease documents; created on first use
+        slices (int): no. of slices the index is split into
+        rootLogger (obj): reference of rootLogger object
+        ttl (int): seconds a lease lasts without being renewed
+        owner (str): name of this instance; defaults to <hostname>-<pid>
+
+    Attributes:
+        lost (threading.Event): set if the lease of the slice being tagged could not be renewed, i.e. it expired and may
+                                have been claimed by another instance
+        unwritten (set): _ids of the documents fetched from the slice held which the writer has not acknowledged yet
+    '''
+    def __init__(self, es, leaseIndex, slices, rootLogger, ttl=300, owner=None):
+        self.es = es
+        self.leaseIndex = leaseIndex
+        self.slices = slices
+        self.rootLogger = rootLogger
+        self.ttl = ttl
+        self.owner = owner or f'{socket.gethostname()}-{os.getpid()}'
+        self.started = time.time()
+        self.held = None # [slice_id, version] of the lease held
+        self.lost = threading.Event()
+        self.lock = threading.Lock()
+        self.unwritten = set()
+        self.written = threading.Condition(threading.Lock()) # notified whenever unwritten empties
+        self._heartbeat = None
+
+    def _lease_id(self, slice_id):
+        # The no. of slices is part of the id, so instances configured with a different no. of slices never collide
+        return f'slice-{slice_id}-of-{self.slices}'
+
+    def _lease(self, slice_id, done=False):
+        now = time.time()
+        return {
+            'owner': self.owner,
+            'slice': slice_id,
+            'slices': self.slices,
+            'expires': now + self.ttl,
+            'done': done,
+            'doneAt': now if (done) else None
+        }
+
+    def _claimable(self, lease):
+        if (lease['done']):
+            return lease['doneAt'] < self.started
+        return lease['expires'] < time.time()
+
+    def _try_claim(self, slice_id):
+        '''
+        Returns:
+            int: returns version of the lease if claimed; None if the slice is held by another instance or finished
+        '''
+        leaseId = self._lease_id(slice_id)
+        try:
+            current = self.es.get(index=self.leaseIndex, doc_type='_doc', id=leaseId)
+        except NotFoundError:
+            current = None
+
+        try:
+            if (current is None):
+                res = self.es.index(index=self.leaseIndex, doc_type='_doc', id=leaseId, body=self._lease(slice_id), op_type='create', refresh='wait_for')
+            elif (self._claimable(current['_source'])):
+                if (not current['_source']['done']):
+                    self.rootLogger.warning(f"Lease of slice {slice_id} held by {current['_source']['owner']} expired; taking over slice")
+                res = self.es.index(index=self.leaseIndex, doc_type='_doc', id=leaseId, body=self._lease(slice_id), version=current['_version'], refresh='wait_for')
+            else:
+                return None
+        except ConflictError: # another instance claimed it first
+            return None
+
+        return res['_version']
+
+    def claim(self):
+        '''
+        Claim the first claimable slice, and start renewing its lease in the background
+
+        Returns:
+            int: returns the slice claimed; None if every slice is held by another instance or finished
+        '''
+        for slice_id in range(self.slices):
+            version = self._try_claim(slice_id)
+            if (version is not None):
+                with self.lock:
+                    self.held = [slice_id, version]
+                with self.written:
+                    self.unwritten.clear()
+                self.lost.clear()
+                self._start_heartbeat()
+                self.rootLogger.info(f'{self.owner} claimed slice {slice_id} of {self.slices}')
+                return slice_id
+
+        return None
+
+    def renew(self):
+        '''
+        Extend the lease held; sets lost if it can no longer be renewed because another instance took it over
+
+        Returns:
+            bool: returns True if renewed
+        '''
+        with self.lock:
+            if (self.held is None):
+                return False
+            slice_id, version = self.held
+            try:
+                res = self.es.index(index=self.leaseIndex, doc_type='_doc', id=self._lease_id(slice_id), body=self._lease(slice_id), version=version)
+                self.held[1] = res['_version']
+                return True
+            except ConflictError:
+                self.rootLogger.error(f'Lost lease of slice {slice_id}; it was taken over by another instance')
+                self.held = None
+                self.lost.set()
+                return False
+
+    def fetched(self, ids):
+        '''
+        Record documents fetched from the slice held, to be acknowledged by the writer
+        '''
+        with self.written:
+            self.unwritten.update(ids)
+
+    def acknowledge(self, ids):
+        '''
+        Record documents the writer has finished with (written, or failed and left for a later run)
+        '''
+        with self.written:
+            self.unwritten.difference_update(ids)
+            if (len(self.unwritten) < 1):
+                self.written.notify_all()
+
+    def wait_written(self, timeout):
+        '''
+        Wait for the writer to acknowledge every document fetched from the slice held; the lease is renewed meanwhile
+
+        Returns:
+            bool: returns True if they were all acknowledged; False if the lease was lost or timeout seconds passed first
+        '''
+        deadline = time.time() + timeout
+        with self.written:
+            while (len(self.unwritten) > 0 and not self.lost.is_set() and time.time() < deadline):
+                self.written.wait(min(1, max(0, deadline - time.time())))
+            return (len(self.unwritten) < 1 and not self.lost.is_set())
+
+    def release(self, done=True):
+        '''
+        Stop renewing the lease held, and mark the slice finished, or free it for another instance to claim now
+        '''
+        self._stop_heartbeat()
+        with self.lock:
+            if (self.held is None):
+                return
+            slice_id, version = self.held
+            self.held = None
+
+            body = self._lease(slice_id, done)
+            if (not done):
+                body['expires'] = 0
+            try:
+                self.es.index(index=self.leaseIndex, doc_type='_doc', id=self._lease_id(slice_id), body=body, version=version, refresh='wait_for')
+            except ConflictError:
+                self.rootLogger.error(f'Lost lease of slice {slice_id} before it could be released')
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat()
+        stop = threading.Event()
+        def run():
+            # Renew well before expiry, so a slow ES round trip or two does not lose the lease
+            while (not stop.wait(self.ttl / 3)):
+                try:
+                    if (not self.renew()):
+                        return
+                except Exception:
+                    self.rootLogger.exception('Failed to renew lease; retrying')
+        thread = threading.Thread(target=run, name='lease-heartbeat', daemon=True)
+        self._heartbeat = (stop, thread)
+        thread.start()
+
+    def _stop_heartbeat(self):
+        if (self._heartbeat is not None):
+            stop, thread = self._heartbeat
+            stop.set()
+            if (thread is not threading.current_thread()):
+                thread.join()
+            self._heartbeat = None
+
+# Function Definitions
+def leased_batches(leases, scan, rootLogger, write_timeout=600):
+    '''
+    Generator claiming slices one after another and streaming each. Once the last page of a slice has been consumed,
+    the next slice is only claimed after the writer has acknowledged every document of the slice (see
+    SliceLeases.acknowledge()), which marks it finished; with a pipeline, the pages still being tagged and written are
+    drained first. A consumer that never acknowledges leaves each slice unfinished after write_timeout seconds.
+
+    Args:
+        leases (SliceLeases): leases over the slices
+        scan (function): takes a slice id and returns an iterator of batches of that slice (see scroll_documents() in tagger.py)
+        rootLogger (obj): reference of rootLogger object
+        write_timeout (int): max seconds to wait for the writer to acknowledge the last pages of a slice; the slice is
+                             released unfinished, for any instance to claim again, if they are not acknowledged by then
+
+    Yields:
+        list: batches of every slice claimed, in the same form as msearch_documents() in tagger.py
+    '''
+    while (True):
+        slice_id = leases.claim()
+        if (slice_id is None):
+            rootLogger.info('No slices left to claim')
+            return
+
+        batches = scan(slice_id)
+        finished = False
+        try:
+            for batch in batches:
+                if (leases.lost.is_set()): # another instance has the slice now; leave the rest of it to them
+                    break
+                leases.fetched([hit['_id'] for res in batch for hit in res['hits']['hits']])
+                yield batch
+            else:
+                if (hasattr(batches, 'close')): # free the scroll now rather than after waiting
+                    batches.close()
+                # The last pages may still be being tagged and written; if this instance crashed before they were, the
+                # slice must not have been marked finished
+                finished = leases.wait_written(write_timeout)
+                if (not finished and not leases.lost.is_set()):
+                    rootLogger.error(f'Last pages of slice {slice_id} were not written within {write_timeout}s; releasing it unfinished')
+        finally:
+            if (hasattr(batches, 'close')): # ends the scroll of a generator like scroll_documents()
+                batches.close()
+            # Free the slice for another instance right away if this one stops early (e.g. work hours started)
+            leases.release(done=finished)
+        if (finished):
+            rootLogger.info(f'Finished slice {slice_id}')
@@ -0,0 +1,214 @@
+# Metrics of the tagger: latency histograms of each stage (fetch, preprocess, tag extraction, bulk writing), document
+# counters and live gauges (queue depths, cache hit rate), exported in the Prometheus text format over a local HTTP
+# endpoint, and/or dumped periodically to a JSON file, so that a run can be watched without parsing the logs
+
+# Imports
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+import threading
+import bisect
+import json
+import time
+import os
+
+# Upper bounds (seconds) of the latency histogram buckets; from a few ms (cached / counts backend) to minutes (LDA, bulk retries)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Class Definitions
+class Histogram:
+    '''
+    Cumulative histogram of observed values, as per Prometheus histograms
+
+    Args:
+        buckets (tuple): ascending upper bounds of the buckets; an implicit +Inf bucket holds every observation
+    '''
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # per bucket, not cumulative; last is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        '''
+        Returns:
+            list: returns (upper bound, no. of observations <= upper bound) for each bucket, ending with +Inf
+        '''
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        '''
+        Estimate a quantile as the upper bound of the bucket it falls in
+
+        Returns:
+            float: returns the estimate; None if nothing has been observed
+        '''
+        if (self.count < 1):
+            return None
+        for bound, total in self.cumulative():
+            if (total >= q * self.count):
+                return bound
+
+class Metrics:
+    '''
+    Registry of the tagger's metrics; safe to update from the pipeline threads
+
+    Metrics are created on first use, so callers only record what applies to their mode (e.g. queue depths only
+    exist when pipelining). Names follow Prometheus conventions: histograms in seconds, counters ending in _total.
+
+    Args:
+        prefix (str): prefix of every metric name when exported
+    '''
+    def __init__(self, prefix='tagger'):
+        self.prefix = prefix
+        self.start = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self.lock:
+            if (name not in self.histograms):
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def time(self, name):
+        '''
+        Context manager observing the seconds taken by its block in histogram name
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, fn):
+        '''
+        Register a gauge, whose value is read by calling fn whenever metrics are exported
+
+        Args:
+            name (str): gauge name
+            fn (function): takes no arguments and returns a number
+        '''
+        with self.lock:
+            self.gauges[name] = fn
+
+    def docs_per_sec(self):
+        elapsed = time.time() - self.start
+        return self.counters.get('docs_written_total', 0) / elapsed if (elapsed > 0) else 0.0
+
+    def to_dict(self):
+        '''
+        Snapshot of every metric
+
+        Returns:
+            dict: returns uptime, docs/sec, counters, gauges, and count, sum, mean, p50 and p95 of each histogram
+        '''
+        with self.lock:
+            return {
+                'timestamp': round(time.time()),
+                'uptime_seconds': time.time() - self.start,
+                'docs_per_second': self.docs_per_sec(),
+                'counters': dict(self.counters),
+                'gauges': {name: fn() for name, fn in self.gauges.items()},
+                'histograms': {name: {
+                    'count': h.count,
+                    'sum': h.sum,
+                    'mean': h.sum / h.count if (h.count > 0) else None,
+                    'p50': h.quantile(0.5),
+                    'p95': h.quantile(0.95)
+                } for name, h in self.histograms.items()}
+            }
+
+    def to_prometheus(self):
+        '''
+        Render every metric in the Prometheus text exposition format
+
+        Returns:
+            str: returns the metrics page
+        '''
+        lines = []
+        with self.lock:
+            for name, h in sorted(self.histograms.items()):
+                name = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {name} histogram')
+                for bound, total in h.cumulative():
+                    le = '+Inf' if (bound == float('inf')) else repr(float(bound))
+                    lines.append(f'{name}_bucket{{le="{le}"}} {total}')
+                lines.append(f'{name}_sum {h.sum}')
+                lines.append(f'{name}_count {h.count}')
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE {self.prefix}_{name} counter')
+                lines.append(f'{self.prefix}_{name} {value}')
+
+            gauges = dict(self.gauges, docs_per_second=self.docs_per_sec)
+            for name, fn in sorted(gauges.items()):
+                lines.append(f'# TYPE {self.prefix}_{name} gauge')
+                lines.append(f'{self.prefix}_{name} {float(fn())}')
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        '''
+        Serve the metrics in the Prometheus format at http://host:port/metrics from a daemon thread
+
+        Returns:
+            obj: returns the HTTP server; call shutdown() on it to stop serving
+        '''
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if (self.path.split('?')[0] not in ['/', '/metrics']):
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # scrapes would otherwise be printed to stderr
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+    def dump(self, path):
+        '''
+        Write a snapshot of the metrics to a JSON file; the file is replaced atomically so readers never see a partial dump
+        '''
+        tmpPath = f'{path}.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmpPath, path)
+
+    def dump_every(self, path, interval):
+        '''
+        Dump the metrics to a JSON file every interval seconds from a daemon thread
+
+        Returns:
+            obj: returns a threading.Event; set it to stop dumping
+        '''
+        stop = threading.Event()
+        def run():
+            while (not stop.wait(interval)):
+                self.dump(path)
+        threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+        return stop
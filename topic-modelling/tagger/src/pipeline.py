@@ -0,0 +1,205 @@
+# Pipelined tagging: the fetch -> tag -> write stages of the tagger each run on their own thread, connected by bounded
+# queues. The network I/O of fetching and bulk writing overlaps with tagging, and a slow stage holds back the stages
+# before it (backpressure) instead of letting batches pile up in memory
+
+# Imports
+import threading
+import queue
+import time
+
+# Marks the end of the batches flowing through the queues
+_DONE = object()
+
+# Function Definitions
+def count_docs(res_responses):
+    '''
+    Function to count the documents in a batch of ES _search results
+
+    Args:
+        res_responses (list): responses as yielded by msearch_documents() or stream_documents() in tagger.py
+
+    Returns:
+        int: returns no. of documents
+    '''
+    return sum([len(res['hits']['hits']) for res in res_responses])
+
+class StageStats:
+    '''
+    Throughput counters of a pipeline stage
+
+    busy is the time spent doing the stage's work; waiting is the time spent blocked on the queues, either for input
+    from the stage before or for room in the queue to the stage after
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.batches = 0
+        self.docs = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def docs_per_sec(self):
+        return self.docs / self.busy if (self.busy > 0) else 0.0
+
+    def __str__(self):
+        return f'{self.name}: {self.docs} docs in {self.batches} batches; busy {self.busy:.1f}s ({self.docs_per_sec():.1f} docs/s), waiting {self.waiting:.1f}s'
+
+class TaggingPipeline:
+    '''
+    Runs the fetch, tag and write stages concurrently, each on its own thread
+
+    Args:
+        fetch (iterator): yields batches of ES _search results (see msearch_documents() and stream_documents() in tagger.py);
+                          fetching stops at the first empty batch
+        tag (function): takes a batch and returns the list of update actions for it (see get_actions() in tagger.py)
+        write (function): takes a list of update actions and writes them to ES
+        rootLogger (obj): reference of rootLogger object
+        queue_size (int): max no. of batches waiting between two stages
+        should_stop (function): checked before fetching each batch; if it returns True, no more batches are fetched and
+                                the batches already fetched are tagged and written before run() returns
+        report_interval (int): seconds between logging the progress of each stage
+        metrics (Metrics): optional metrics registry to record fetch latencies, fetched document counts and queue depths in
+    '''
+    def __init__(self, fetch, tag, write, rootLogger, queue_size=2, should_stop=None, report_interval=60, metrics=None):
+        self.fetch = fetch
+        self.tag = tag
+        self.write = write
+        self.rootLogger = rootLogger
+        self.should_stop = should_stop
+        self.report_interval = report_interval
+
+        self.tag_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats(name) for name in ['fetch', 'tag', 'write']}
+
+        self.metrics = metrics
+        if (metrics is not None):
+            metrics.gauge('tag_queue_depth', self.tag_queue.qsize)
+            metrics.gauge('write_queue_depth', self.write_queue.qsize)
+
+        self.error = None
+        self.failed = threading.Event()
+
+    def _put(self, q, item, stats):
+        start = time.time()
+        while (not self.failed.is_set()):
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.waiting += time.time() - start
+
+    def _get(self, q, stats):
+        start = time.time()
+        while (not self.failed.is_set()):
+            try:
+                item = q.get(timeout=0.1)
+                stats.waiting += time.time() - start
+                return item
+            except queue.Empty:
+                continue
+        stats.waiting += time.time() - start
+        return _DONE
+
+    def _run_stage(self, stage):
+        try:
+            stage()
+        except BaseException as e:
+            # Stop every other stage; run() re-raises the first error
+            if (self.error is None):
+                self.error = e
+            self.failed.set()
+
+    def _fetch_stage(self):
+        stats = self.stats['fetch']
+        while (not self.failed.is_set()):
+            if (self.should_stop is not None and self.should_stop()):
+                self.rootLogger.info('Pipeline stopping: no more batches will be fetched; draining batches in flight...')
+                break
+
+            start = time.time()
+            batch = next(self.fetch, [])
+            numDocs = count_docs(batch)
+            stats.busy += time.time() - start
+            if (numDocs < 1):
+                break
+
+            if (self.metrics is not None):
+                self.metrics.observe('fetch_seconds', time.time() - start)
+                self.metrics.inc('docs_fetched_total', numDocs)
+
+            stats.batches += 1
+            stats.docs += numDocs
+            self._put(self.tag_queue, batch, stats)
+
+        self._put(self.tag_queue, _DONE, stats)
+
+    def _tag_stage(self):
+        stats = self.stats['tag']
+        while (True):
+            batch = self._get(self.tag_queue, stats)
+            if (batch is _DONE):
+                break
+
+            start = time.time()
+            actions = self.tag(batch)
+            stats.busy += time.time() - start
+            stats.batches += 1
+            stats.docs += count_docs(batch)
+
+            self._put(self.write_queue, actions, stats)
+
+        self._put(self.write_queue, _DONE, stats)
+
+    def _write_stage(self):
+        stats = self.stats['write']
+        while (True):
+            actions = self._get(self.write_queue, stats)
+            if (actions is _DONE):
+                break
+
+            start = time.time()
+            self.write(actions)
+            stats.busy += time.time() - start
+            stats.batches += 1
+            stats.docs += len(actions)
+
+    def report(self):
+        '''
+        Log the throughput of each stage and the no. of batches waiting in each queue
+        '''
+        for stats in self.stats.values():
+            self.rootLogger.info(str(stats))
+        self.rootLogger.info(f'Queue depths: fetch -> tag: {self.tag_queue.qsize()}, tag -> write: {self.write_queue.qsize()}')
+
+    def run(self):
+        '''
+        Run the pipeline until every batch has been fetched, tagged and written, or until should_stop() returns True
+        and the batches in flight have been drained
+
+        Returns:
+            dict: returns stage name -> StageStats
+        '''
+        threads = [threading.Thread(target=self._run_stage, args=(stage,), name=f'{name}-stage') for name, stage in
+                   [('fetch', self._fetch_stage), ('tag', self._tag_stage), ('write', self._write_stage)]]
+
+        start = time.time()
+        for thread in threads:
+            thread.start()
+
+        lastReport = time.time()
+        for thread in threads:
+            while (thread.is_alive()):
+                thread.join(timeout=1)
+                if (time.time() - lastReport >= self.report_interval):
+                    self.report()
+                    lastReport = time.time()
+        end = time.time()
+
+        self.report()
+        self.rootLogger.info(f"Pipeline finished: {self.stats['write'].docs} docs written in {end-start:.1f}s ({self.stats['write'].docs / max(end-start, 1e-9):.1f} docs/s end-to-end)")
+
+        if (self.error is not None):
+            raise self.error
+
+        return self.stats
@@ -0,0 +1,159 @@
+# Persistent cache of document tags, keyed by a hash of the document content together with everything that affects its
+# tags (LDA parameters, stopwords, backend, model). Re-tagging an unchanged document then costs one lookup
+
+# Imports
+import sqlite3
+import hashlib
+import threading
+import json
+import time
+import os
+
+# Function Definitions
+def hash_stop_words(stop_words):
+    '''
+    Function to fingerprint a set of stopwords, so that changing the stopwords invalidates cached tags
+
+    Args:
+        stop_words (frozenset): set of stopwords
+
+    Returns:
+        str: returns hex digest
+    '''
+    text = '\n'.join(sorted(stop_words))
+    # Phrases of a StopWords set (see tagger.py) change tags as much as single stopwords do
+    phrases = getattr(stop_words, 'phrases', None)
+    if (phrases):
+        text += '\n\n' + '\n'.join(' '.join(phrase) for phrase in sorted(phrases))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def hash_file(path):
+    '''
+    Function to fingerprint a file, e.g. a saved corpus model or IDF table
+
+    Args:
+        path (str): file path
+
+    Returns:
+        str: returns hex digest
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def hash_files(paths):
+    '''
+    Function to fingerprint several files together, e.g. a saved gensim model and the files saved alongside it
+
+    Args:
+        paths (list): file paths
+
+    Returns:
+        str: returns hex digest
+    '''
+    fingerprints = [[os.path.basename(path), hash_file(path)] for path in paths]
+
+    return hashlib.sha256(json.dumps(fingerprints).encode('utf-8')).hexdigest()
+
+class TagCache:
+    '''
+    SQLite-backed cache of tags; least recently used entries are evicted once it holds more than max_entries
+
+    Args:
+        path (str): file path of the SQLite database
+        params (dict): everything other than the content that affects tags, e.g. {'f': 1000, 'i': 1000, 'stopwords': hash};
+                       entries cached under different params are never returned
+        max_entries (int): max no. of documents cached
+
+    Attributes:
+        hits (int): no. of lookups found in the cache
+        misses (int): no. of lookups not found in the cache
+        count (int): no. of documents cached; counted once on opening, then kept up to date by put_many(), so that
+                     enforcing max_entries does not cost a scan of the table per batch
+    '''
+    def __init__(self, path, params, max_entries=1000000):
+        dirname = os.path.dirname(path)
+        if (dirname and not os.path.exists(dirname)):
+            os.makedirs(dirname)
+
+        self.params = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).digest()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # Connection may be used from the tag stage thread of the pipeline; the lock serialises access to it
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tags (key BLOB PRIMARY KEY, tags TEXT NOT NULL, lastUsed REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS tags_lastUsed ON tags (lastUsed)')
+        self.conn.commit()
+        self.count = self.conn.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def key(self, doc):
+        return hashlib.sha256(self.params + doc.encode('utf-8')).digest()
+
+    def get_many(self, docs):
+        '''
+        Look up the cached tags of a batch of documents
+
+        Args:
+            docs (list): list of raw document strings
+
+        Returns:
+            list: returns the cached tags of each document, in order; None for documents not in the cache
+        '''
+        keys = [self.key(doc) for doc in docs]
+
+        found = {}
+        with self.lock:
+            # SQLite limits the no. of parameters of a query, so look keys up in chunks
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self.conn.execute(f"SELECT key, tags FROM tags WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update((key, json.loads(tags)) for key, tags in rows)
+
+            now = time.time()
+            self.conn.executemany('UPDATE tags SET lastUsed = ? WHERE key = ?', [(now, key) for key in found])
+            self.conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, docs, batch_tags):
+        '''
+        Cache the tags of a batch of documents, then evict the least recently used entries if over max_entries
+
+        Args:
+            docs (list): list of raw document strings
+            batch_tags (list): tags of each document, in order; None entries are not cached
+        '''
+        now = time.time()
+        rows = {self.key(doc): (json.dumps(tags), now) for doc, tags in zip(docs, batch_tags) if (tags is not None)}
+        keys = list(rows)
+
+        with self.lock:
+            # Only keys not cached yet add to the count; looked up by primary key, in chunks as in get_many()
+            existing = 0
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                existing += self.conn.execute(f"SELECT COUNT(*) FROM tags WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchone()[0]
+            self.conn.executemany('INSERT OR REPLACE INTO tags (key, tags, lastUsed) VALUES (?, ?, ?)', [(key, tags, lastUsed) for key, (tags, lastUsed) in rows.items()])
+            self.count += len(keys) - existing
+
+            excess = self.count - self.max_entries
+            if (excess > 0):
+                self.conn.execute('DELETE FROM tags WHERE key IN (SELECT key FROM tags ORDER BY lastUsed LIMIT ?)', (excess,))
+                self.count -= excess
+            self.conn.commit()
+
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses) if (self.hits + self.misses > 0) else 0.0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -15,13 +15,19 @@ $o = [int](Get-Date -Date $retagTimestamp -UFormat %s -Millisecond 0) # Convert
 # Set path of conda environment's python.exe
 $pythonPath = $Env:pythonPath
 
+# Set no. of tagging worker processes
+$workers = if ($Env:workers) { $Env:workers } else { 1 }
+$metricsPort = if ($Env:metricsPort) { $Env:metricsPort } else { 0 }
+$stopwordsProfile = if ($Env:stopwordsProfile) { "--stopwords-profile $Env:stopwordsProfile" } else { "" }
+$adaptiveBatch = if ($Env:adaptiveBatch -eq "true") { "--adaptive-batch" } else { "" }
+
 # Set start and end of work hours for logging purposes
 $workEndPM = $Env:workEndHr - 12
 $workStartAM = $Env:workStartHr
 
 do {
     # Start Tagger
-    $exitCode = (Start-Process -FilePath $pythonPath -ArgumentList "tagger.py -o $o" -NoNewWindow -Wait -PassThru).ExitCode
+    $exitCode = (Start-Process -FilePath $pythonPath -ArgumentList "tagger.py -o $o -w $workers --metrics-port $metricsPort $stopwordsProfile $adaptiveBatch" -NoNewWindow -Wait -PassThru).ExitCode
 
     # Signify done
     Write-Host "`n==============================="
@@ -1,6 +1,5 @@
 # Imports
 from elasticsearch import Elasticsearch, ConnectionError, ElasticsearchException
-from elasticsearch.helpers import bulk
 from elasticsearch.client import IndicesClient
 
 from sklearn.decomposition import LatentDirichletAllocation
@@ -10,9 +9,27 @@ import sys, os
 import argparse
 import time
 import logging
+import struct
+import hashlib
+import atexit
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from nltk.tokenize import word_tokenize
-import re, string
+import re, string, json
+
+from corpus_model import train_corpus_LDA, save_corpus_model, load_corpus_model, perform_corpus_LDA, infer_corpus_LDA, make_online, update_corpus_model, save_model_snapshot, load_model_snapshot
+from pipeline import TaggingPipeline
+from async_tagger import AsyncTagger
+from leases import SliceLeases, leased_batches
+from checkpoint import Checkpoint
+from writer import BulkWriter
+from batch_controller import BatchController
+from tag_cache import TagCache, hash_stop_words, hash_file, hash_files
+from metrics import Metrics
+from extractors import perform_counts, build_idf_table, save_idf_table, load_idf_table, perform_tfidf, tag_agreement
 
 # Function Definitions
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -34,6 +51,19 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     # Uncaught exceptions
     rootLogger.critical("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
+def in_work_hours(workStartAM, workEndHr):
+    '''
+    Checks if the current time is within work hours, during which tagging should not run
+
+    Args:
+        workStartAM (int): Work starting HR - ranges from 0 - 24
+        workEndHr (int): Work ending HR - ranges from 0 - 24
+
+    Returns:
+        bool: returns True if within work hours
+    '''
+    return time.localtime().tm_hour in range(workStartAM, workEndHr)
+
 def check_time(workStartAM, workEndHr, rootLogger):
     '''
     Sanity-check: Check if tagger is executing during work hours; resume/defer tagging after work hours
@@ -47,11 +77,30 @@ def check_time(workStartAM, workEndHr, rootLogger):
     '''
     workEndPM = workEndHr - 12 # convert to 12hr format
 
-    if (time.localtime().tm_hour in range(workStartAM, workEndHr)):
+    if (in_work_hours(workStartAM, workEndHr)):
         rootLogger.error(f"It is past {workStartAM} AM. Tagging should only be resumed at {workEndPM} PM onwards.")
         sys.exit(5)
 
-def connectDB(esIndex, nodes, rootLogger):
+def handle_stop_signals(stop_requested, rootLogger):
+    '''
+    Function to make SIGINT and SIGTERM request a graceful stop: no more batches are fetched, and the batches in flight are
+    tagged and written before exiting. A second signal exits immediately.
+
+    Args:
+        stop_requested (threading.Event): set when a stop is requested
+        rootLogger (obj): reference of rootLogger object
+    '''
+    def handler(signum, frame):
+        if (stop_requested.is_set()):
+            rootLogger.error('Received a second stop signal; exiting without draining batches in flight')
+            os._exit(5) # pipeline threads would otherwise keep the process alive
+        rootLogger.warning(f'Received {signal.Signals(signum).name}; stopping once batches in flight are written...')
+        stop_requested.set()
+
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, handler)
+
+def connectDB(esIndex, nodes, rootLogger, maxsize=10):
     '''
     Function to connect to Elasticsearch DB. Uses default parameters.
 
@@ -59,11 +108,12 @@ def connectDB(esIndex, nodes, rootLogger):
         esIndex (str): Elasticsearch index of concern
         nodes (list): list of string values of node information; e.g. ['127.0.0.1:9200', '127.0.0.2:9200']
         rootLogger (obj): reference of rootLogger object
+        maxsize (int): max no. of connections kept open to each node; requests are spread across nodes round-robin
 
     Returns:
         obj: elasticsearch object reference
     '''
-    es = Elasticsearch([node for node in nodes])
+    es = Elasticsearch([node for node in nodes], maxsize=maxsize)
     try:
         # Get no. of documents
         numDocs = es.count(index=esIndex, body={"query": {"match_all": {}}})['count']
@@ -76,53 +126,226 @@ def connectDB(esIndex, nodes, rootLogger):
         rootLogger.error("Unexpected error:", sys.exc_info()[0])
         sys.exit(500)
 
+# Header of the compiled stopwords artifact written by stopwords/get-stopwords-master.py:
+# magic bytes, no. of stopwords, length of the stopwords blob, SHA-256 of the blob;
+# followed by the blob itself, which is the sorted stopwords joined by newlines and encoded in UTF-8
+STOPWORDS_MAGIC = b'STOPWRD1'
+STOPWORDS_HEADER = struct.Struct('<8sII32s')
+# Header of the compiled stopwords profiles written by stopwords/build-stopwords.py: magic bytes, no. of words, length of
+# the words blob, no. of phrases, length of the phrases blob, SHA-256 of both blobs; followed by the blobs, i.e. the sorted
+# words joined by newlines, then the sorted phrases (words joined by spaces) joined by newlines, encoded in UTF-8
+STOPWORDS_PROFILE_MAGIC = b'STOPWRD2'
+STOPWORDS_PROFILE_HEADER = struct.Struct('<8sIIII32s')
+
+class StopWords(frozenset):
+    '''
+    Set of stopwords, along with phrases: sequences of words removed only when they occur together, e.g. 'are nt', as
+    NLTK's word_tokenize splits "aren't"
+
+    Each phrase is indexed by its first word which is not a stopword (phrases made only of stopwords are removed word by
+    word anyway), so that matching costs one hash lookup per token, and a phrase is only compared where such a
+    comparatively rare word occurs.
+
+    Args:
+        words (iterable): stopwords
+        phrases (iterable): phrases, as tuples of words
+
+    Attributes:
+        phrases (tuple): the phrases, sorted
+    '''
+    def __new__(cls, words, phrases=()):
+        self = super().__new__(cls, words)
+        self.phrases = tuple(sorted(set(phrases)))
+        self._anchors = {}
+        for phrase in sorted(self.phrases, key=len, reverse=True):
+            offset = next((k for k, w in enumerate(phrase) if (w not in self)), None)
+            if (offset is not None):
+                self._anchors.setdefault(phrase[offset], []).append((offset, phrase))
+        return self
+
+    def __reduce__(self):
+        return (StopWords, (frozenset(self), self.phrases))
+
+    def remove_phrases(self, tokens):
+        '''
+        Returns:
+            list: returns the tokens, less every occurrence of a phrase (the longest, where phrases overlap)
+        '''
+        matches = []
+        for i in [i for i, w in enumerate(tokens) if (w in self._anchors)]:
+            for offset, phrase in self._anchors[tokens[i]]:
+                start = i - offset
+                if (start >= 0 and tuple(tokens[start:start + len(phrase)]) == phrase):
+                    matches.append((start, start + len(phrase)))
+                    break
+        if (len(matches) < 1):
+            return tokens
+
+        kept, end = [], 0
+        for start, stop in sorted(matches):
+            if (start < end): # overlaps the phrase just removed
+                continue
+            kept += tokens[end:start]
+            end = stop
+        kept += tokens[end:]
+        return kept
+
 def load_stop_words(path):
     '''
-    Function to load stopwords into a list. 
+    Function to load stopwords into a frozenset, so that checking a word against them takes constant time
+    no matter how many stopword chunks were merged
 
     Args:
-        path (str): path of stopwords.txt file
+        path (str): path of stopwords.txt file, or of a compiled stopwords .bin artifact
 
     Returns:
-        list: returns list of stopwords
+        frozenset: returns set of stopwords
     '''
-    stop_words = set()
+    if (path.endswith('.bin')):
+        return load_compiled_stop_words(path)
 
-    with open(path, 'r') as f:
+    # Some stopword chunks are not UTF-8 (e.g. cp1252 'vis-à-vis'); such characters are replaced rather than failing the load
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
         text = f.read()
-        stop_words.update(re.split(r'[;,\s\n]\s*', text))
-        
-    return list(stop_words)
 
-def preprocess_text(doc, stop_words):
+    return frozenset(re.split(r'[;,\s\n]\s*', text)) - {''}
+
+def load_compiled_stop_words(path):
+    '''
+    Function to load stopwords from a compiled .bin artifact (see stopwords/get-stopwords-master.py), or from a compiled
+    stopwords profile (see stopwords/build-stopwords.py); the file is read whole and checked against its checksum, and its
+    words are split on newlines only, rather than parsed with the delimiter regex of stopwords.txt
+
+    Args:
+        path (str): path of compiled stopwords .bin artifact
+
+    Returns:
+        frozenset: returns set of stopwords; a StopWords set if the profile has phrases
+    '''
+    phraseCount = 0
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic = data[:len(STOPWORDS_MAGIC)]
+    if (magic == STOPWORDS_MAGIC):
+        magic, count, length, digest = STOPWORDS_HEADER.unpack_from(data)
+        blob = data[STOPWORDS_HEADER.size:STOPWORDS_HEADER.size + length]
+    elif (magic == STOPWORDS_PROFILE_MAGIC):
+        magic, count, length, phraseCount, phraseLength, digest = STOPWORDS_PROFILE_HEADER.unpack_from(data)
+        blob = data[STOPWORDS_PROFILE_HEADER.size:STOPWORDS_PROFILE_HEADER.size + length + phraseLength]
+    else:
+        raise ValueError(f'{path} is not a compiled stopwords artifact')
+
+    if (hashlib.sha256(blob).digest() != digest):
+        raise ValueError(f'{path} is corrupted: checksum does not match')
+
+    stop_words = frozenset(blob[:length].decode('utf-8').split('\n')) if (count > 0) else frozenset()
+    if (len(stop_words) != count):
+        raise ValueError(f'{path} is corrupted: expected {count} stopwords, found {len(stop_words)}')
+
+    if (phraseCount > 0):
+        return StopWords(stop_words, [tuple(phrase.split(' ')) for phrase in blob[length:].decode('utf-8').split('\n')])
+    return stop_words
+
+def load_stop_words_profile(directory, profile):
+    '''
+    Function to load a compiled stopwords profile, through the manifest written by stopwords/build-stopwords.py
+
+    Args:
+        directory (str): directory of compiled profiles and their manifests
+        profile (str): name of the profile, e.g. news or twitter
+
+    Returns:
+        tuple: returns the set of stopwords (see load_compiled_stop_words()), and the profile's manifest
+    '''
+    manifestPath = os.path.join(directory, f'{profile}.json')
+    if (not os.path.exists(manifestPath)):
+        raise ValueError(f'No compiled stopwords profile {profile} in {directory}; build it with stopwords/build-stopwords.py')
+    with open(manifestPath, 'r') as f:
+        manifest = json.load(f)
+
+    # The artifact's own checksum is verified on load; this checks it is the version the manifest points to
+    with open(os.path.join(directory, manifest['file']), 'rb') as f:
+        digest = STOPWORDS_PROFILE_HEADER.unpack(f.read(STOPWORDS_PROFILE_HEADER.size))[-1]
+    if (digest.hex() != manifest['sha256']):
+        raise ValueError(f"{manifest['file']} does not match the manifest of stopwords profile {profile}")
+
+    return load_compiled_stop_words(os.path.join(directory, manifest['file'])), manifest
+
+# Translation tables used in preprocessing; built once instead of on every call
+# PUNCTUATION_TABLE removes punctuation from each word
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+# FAST_TABLE additionally turns the non-ASCII punctuation common in PDF-extracted text into spaces, as word_tokenize
+# would split on them; e.g. 'DSO’s' -> 'DSO s'
+FAST_TABLE = {**PUNCTUATION_TABLE, **str.maketrans('‘’‚“”„–—…•', ' ' * 10)}
+
+def tokenize(doc, tokenizer='nltk'):
+    '''
+    Function to split a document into lowercase words with punctuation removed
+
+    Args:
+        doc (str): document string to be tokenized
+        tokenizer (str): tokenizer to use
+            - nltk: NLTK's word_tokenize; slow, but matches the original preprocessing exactly
+            - fast: lowercase, strip punctuation and split on whitespace over the whole document at once; tokens differ from
+                    word_tokenize only on words joined by punctuation, e.g. 'R&D' -> 'rd' instead of 'r', 'd'
+
+    Returns:
+        list: returns list of tokens
+    '''
+    if (tokenizer == 'fast'):
+        return doc.lower().translate(FAST_TABLE).split()
+
+    return [w.lower().translate(PUNCTUATION_TABLE) for w in word_tokenize(doc)]
+
+def preprocess_tokens(doc, stop_words, tokenizer='nltk'):
+    '''
+    Function to preprocess a document into a list of words: tokenize, then keep alphabetic words which are not stopwords
+
+    Args:
+        doc (str): document string to be preprocessed
+        stop_words (frozenset): set of stopwords to use; phrases are removed too if it is a StopWords set with phrases
+        tokenizer (str): tokenizer to use; see tokenize()
+
+    Returns:
+        list: returns list of preprocessed words
+    '''
+    if (getattr(stop_words, 'phrases', None)):
+        return [w for w in stop_words.remove_phrases([w for w in tokenize(doc, tokenizer) if w.isalpha()]) if not w in stop_words]
+    return [w for w in tokenize(doc, tokenizer) if w.isalpha() and not w in stop_words]
+
+def preprocess_text(doc, stop_words, tokenizer='nltk'):
     '''
     Function to preprocess documents: convert to lowercase, filter stopwords via a stopwords .txt file, etc.
 
     Args:
         doc (str): document string to be preprocessed
-        stop_words (list): list of stopwords to use
+        stop_words (frozenset): set of stopwords to use
+        tokenizer (str): tokenizer to use; see tokenize()
 
     Returns:
         str: returns preprocessed text
     '''
-    # split into words
-    tokens = word_tokenize(doc)
+    return ' '.join(preprocess_tokens(doc, stop_words, tokenizer))
 
-    # convert to lower case
-    tokens = [w.lower() for w in tokens]
-
-    # remove punctuation from each word
-    table = str.maketrans('', '', string.punctuation)
-    stripped = [w.translate(table) for w in tokens]
+def preprocess_batch(docs, stop_words, tokenizer='fast'):
+    '''
+    Function to preprocess a batch of documents, e.g. all the documents of an msearch result
 
-    # remove remaining tokens that are not alphabetic
-    stripped_text = [word for word in stripped if word.isalpha()]
+    Args:
+        docs (list): list of document strings to be preprocessed
+        stop_words (frozenset): set (or list) of stopwords to use
+        tokenizer (str): tokenizer to use; see tokenize()
+            - default: fast
 
-    # filter out stop words
-    stripped_text = [w for w in stripped_text if not w in stop_words]
+    Returns:
+        list: returns list of lists of preprocessed words, one per document
+    '''
+    # Hash lookups for stopwords over the whole batch if given a list, rather than scanning the list for every word
+    if (not isinstance(stop_words, (set, frozenset))):
+        stop_words = frozenset(stop_words)
 
-    doc = ' '.join(stripped_text)
-    return doc
+    return [preprocess_tokens(doc, stop_words, tokenizer) for doc in docs]
 
 def perform_LDA(doc, max_features, max_iter, learning_offset, top_words):
     '''
@@ -159,7 +382,244 @@ def perform_LDA(doc, max_features, max_iter, learning_offset, top_words):
         
     return lda_terms
 
-def get_actions(res_responses, esIndex, rootLogger, stop_words, max_features, max_iter, learning_offset, top_words):
+def extract_tags(processed_text, backend, model, max_features, max_iter, learning_offset, top_words):
+    '''
+    Function to extract tags from a preprocessed document using the chosen backend
+
+    Args:
+        processed_text (str): preprocessed document
+        backend (str): tag extraction backend
+            - lda: LDA fitted on the document, or the corpus model if one is given (see perform_LDA and corpus_model.py)
+            - counts: highest-count terms of the document (see extractors.py)
+            - tfidf: highest tf-idf terms of the document against a corpus IDF table (see extractors.py)
+            - gensim: the saved gensim LDA model, memory-mapped (see gensim_model.py)
+        model (dict): trained artifact used by the backend: corpus model for lda (optional), IDF table for tfidf,
+                      GensimLDA for gensim
+
+        The remaining parameters are passed through to perform_LDA()
+
+    Returns:
+        list: returns list of lists of tags extracted
+    '''
+    if (backend == 'counts'):
+        return perform_counts(processed_text, top_words)
+    if (backend == 'tfidf'):
+        return perform_tfidf(processed_text, model, top_words)
+    if (backend == 'gensim'):
+        return [model.infer_topics([processed_text], top_words)[1][0]]
+    if (model is not None):
+        return perform_corpus_LDA(processed_text, model, top_words)
+    return perform_LDA(processed_text, max_features, max_iter, learning_offset, top_words)
+
+def tag_document(doc, stop_words, max_features, max_iter, learning_offset, top_words, model=None, backend='lda', tokenizer='nltk'):
+    '''
+    Function to obtain the tags of a single document: preprocessing followed by tag extraction (LDA by default)
+
+    Args:
+        doc (str): raw document content
+        stop_words (frozenset): set of stopwords to use
+        model (dict): trained artifact used by the backend; for lda, a corpus model (see corpus_model.py) to tag with,
+                      or None to fit an LDA on the document itself
+        backend (str): tag extraction backend; see extract_tags()
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+
+        The remaining parameters are passed through to perform_LDA()
+
+    Returns:
+        list: returns list of lists of tags extracted; empty documents, and documents tags could not be extracted from,
+              return [['']]
+    '''
+    # If document is empty, return empty tags
+    if (doc.replace(' ', '') == ''):
+        return [['']]
+
+    processed_text = preprocess_text(doc, stop_words, tokenizer)
+    try:
+        return extract_tags(processed_text, backend, model, max_features, max_iter, learning_offset, top_words)
+    except Exception:
+        # e.g. LDA over a document of only numbers or stopwords has an empty vocabulary; it would fail again if retried
+        logging.getLogger().exception('Tagging failed; document will be given empty tags')
+        return [['']]
+
+def tag_batch(docs, stop_words, max_features, max_iter, learning_offset, top_words, model=None, backend='lda', tokenizer='nltk', metrics=None):
+    '''
+    Function to obtain the tags of a batch of documents in the main process; preprocesses the whole batch at once
+    with preprocess_batch() before extracting tags from each document (or from the whole batch at once, with a corpus
+    model or the gensim backend)
+
+    Args:
+        docs (list): list of raw document strings
+        metrics (Metrics): optional metrics registry to record latencies in: per document in extract_seconds, as
+                           TaggerPool does, where tags are extracted document by document; per batch in
+                           preprocess_batch_seconds and extract_batch_seconds, where the whole batch is processed at once
+
+        The remaining parameters are as per tag_document()
+
+    Returns:
+        list: returns the tags of each document, in order; None for documents tags could not be extracted from, as per
+              TaggerPool.tag()
+    '''
+    start = time.perf_counter()
+    batch_tokens = preprocess_batch(docs, stop_words, tokenizer)
+    if (metrics is not None):
+        metrics.observe('preprocess_batch_seconds', time.perf_counter() - start)
+
+    if (backend == 'gensim' or (backend == 'lda' and model is not None)):
+        # One inference pass (one matrix operation) over every non-empty document of the batch
+        texts = [' '.join(tokens) for doc, tokens in zip(docs, batch_tokens) if (doc.replace(' ', '') != '')]
+        start = time.perf_counter()
+        if (backend == 'gensim'):
+            tags = iter(model.infer_topics(texts, top_words)[1])
+        else:
+            _, word_idx, names = infer_corpus_LDA(texts, model, top_words)
+            tags = iter([row[columns >= 0].tolist() for row, columns in zip(names, word_idx)])
+        if (metrics is not None):
+            metrics.observe('extract_batch_seconds', time.perf_counter() - start)
+        return [[next(tags)] if (doc.replace(' ', '') != '') else [['']] for doc in docs]
+
+    batch_tags = []
+    for doc, tokens in zip(docs, batch_tokens):
+        # If document is empty, return empty tags
+        if (doc.replace(' ', '') == ''):
+            batch_tags.append([['']])
+            continue
+
+        start = time.perf_counter()
+        try:
+            batch_tags.append(extract_tags(' '.join(tokens), backend, model, max_features, max_iter, learning_offset, top_words))
+        except Exception:
+            logging.getLogger().exception(f'Tagging failed for document {len(batch_tags)}; document will be given empty tags')
+            batch_tags.append(None)
+            continue
+        if (metrics is not None):
+            metrics.observe('extract_seconds', time.perf_counter() - start)
+
+    return batch_tags
+
+# State of each worker process in the TaggerPool; populated once per process by _init_worker() so that
+# the stopwords list and LDA parameters are not pickled and sent over along with every document
+_worker_state = {}
+
+def _init_worker(stop_words, max_features, max_iter, learning_offset, top_words, model, backend, tokenizer):
+    _worker_state['stop_words'] = stop_words
+    _worker_state['params'] = (max_features, max_iter, learning_offset, top_words, model, backend, tokenizer)
+
+def _tag_in_worker(doc):
+    '''
+    Tag a document in a worker process
+
+    Returns:
+        tuple: returns tags, and seconds spent preprocessing and extracting tags (None for empty documents), so that the
+               main process can record them in its metrics
+    '''
+    if (doc.replace(' ', '') == ''):
+        return [['']], None, None
+
+    max_features, max_iter, learning_offset, top_words, model, backend, tokenizer = _worker_state['params']
+    start = time.perf_counter()
+    processed_text = preprocess_text(doc, _worker_state['stop_words'], tokenizer)
+    preprocessed = time.perf_counter()
+    tags = extract_tags(processed_text, backend, model, max_features, max_iter, learning_offset, top_words)
+
+    return tags, preprocessed - start, time.perf_counter() - preprocessed
+
+class TaggerPool:
+    '''
+    Pool of worker processes which documents are spread across for tagging
+
+    Tags are returned in the same order as the documents passed in. If a worker process crashes (e.g. killed when running
+    out of memory), the pool is restarted and the affected documents are retried. A document that still crashes a worker
+    when tagged on its own, or whose tagging raises an exception, is returned as None; get_actions() gives such
+    documents empty tags, as retrying them would only fail again.
+
+    Args:
+        workers (int): no. of worker processes
+        stop_words (frozenset): set of stopwords to use
+        rootLogger (obj): reference of rootLogger object
+        model (dict): trained artifact used by the backend; see tag_document()
+        backend (str): tag extraction backend; see extract_tags()
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+        metrics (Metrics): optional metrics registry to record the preprocessing and extraction latencies of each document in
+
+        The remaining parameters are passed through to perform_LDA()
+    '''
+    def __init__(self, workers, stop_words, max_features, max_iter, learning_offset, top_words, rootLogger, model=None, backend='lda', tokenizer='nltk', metrics=None):
+        self.workers = workers
+        self.initargs = (stop_words, max_features, max_iter, learning_offset, top_words, model, backend, tokenizer)
+        self.rootLogger = rootLogger
+        self.metrics = metrics
+        self.executor = None
+        self.start()
+
+    def start(self):
+        '''
+        Start (or restart) the worker processes
+        '''
+        if (self.executor is not None):
+            self.executor.shutdown(wait=False)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self.initargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def update_model(self, model):
+        '''
+        Restart the worker processes to tag with a new model (e.g. a new snapshot of an online model)
+        '''
+        self.initargs = self.initargs[:5] + (model,) + self.initargs[6:]
+        self.start()
+
+    def _run(self, docs, indices, results):
+        '''
+        Submit the documents at the given indices to the pool and store their tags in results
+
+        Returns:
+            list: returns indices of documents which were lost to a crashed worker
+        '''
+        futures = [(i, self.executor.submit(_tag_in_worker, docs[i])) for i in indices]
+
+        crashed = []
+        for i, future in futures:
+            try:
+                results[i], preprocessSeconds, extractSeconds = future.result()
+                if (self.metrics is not None and preprocessSeconds is not None):
+                    self.metrics.observe('preprocess_seconds', preprocessSeconds)
+                    self.metrics.observe('extract_seconds', extractSeconds)
+            except BrokenProcessPool:
+                crashed.append(i)
+            except Exception:
+                self.rootLogger.exception(f'Tagging failed for document {i}; document will be given empty tags')
+
+        if (len(crashed) > 0):
+            self.rootLogger.warning(f'Worker process crashed; restarting pool and retrying {len(crashed)} document(s)')
+            self.start()
+
+        return crashed
+
+    def tag(self, docs):
+        '''
+        Tag a batch of documents across the worker processes
+
+        Args:
+            docs (list): list of raw document strings
+
+        Returns:
+            list: returns the tags of each document, in order; None for documents which could not be tagged
+        '''
+        results = [None] * len(docs)
+
+        # A crash fails every document still in flight, so retry them all once in parallel (crashes are usually transient),
+        # then isolate any documents that crash again by tagging them one at a time
+        crashed = self._run(docs, range(len(docs)), results)
+        if (len(crashed) > 0):
+            crashed = self._run(docs, crashed, results)
+        for i in crashed:
+            if (len(self._run(docs, [i], results)) > 0):
+                self.rootLogger.error(f'Document {i} repeatedly crashed a worker process; document will be given empty tags')
+
+        return results
+
+def get_actions(res_responses, esIndex, rootLogger, stop_words, max_features, max_iter, learning_offset, top_words, pool=None, model=None, backend='lda', tokenizer='nltk', cache=None, metrics=None):
     '''
     Function to process documents, input in an object containing ES _search results, and output yields an action per document
 
@@ -178,34 +638,99 @@ def get_actions(res_responses, esIndex, rootLogger, stop_words, max_features, ma
                 - default: 50
             top_words (int): number of top words to display
                 - default: 10
+
+        pool (TaggerPool): optional pool of worker processes to tag documents in parallel; if None, documents are tagged serially
+        model (dict): trained artifact used by the backend when tagging serially; see tag_document()
+        backend (str): tag extraction backend used when tagging serially; see extract_tags()
+        tokenizer (str): tokenizer used in preprocessing when tagging serially; see tokenize()
+        cache (TagCache): optional cache of tags; documents found in it are not tagged again
+        metrics (Metrics): optional metrics registry to record tagging latencies and document counts in; when tagging with a
+                           pool, pass the registry to the pool instead
     '''
-    for res in res_responses: # two halves (top and bottom half) of the msearch result
-        for i in range(len(res['hits']['hits'])): # for each document
-            doc_id = res['hits']['hits'][i]['_id']
-            doc = res['hits']['hits'][i]['_source']['content']
-            rootLogger.info(f'Processing Document {i}: {doc_id}')
-
-            # If document is empty, return empty tags
-            if (doc.replace(' ', '') == ''):
-                tags = [['']]
-            else:
-                processed_text = preprocess_text(doc, stop_words)
-                tags = perform_LDA(processed_text, max_features, max_iter, learning_offset, top_words)
-                
-            rootLogger.info(f'LDA output of Document {i}: {tags[0]}')
-            
-            yield { # action for each document
-                '_op_type': 'update',
-                '_index': esIndex,
-                '_type': '_doc',
-                '_id': doc_id,
-                '_source': {
-                    'doc': {
-                        'tags': tags[0],
-                        'lastTagged': round(time.time())
-                    },
-                }
+    hits = [hit for res in res_responses for hit in res['hits']['hits']] # two halves (top and bottom half) of the msearch result
+    docs = [hit['_source']['content'] for hit in hits]
+
+    # Only tag the documents whose tags are not cached
+    batch_tags = cache.get_many(docs) if (cache is not None) else [None] * len(docs)
+    misses = [i for i in range(len(docs)) if (batch_tags[i] is None)]
+    if (cache is not None):
+        rootLogger.info(f'{len(docs) - len(misses)} of {len(docs)} documents found in tag cache')
+
+    if (len(misses) > 0):
+        miss_docs = [docs[i] for i in misses]
+        if (pool is not None):
+            miss_tags = pool.tag(miss_docs)
+        else:
+            miss_tags = tag_batch(miss_docs, stop_words, max_features, max_iter, learning_offset, top_words, model, backend, tokenizer, metrics)
+
+        for i, tags in zip(misses, miss_tags):
+            batch_tags[i] = tags
+        if (cache is not None):
+            cache.put_many(miss_docs, miss_tags)
+
+    if (metrics is not None):
+        metrics.inc('docs_tagged_total', sum([tags is not None for tags in batch_tags]))
+        metrics.inc('docs_tag_failed_total', sum([tags is None for tags in batch_tags]))
+
+    for i in range(len(hits)): # for each document
+        doc_id = hits[i]['_id']
+        tags = batch_tags[i]
+        rootLogger.debug(f'Processing Document {i}: {doc_id}')
+
+        if (tags is None):
+            # Tagging failed (e.g. a document of only numbers or stopwords); left untagged, it would be fetched again by
+            # every later batch, so it is given empty tags as an empty document is. Failed tags are not cached
+            tags = [['']]
+
+        rootLogger.debug(f'Tags of Document {i}: {tags[0]}')
+
+        yield { # action for each document
+            '_op_type': 'update',
+            '_index': esIndex,
+            '_type': '_doc',
+            '_id': doc_id,
+            '_source': {
+                'doc': {
+                    'tags': tags[0],
+                    'lastTagged': round(time.time())
+                },
             }
+        }
+
+def build_tagging_query(o):
+    '''
+    Constructs the query matching documents that need tagging
+
+    Args:
+        o (int): time in unix epoch seconds, which documents tagged before this time will be flagged for re-tagging
+
+    Returns:
+        dict: returns the query
+    '''
+    # Documents tagged prior to specified re-tag timestamp 'o' will be re-tagged; arg passed in via shell script
+    # NOTE: Untagged documents will simply be tagged as per normal.
+    #       re-tag timestamp will serve as a marker for script to recognise documents with tags that still pending re-tagging
+    return {
+        "bool": {
+            "should": [{
+                # Documents tagged prior to re-tag timestamp specified
+                "range": {
+                    "lastTagged": { # Untagged documents without this field will not throw errors
+                        "lt": o
+                    }
+                }
+            }, {
+                # OR documents without tags
+                "bool": {
+                    "must_not": {
+                        "exists": {
+                            "field": "tags"
+                        }
+                    }
+                }
+            }]
+        }
+    }
 
 def execute_es_query(es, esIndex, b, o):
     '''
@@ -232,37 +757,13 @@ def execute_es_query(es, esIndex, b, o):
     }
     size = int(b/2)
 
-    # Documents tagged prior to specified re-tag timestamp 'o' will be re-tagged; arg passed in via shell script
-    # NOTE: Untagged documents will simply be tagged as per normal.
-    #       re-tag timestamp will serve as a marker for script to recognise documents with tags that still pending re-tagging
-    
     # First Half
     req_body = {
         "size": size,
-        "query": {
-            "bool": {
-                "should": [{
-                    # Documents tagged prior to re-tag timestamp specified
-                    "range": {
-                        "lastTagged": { # Untagged documents without this field will not throw errors
-                            "lt": o
-                        }
-                    }
-                }, {
-                    # OR documents without tags
-                    "bool": {
-                        "must_not": {
-                            "exists": {
-                                "field": "tags"
-                            }
-                        }
-                    }
-                }]
-            }
-        },
+        "query": build_tagging_query(o),
         # Sort by lastIndexed field and grab top b/2 documents
         # "sort" will grab top and bottom b documents (Verified); allows tagging recently added documents to prevent long wait time
-        # NOTE: Documents might overlap, but if it does, database is so small, overhead is negligible
+        # NOTE: Documents might overlap; msearch_documents() drops the duplicates
         "sort" : [{
             "lastIndexed": {
                 "order": "desc"
@@ -277,25 +778,7 @@ def execute_es_query(es, esIndex, b, o):
     #       the bottom half of query can 'assist' in tagging documents instead of idling if it has no more documents to process
     req_body = {
         "size": size,
-        "query": {
-            "bool": {
-                "should": [{
-                    "range": {
-                        "lastTagged": {
-                            "lt": o
-                        }
-                    }
-                }, {
-                    "bool": {
-                        "must_not": {
-                            "exists": {
-                                "field": "tags"
-                            }
-                        }
-                    }
-                }]
-            }
-        },
+        "query": build_tagging_query(o),
         "sort" : [{
             "lastIndexed": {
                 "order": "asc"
@@ -308,6 +791,352 @@ def execute_es_query(es, esIndex, b, o):
 
     return res
 
+def msearch_documents(es, esIndex, b, o):
+    '''
+    Generator yielding batches of documents that need tagging via execute_es_query(); the index is refreshed before every
+    query after the first, so that documents tagged in the previous batch are no longer matched. Never ends by itself;
+    an empty batch means there is nothing left to tag.
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        b (int/function): batch size, or a function returning it before every query (e.g. a BatchController)
+        o (int): time in unix epoch seconds, which documents tagged before this time will be flagged for re-tagging
+
+    Yields:
+        list: responses of the msearch, i.e. the top and bottom half of the batch; documents found in both halves are only
+              kept in the top half
+    '''
+    while (True):
+        res = execute_es_query(es, esIndex, b() if (callable(b)) else b, o)
+
+        seen = set()
+        for response in res['responses']:
+            response['hits']['hits'] = [hit for hit in response['hits']['hits'] if not (hit['_id'] in seen or seen.add(hit['_id']))]
+
+        yield res['responses']
+
+        # Refresh documents index after all the updating
+        IndicesClient.refresh(es, index=esIndex)
+
+def stream_documents(es, esIndex, b, o, search_after=None, preference=None):
+    '''
+    Generator streaming every document that needs tagging exactly once, in pages of b documents, using search_after.
+    Each page continues from the sort values of the last document of the previous page, so pages never overlap, no scroll
+    context is held open on the cluster, and every query costs the same no matter how far into the index it is.
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        b (int/function): page size, up to 10000 (the index's max_result_window), or a function returning it before every
+                          page (e.g. a BatchController)
+        o (int): time in unix epoch seconds, which documents tagged before this time will be flagged for re-tagging
+        search_after (list): sort values to resume streaming after; if None, streaming starts from the newest document
+        preference (str): search preference, e.g. '_shards:0' to only stream the documents of shard 0
+
+    Yields:
+        list: responses containing the next page of documents, in the same form as msearch_documents()
+    '''
+    req_body = {
+        "query": build_tagging_query(o),
+        # Newest documents first; _id breaks ties between documents indexed at the same time so the order is total
+        "sort": [{
+            "lastIndexed": {
+                "order": "desc"
+            }
+        }, {
+            "_id": {
+                "order": "asc"
+            }
+        }],
+        "_source": "content"
+    }
+
+    while (True):
+        req_body = {**req_body, "size": b() if (callable(b)) else b}
+        if (search_after is not None):
+            req_body = {**req_body, "search_after": search_after}
+
+        if (preference is not None):
+            res = es.search(index=esIndex, body=req_body, preference=preference)
+        else:
+            res = es.search(index=esIndex, body=req_body)
+        hits = res['hits']['hits']
+        if (len(hits) < 1):
+            return
+
+        yield [res]
+
+        search_after = hits[-1]['sort']
+
+def resume_stream(stream, cursor):
+    '''
+    Generator resuming a search_after stream from a checkpointed cursor. Documents indexed since the cursor was saved sort
+    before it (newest first), so once the stream reaches the end it is restarted from the top to pick them up.
+
+    Args:
+        stream (function): takes sort values to stream after (or None) and returns the stream, e.g. stream_documents()
+        cursor (list): sort values of the last document fetched by the previous run; None to stream from the top
+
+    Yields:
+        list: batches of the stream
+    '''
+    yield from stream(cursor)
+    if (cursor is not None):
+        yield from stream(None)
+
+def fetch_documents_by_id(es, esIndex, ids, b, o):
+    '''
+    Generator fetching the documents with the given _ids which still need tagging, in pages of b documents; used to
+    retry the documents a previous run had fetched but not written
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        ids (list): list of _ids
+        b (int): page size
+        o (int): time in unix epoch seconds, which documents tagged before this time will be flagged for re-tagging
+
+    Yields:
+        list: responses containing the next page of documents, in the same form as msearch_documents()
+    '''
+    for i in range(0, len(ids), b):
+        req_body = {
+            "size": b,
+            "query": {
+                "bool": {
+                    "must": build_tagging_query(o),
+                    "filter": {
+                        "ids": {
+                            "values": ids[i:i+b]
+                        }
+                    }
+                }
+            },
+            "_source": "content"
+        }
+        res = es.search(index=esIndex, body=req_body)
+        if (len(res['hits']['hits']) > 0):
+            yield [res]
+
+def scroll_documents(es, esIndex, b, o, slice_id=None, slices=None, scroll='10m'):
+    '''
+    Generator streaming every document that needs tagging in one slice of the index, in pages of b documents, using a
+    sliced scroll. Slices split the index by _id hash, so N tagger instances each scrolling a different slice of N never
+    tag the same document.
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        b (int/function): page size, up to 10000 (the index's max_result_window), or a function returning it; a scroll
+                          keeps the page size it was opened with, so a function is only called once per scroll
+        o (int): time in unix epoch seconds, which documents tagged before this time will be flagged for re-tagging
+        slice_id (int): slice to scroll, from 0 to slices-1; if None, the whole index is scrolled
+        slices (int): no. of slices the index is split into
+        scroll (str): how long the scroll context is kept alive between pages; must cover tagging and writing a page
+
+    Yields:
+        list: responses containing the next page of documents, in the same form as msearch_documents()
+    '''
+    req_body = {
+        "size": b() if (callable(b)) else b,
+        "query": build_tagging_query(o),
+        "sort": ["_doc"], # cheapest order to scroll in
+        "_source": "content"
+    }
+    if (slice_id is not None and slices > 1):
+        req_body["slice"] = {
+            "id": slice_id,
+            "max": slices
+        }
+
+    res = es.search(index=esIndex, body=req_body, scroll=scroll)
+    scroll_id = res.get('_scroll_id')
+    try:
+        while (len(res['hits']['hits']) > 0):
+            yield [res]
+
+            res = es.scroll(scroll_id=scroll_id, scroll=scroll)
+            scroll_id = res.get('_scroll_id', scroll_id)
+    finally:
+        # Free the scroll context on the cluster now rather than when it times out, including when streaming stops early
+        if (scroll_id is not None):
+            es.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+
+def sample_documents(es, esIndex, sample_size, seed=0):
+    '''
+    Grabs a random sample of documents from the index, used to train a corpus model
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        sample_size (int): no. of documents to sample; capped by the index's max_result_window (default 10000)
+        seed (int): seed of the random sampling
+
+    Returns:
+        list: returns list of document strings
+    '''
+    req_body = {
+        "size": sample_size,
+        "query": {
+            "function_score": {
+                "query": {
+                    "match_all": {}
+                },
+                "random_score": {
+                    "seed": seed,
+                    "field": "_seq_no"
+                }
+            }
+        },
+        "_source": "content"
+    }
+    res = es.search(index=esIndex, body=req_body)
+
+    return [hit['_source']['content'] for hit in res['hits']['hits']]
+
+def get_corpus_model(es, esIndex, rootLogger, stop_words, model_path, retrain, sample_size, n_topics, max_features, max_iter, learning_offset, tokenizer='nltk', hash_features=None):
+    '''
+    Loads the corpus model saved at model_path; if there is none (or retraining is forced), a new one is trained on
+    a sample of the index and saved there
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        rootLogger (obj): reference of rootLogger object
+        stop_words (frozenset): set of stopwords to use
+        model_path (str): file path of the saved corpus model
+        retrain (bool): if True, train a new model even if one is saved
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+
+        The remaining parameters are passed through to train_corpus_LDA()
+
+    Returns:
+        dict: returns the corpus model
+    '''
+    if (os.path.exists(model_path) and not retrain):
+        rootLogger.info(f'Loading corpus model from {model_path}...')
+        return load_corpus_model(model_path)
+
+    rootLogger.info(f'Training corpus model with {n_topics} topics on a sample of {sample_size} documents...')
+    docs = [' '.join(tokens) for tokens in preprocess_batch(sample_documents(es, esIndex, sample_size), stop_words, tokenizer)]
+    model = train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, hash_features=hash_features)
+    save_corpus_model(model, model_path)
+    rootLogger.info(f'Corpus model saved to {model_path}')
+
+    return model
+
+def get_online_model(es, esIndex, rootLogger, stop_words, online_dir, capacity, model_path, retrain, sample_size, n_topics, max_features, max_iter, learning_offset, tokenizer='nltk', hash_features=None):
+    '''
+    Loads the latest snapshot of the online model; if there is none (or retraining is forced), the corpus model (see
+    get_corpus_model()) is made online and saved as the first snapshot
+
+    Args:
+        online_dir (str): directory of online model snapshots
+        capacity (int): max no. of terms in the online model's vocabulary
+
+        The remaining parameters are as per get_corpus_model()
+
+    Returns:
+        dict: returns the online model
+    '''
+    model = load_model_snapshot(online_dir) if (not retrain) else None
+    if (model is not None):
+        rootLogger.info(f"Loaded online model v{model['version']} ({model['docs_seen']} documents learnt online) from {online_dir}")
+        return model
+
+    model = get_corpus_model(es, esIndex, rootLogger, stop_words, model_path, retrain, sample_size, n_topics, max_features, max_iter, learning_offset, tokenizer, hash_features)
+    model = make_online(model, max(capacity, len(model['feature_names'])))
+    save_model_snapshot(model, online_dir)
+    rootLogger.info(f'Online model started from corpus model; snapshots saved to {online_dir}')
+
+    return model
+
+def update_online_model(model, res_responses, stop_words, tokenizer='nltk', min_count=2):
+    '''
+    Function to update an online model with a batch of ES _search results before the batch is tagged with it
+
+    Args:
+        model (dict): online model
+        res_responses (list): batch of ES _search results
+        stop_words (frozenset): set of stopwords to use
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+        min_count (int): min no. of documents of the batch a new term must occur in to enter the vocabulary
+
+    Returns:
+        dict: returns the updated model
+    '''
+    docs = [hit['_source']['content'] for res in res_responses for hit in res['hits']['hits']]
+    return update_corpus_model(model, [' '.join(tokens) for tokens in preprocess_batch(docs, stop_words, tokenizer)], min_count)
+
+def get_idf_table(es, esIndex, rootLogger, stop_words, idf_path, retrain, sample_size, tokenizer='nltk'):
+    '''
+    Loads the IDF table saved at idf_path; if there is none (or rebuilding is forced), a new one is built from
+    a sample of the index and saved there
+
+    Args:
+        es (obj): elasticsearch object reference
+        esIndex (str): Elasticsearch index of concern
+        rootLogger (obj): reference of rootLogger object
+        stop_words (frozenset): set of stopwords to use
+        idf_path (str): file path of the saved IDF table
+        retrain (bool): if True, build a new IDF table even if one is saved
+        sample_size (int): no. of documents sampled to build the IDF table
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+
+    Returns:
+        dict: returns the IDF table
+    '''
+    if (os.path.exists(idf_path) and not retrain):
+        rootLogger.info(f'Loading IDF table from {idf_path}...')
+        return load_idf_table(idf_path)
+
+    rootLogger.info(f'Building IDF table from a sample of {sample_size} documents...')
+    docs = [' '.join(tokens) for tokens in preprocess_batch(sample_documents(es, esIndex, sample_size), stop_words, tokenizer)]
+    idf_table = build_idf_table(docs)
+    save_idf_table(idf_table, idf_path)
+    rootLogger.info(f'IDF table saved to {idf_path}')
+
+    return idf_table
+
+def check_backends(docs, stop_words, max_features, max_iter, learning_offset, top_words, idf_table, tokenizer='nltk'):
+    '''
+    Compares the tags of the fast backends (counts, tfidf) against those of perform_LDA() on the same documents
+
+    Args:
+        docs (list): list of raw document strings
+        stop_words (frozenset): set of stopwords to use
+        idf_table (dict): IDF table used by the tfidf backend
+        tokenizer (str): tokenizer used in preprocessing; see tokenize()
+
+        The remaining parameters are passed through to perform_LDA()
+
+    Returns:
+        dict: returns backend -> agreement with perform_LDA() (see extractors.tag_agreement) and time taken in seconds
+    '''
+    texts = [' '.join(tokens) for tokens in preprocess_batch(docs, stop_words, tokenizer)]
+
+    processed = []
+    reference = []
+    start = time.time()
+    for text in texts:
+        try:
+            reference.append(extract_tags(text, 'lda', None, max_features, max_iter, learning_offset, top_words)[0])
+            processed.append(text)
+        except ValueError: # no terms left to fit an LDA on; document is left out of the comparison
+            continue
+    end = time.time()
+    report = {'lda': {'exact': 1.0, 'overlap': 1.0, 'time': end-start}}
+
+    for backend, model in [('counts', None), ('tfidf', idf_table)]:
+        start = time.time()
+        candidate = [extract_tags(text, backend, model, max_features, max_iter, learning_offset, top_words)[0] for text in processed]
+        end = time.time()
+        report[backend] = tag_agreement(reference, candidate)
+        report[backend]['time'] = end-start
+
+    return report
+
 if __name__ == "__main__":
     # 0a. Initialise logger
     rootLogger = logging.getLogger()
@@ -340,15 +1169,87 @@ if __name__ == "__main__":
     # 0b. Parse arguments
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('-b', type=int, help='specify batch size of documents to tag', default=100, choices=range(501))
+    parser.add_argument('-b', type=int, help='specify batch size of documents to tag; up to 500 with msearch ingestion, 10000 with stream ingestion; the initial batch size with --adaptive-batch', default=100)
     parser.add_argument('-o', type=int, help='to set a time (in Unix Epoch Seconds) which documents tagged before this time will be selected for tags overwriting', default=0)
     parser.add_argument('-f', type=int, help='max no. of features of LDA', default=1000)
     parser.add_argument('-i', type=int, help='no. of iterations of LDA', default=1000)
     parser.add_argument('-tw', type=int, help='top k words for a topic to be obtained', default=10, choices=range(31)) # 0-30
     parser.add_argument('-lo', type=int, help='learning offset for LDA', default=50)
+    parser.add_argument('--ingest', help='msearch: repeatedly query top and bottom halves of the index; stream: page through the index once with search_after; scroll: page through one slice of the index (or all of it) with a sliced scroll', default='msearch', choices=['msearch', 'stream', 'scroll'])
+    parser.add_argument('--pipeline', help='fetch, tag and write batches concurrently on separate threads; requires --ingest stream or scroll', action='store_true')
+    parser.add_argument('--asyncio', help='stream every shard of the index concurrently from an asyncio event loop; requires --ingest stream', action='store_true')
+    parser.add_argument('--shards', type=int, nargs='+', help='shards streamed with --asyncio; defaults to every primary shard of the index')
+    parser.add_argument('--io-threads', type=int, help='max no. of concurrent ES requests with --asyncio; also the no. of connections kept open to each node', default=8)
+    parser.add_argument('--slices', type=int, help='no. of disjoint slices (by _id hash) the index is split into with --ingest scroll, e.g. one per tagger instance', default=1)
+    parser.add_argument('--slice-id', type=int, help='slice tagged by this instance, from 0 to slices-1; alternatively use --lease-index')
+    parser.add_argument('--lease-index', help='index of slice leases: instances claim free slices one at a time, and take over the slices of crashed instances once their leases expire')
+    parser.add_argument('--lease-ttl', type=int, help='seconds a slice lease lasts without being renewed; renewed every third of it', default=300)
+    parser.add_argument('--scroll-keepalive', help='how long a scroll is kept alive between batches; must cover tagging and writing a batch', default='30m')
+    parser.add_argument('--checkpoint', help='save progress after every batch, and resume from it if the previous run was stopped by work hours or killed', action='store_true')
+    parser.add_argument('--checkpoint-path', help='file path of the checkpoint', default='./cache/checkpoint.json')
+    parser.add_argument('--queue-size', type=int, help='max no. of batches waiting between two pipeline stages', default=2)
+    parser.add_argument('--bulk-chunk-size', type=int, help='max no. of documents per bulk request', default=500)
+    parser.add_argument('--bulk-max-bytes', type=int, help='max size of a bulk request in bytes', default=10 * 1024 * 1024)
+    parser.add_argument('--bulk-threads', type=int, help='no. of threads sending bulk requests; 1 sends them one at a time', default=1)
+    parser.add_argument('--bulk-retries', type=int, help='no. of times a document rejected by ES (429) is retried, with exponential backoff', default=3)
+    parser.add_argument('--bulk-backoff', type=float, help='seconds to wait before the first retry of rejected documents; doubled for every subsequent retry', default=2)
+    parser.add_argument('--adaptive-batch', help='adjust the batch size (from -b) and bulk chunk size (from --bulk-chunk-size) after every batch, from the latency of each stage, the size of the documents and the rate of bulk rejections; lifts the 500 cap of msearch ingestion', action='store_true')
+    parser.add_argument('--batch-min', type=int, help='min batch size with --adaptive-batch', default=10)
+    parser.add_argument('--batch-max', type=int, help='max batch size with --adaptive-batch; up to 10000', default=10000)
+    parser.add_argument('--batch-target-seconds', type=float, help='target seconds the slowest of fetching, tagging and writing takes per batch with --adaptive-batch', default=10)
+    parser.add_argument('--batch-max-mb', type=float, help='max MB of document content per batch with --adaptive-batch; with --pipeline, up to 2 * queue-size + 3 batches are held at once', default=64)
+    parser.add_argument('--bulk-target-seconds', type=float, help='target seconds per bulk request with --adaptive-batch', default=2)
+    parser.add_argument('--max-rejection-rate', type=float, help='fraction of a batch\'s documents ES may reject (429) before --adaptive-batch halves the batch and bulk chunk sizes', default=0.01)
+    parser.add_argument('--cache', help='cache tags by document content, so that unchanged documents are not tagged again when re-tagging', action='store_true')
+    parser.add_argument('--cache-path', help='file path of the tag cache', default='./cache/tags.sqlite')
+    parser.add_argument('--cache-size', type=int, help='max no. of documents in the tag cache; least recently used are evicted', default=1000000)
+    parser.add_argument('-w', '--workers', type=int, help='no. of worker processes to tag documents with; 1 tags documents serially', default=1)
+    parser.add_argument('--tokenizer', help='nltk: NLTK word_tokenize; fast: single pass over each document with str.translate and split', default='nltk', choices=['nltk', 'fast'])
+    parser.add_argument('--stopwords-profile', help='compiled stopwords profile to use, e.g. news or twitter (see stopwords/build-stopwords.py); defaults to the master stopwords')
+    parser.add_argument('--stopwords-dir', help='directory of compiled stopwords profiles', default='./utils/stopwords')
+    parser.add_argument('--backend', help='tag extraction backend: lda, counts (top-k term counts), tfidf (top-k tf-idf against a corpus IDF table) or gensim (the saved gensim LDA model, memory-mapped and shared by worker processes)', default='lda', choices=['lda', 'counts', 'tfidf', 'gensim'])
+    parser.add_argument('--idf-path', help='file path of the saved IDF table used by the tfidf backend', default='./models/idf.joblib')
+    parser.add_argument('--gensim-model', help='file path of the saved gensim LDA model used by the gensim backend', default='../../lda/lda_model')
+    parser.add_argument('--check-backends', help='compare the tags of the counts and tfidf backends against LDA on a sample of the index, then exit', action='store_true')
+    parser.add_argument('--model-mode', help='document: fit an LDA per document; corpus: tag with one LDA trained on a sample of the index', default='document', choices=['document', 'corpus'])
+    parser.add_argument('--model-path', help='file path of the saved corpus model', default='./models/corpus_lda.joblib')
+    parser.add_argument('--retrain', help='train a new corpus model or IDF table even if one is saved', action='store_true')
+    parser.add_argument('--sample-size', type=int, help='no. of documents sampled to train the corpus model or IDF table', default=2000, choices=range(1, 10001))
+    parser.add_argument('--topics', type=int, help='no. of topics of the corpus model', default=20)
+    parser.add_argument('--train-iter', type=int, help='no. of passes over the sample when training the corpus model', default=20)
+    parser.add_argument('--hash-features', type=int, help='hash terms of the corpus model into this no. of features (e.g. 65536) instead of keeping a vocabulary of -f terms, so memory stays flat however large the vocabulary; 0 keeps a vocabulary', default=0)
+    parser.add_argument('--online', help='keep training the corpus model with partial_fit on every batch before tagging it, saving versioned snapshots; requires --model-mode corpus', action='store_true')
+    parser.add_argument('--online-dir', help='directory of online model snapshots', default='./models/online')
+    parser.add_argument('--vocab-size', type=int, help='max no. of terms in the online model vocabulary; the weakest terms make way for new frequent ones once full', default=5000)
+    parser.add_argument('--online-min-count', type=int, help='min no. of documents of a batch a new term must occur in to enter the online model vocabulary', default=2)
+    parser.add_argument('--snapshot-every', type=int, help='no. of online model updates between snapshots; worker processes pick up the model at each snapshot', default=10)
+    parser.add_argument('--snapshot-keep', type=int, help='no. of online model snapshots kept', default=5)
+    parser.add_argument('--metrics-port', type=int, help='serve stage latencies, throughput, queue depths and cache hit rate in the Prometheus format at http://127.0.0.1:<port>/metrics; 0 disables', default=0)
+    parser.add_argument('--metrics-file', help='file to periodically dump the metrics to as JSON')
+    parser.add_argument('--metrics-interval', type=float, help='seconds between metrics dumps to --metrics-file', default=60)
 
     args = parser.parse_args()
 
+    if (args.adaptive_batch and not (0 < args.batch_min <= args.batch_max <= 10000)):
+        parser.error('argument --batch-max: --batch-min and --batch-max must satisfy 0 < batch-min <= batch-max <= 10000')
+    # msearch's two halves are each up to max_result_window too, but a fixed batch that large would swamp a busy cluster
+    maxBatchSize = 10000 if (args.ingest in ['stream', 'scroll'] or args.adaptive_batch) else 500
+    if (args.b not in range(maxBatchSize+1)):
+        parser.error(f'argument -b: must be between 0 and {maxBatchSize} with {args.ingest} ingestion')
+    # msearch ingestion finds untagged documents by re-querying the index, which would return batches still in flight
+    if (args.pipeline and args.ingest not in ['stream', 'scroll']):
+        parser.error('argument --pipeline: requires --ingest stream or scroll')
+    if (args.ingest == 'scroll' and args.slices > 1 and (args.slice_id is None) == (args.lease_index is None)):
+        parser.error('argument --slices: requires exactly one of --slice-id or --lease-index')
+    if (args.online and (args.backend != 'lda' or args.model_mode != 'corpus')):
+        parser.error('argument --online: requires --backend lda and --model-mode corpus')
+    if (args.online and args.cache):
+        parser.error('argument --online: cannot be used with --cache, as tags change with every model update')
+    if (args.slice_id is not None and args.slice_id not in range(args.slices)):
+        parser.error(f'argument --slice-id: must be between 0 and {args.slices-1}')
+    if (args.asyncio and (args.ingest != 'stream' or args.pipeline)):
+        parser.error('argument --asyncio: requires --ingest stream, and cannot be used with --pipeline')
+
     # 0c. Load config variables from .env file; variables loaded prior via tagger.ps1
     #     If variables not found, load defaults
     nodes = []
@@ -368,51 +1269,257 @@ if __name__ == "__main__":
     rootLogger.debug(args)
     check_time(workStartAM, workEndHr, rootLogger) # Quick check if supposed to run
 
+    # 1.5 Export metrics; the JSON dump is also written one last time on exit
+    metrics = Metrics()
+    if (args.metrics_port):
+        metrics.serve(args.metrics_port)
+        rootLogger.info(f'Serving metrics at http://127.0.0.1:{args.metrics_port}/metrics')
+    if (args.metrics_file):
+        metrics.dump_every(args.metrics_file, args.metrics_interval)
+        atexit.register(metrics.dump, args.metrics_file)
+        rootLogger.info(f'Dumping metrics to {args.metrics_file} every {args.metrics_interval}s')
+
     # 2. Connect to ES Database
     rootLogger.info('Connecting to ES DB...')
     start = time.time()
-    es = connectDB(esIndex, nodes, rootLogger)
+    es = connectDB(esIndex, nodes, rootLogger, maxsize=max(10, args.io_threads) if (args.asyncio) else 10)
     end = time.time()
     rootLogger.info(f'Time taken to connect to ES DB: {round(end-start)}s')
 
-    # 3. Load custom stopwords
-    rootLogger.info('Loading custom stopwords .txt file...')
+    # 3. Load custom stopwords: the chosen compiled profile, else the compiled master artifact if it has been copied over,
+    #    else parse the .txt file
     start = time.time()
-    stop_words = load_stop_words('./utils/stopwords-master.txt')
+    if (args.stopwords_profile):
+        rootLogger.info(f'Loading stopwords profile {args.stopwords_profile} from {args.stopwords_dir}...')
+        stop_words, manifest = load_stop_words_profile(args.stopwords_dir, args.stopwords_profile)
+        rootLogger.info(f"Stopwords profile {args.stopwords_profile} v{manifest['version']} ({manifest['sha256'][:12]}): {manifest['phrases']} phrases")
+    else:
+        stopwordsPath = './utils/stopwords-master.bin' if os.path.exists('./utils/stopwords-master.bin') else './utils/stopwords-master.txt'
+        rootLogger.info(f'Loading custom stopwords from {stopwordsPath}...')
+        stop_words = load_stop_words(stopwordsPath)
     end = time.time()
-    rootLogger.info(f'Time taken to load custom stopwords: {round(end-start)}s')
+    rootLogger.info(f'Time taken to load {len(stop_words)} custom stopwords: {round(end-start, 3)}s')
 
-    # 4. Grab documents via _msearch
-    while (True):
+    # 3.5 Load (or train) corpus model / IDF table
+    model = None
+    if (args.backend == 'tfidf' or args.check_backends):
+        start = time.time()
+        model = get_idf_table(es, esIndex, rootLogger, stop_words, args.idf_path, args.retrain, args.sample_size, args.tokenizer)
+        end = time.time()
+        rootLogger.info(f'Time taken to get IDF table: {round(end-start)}s')
+
+        if (args.check_backends):
+            report = check_backends(sample_documents(es, esIndex, args.b, seed=1), stop_words, args.f, args.i, args.lo, args.tw, model, args.tokenizer)
+            for backend, result in report.items():
+                rootLogger.info(f"{backend}: exact match {result['exact']:.1%}, tag overlap {result['overlap']:.1%} with LDA; time taken: {result['time']:.3f}s")
+            sys.exit(0)
+    elif (args.backend == 'lda' and args.model_mode == 'corpus' and args.online):
+        start = time.time()
+        model = get_online_model(es, esIndex, rootLogger, stop_words, args.online_dir, args.vocab_size, args.model_path, args.retrain, args.sample_size, args.topics, args.f, args.train_iter, args.lo, args.tokenizer, args.hash_features)
+        end = time.time()
+        rootLogger.info(f'Time taken to get online model: {round(end-start)}s')
+        metrics.gauge('model_version', lambda: model['version'])
+    elif (args.backend == 'lda' and args.model_mode == 'corpus'):
+        start = time.time()
+        model = get_corpus_model(es, esIndex, rootLogger, stop_words, args.model_path, args.retrain, args.sample_size, args.topics, args.f, args.train_iter, args.lo, args.tokenizer, args.hash_features)
+        end = time.time()
+        rootLogger.info(f'Time taken to get corpus model: {round(end-start)}s')
+    elif (args.backend == 'gensim'):
+        from gensim_model import GensimLDA # gensim is only needed by this backend
+        start = time.time()
+        model = GensimLDA(args.gensim_model)
+        end = time.time()
+        rootLogger.info(f'Time taken to open gensim model: {round(end-start, 3)}s')
+
+    # 3.6 Start worker processes for parallel tagging
+    pool = None
+    if (args.workers > 1):
+        rootLogger.info(f'Starting {args.workers} tagging worker processes...')
+        pool = TaggerPool(args.workers, stop_words, args.f, args.i, args.lo, args.tw, rootLogger, model, args.backend, args.tokenizer, metrics)
+
+    # 3.7 Open tag cache; cached tags are only reused if everything that affects tags is unchanged
+    cache = None
+    if (args.cache):
+        cacheParams = {
+            'f': args.f, 'i': args.i, 'lo': args.lo, 'tw': args.tw,
+            'backend': args.backend, 'tokenizer': args.tokenizer, 'stopwords': hash_stop_words(stop_words),
+            'model': None
+        }
+        if (args.backend == 'tfidf'):
+            cacheParams['model'] = hash_file(args.idf_path)
+        elif (args.backend == 'lda' and args.model_mode == 'corpus'):
+            cacheParams['model'] = hash_file(args.model_path)
+        elif (args.backend == 'gensim'):
+            # Retraining rewrites the model's .state and arrays as well as lda_model itself
+            cacheParams['model'] = hash_files(model.files())
+        cache = TagCache(args.cache_path, cacheParams, args.cache_size)
+        rootLogger.info(f'Using tag cache at {args.cache_path}')
+        metrics.gauge('cache_hit_rate', cache.hit_rate)
+
+    # 3.75 Batch and bulk chunk sizes are either fixed, or adjusted as batches are tagged
+    controller = None
+    batchSize = args.b
+    if (args.adaptive_batch):
+        controller = BatchController(
+            args.b, args.batch_min, args.batch_max, args.batch_target_seconds, int(args.batch_max_mb * 1024 * 1024),
+            bulk_size=args.bulk_chunk_size, bulk_target_seconds=args.bulk_target_seconds, max_rejection_rate=args.max_rejection_rate,
+            rootLogger=rootLogger, metrics=metrics
+        )
+        batchSize = controller
+        rootLogger.info(f'Adapting batch size between {args.batch_min} and {args.batch_max}, starting at {controller.size}')
+
+    writer = BulkWriter(es, rootLogger, args.bulk_chunk_size, args.bulk_max_bytes, args.bulk_threads, args.bulk_retries, args.bulk_backoff, metrics=metrics, controller=controller)
+
+    # 3.8 Load checkpoint of the previous run, if it was stopped before tagging everything
+    checkpoint = None
+    if (args.checkpoint):
+        checkpoint = Checkpoint(args.checkpoint_path, {
+            'index': esIndex, 'ingest': args.ingest, 'o': args.o, 'asyncio': args.asyncio, 'shards': args.shards,
+            'slices': args.slices, 'slice_id': args.slice_id, 'lease_index': args.lease_index
+        })
+        if (checkpoint.resumed):
+            rootLogger.info(f'Resuming from checkpoint: {checkpoint.counts} so far, {len(checkpoint.in_flight)} document(s) in flight')
+    cursors = checkpoint.cursors if (checkpoint is not None) else {}
+    leases = None # leases over the slices of the index, with --lease-index
+    def track(batches, stream=None):
+        if (controller is not None):
+            batches = controller.watch(batches)
+        return checkpoint.track(batches, stream) if (checkpoint is not None) else batches
+
+    def learn(res_responses):
+        global model # replaced by each update of the online model
+        if (args.online):
+            with metrics.time('model_update_seconds'):
+                model = update_online_model(model, res_responses, stop_words, args.tokenizer, args.online_min_count)
+            if (model['version'] % args.snapshot_every == 0):
+                save_online_model()
+
+    def tag(res_responses):
+        start = time.time()
+        learn(res_responses)
+        actions = [j for j in get_actions(res_responses, esIndex, rootLogger, stop_words, args.f, args.i, args.lo, args.tw, pool, model, args.backend, args.tokenizer, cache, metrics)]
+        if (controller is not None):
+            controller.observe('tag', len(actions), time.time() - start)
+        return actions
+
+    def write(actions):
+        ids = []
+        def collect(actions):
+            for action in actions:
+                ids.append(action['_id'])
+                yield action
+        written, failed = writer.write(collect(actions))
+        if (checkpoint is not None):
+            checkpoint.done(ids, written, failed)
+        if (leases is not None):
+            leases.acknowledge(ids) # a slice is only marked finished once all its documents are acknowledged
+        return written, failed
+
+    # Tagging stops at work hours, or when asked to by SIGINT / SIGTERM; either way, batches in flight are written first
+    stop_requested = threading.Event()
+    handle_stop_signals(stop_requested, rootLogger)
+    def should_stop():
+        return stop_requested.is_set() or in_work_hours(workStartAM, workEndHr)
+
+    def save_online_model(exiting=False):
+        if (args.online):
+            rootLogger.info(f"Saved online model snapshot {save_model_snapshot(model, args.online_dir, args.snapshot_keep)}")
+            if (pool is not None and not exiting):
+                pool.update_model(model)
+
+    def exit_if_stopped():
+        if (stop_requested.is_set() or in_work_hours(workStartAM, workEndHr)):
+            save_online_model(exiting=True)
+        if (stop_requested.is_set()):
+            rootLogger.warning('Tagging stopped on request' + (f'; progress saved to {args.checkpoint_path}' if (checkpoint is not None) else ''))
+            sys.exit(5)
         check_time(workStartAM, workEndHr, rootLogger) # time-check to know whether to exit during tagger run-time (reached 8 AM of next day)
+
+    def exit_completed():
+        save_online_model(exiting=True)
+        if (checkpoint is not None):
+            checkpoint.finish()
+        rootLogger.info('Tagging completed. There are no more documents that require tagging. Tagger will now exit and sleep until next 6PM...')
+        sys.exit(99)
+
+    # 3.9 Retry documents the previous run fetched but did not write
+    if (checkpoint is not None and len(checkpoint.in_flight) > 0):
+        rootLogger.info(f'Retrying {len(checkpoint.in_flight)} document(s) left in flight by the previous run...')
+        for res_responses in track(fetch_documents_by_id(es, esIndex, list(checkpoint.in_flight), args.b, args.o)):
+            write(tag(res_responses))
+
+    # 4. Grab documents via _msearch, stream them via search_after, or scroll through slice(s) of the index
+    if (args.ingest == 'stream'):
+        batches = track(resume_stream(lambda cursor: stream_documents(es, esIndex, batchSize, args.o, cursor), cursors.get('stream')), 'stream')
+    elif (args.ingest == 'scroll' and args.lease_index):
+        leases = SliceLeases(es, args.lease_index, args.slices, rootLogger, args.lease_ttl)
+        rootLogger.info(f'Claiming slices of {args.slices} as {leases.owner} through leases in {args.lease_index}...')
+        batches = track(leased_batches(leases, lambda slice_id: scroll_documents(es, esIndex, batchSize, args.o, slice_id, args.slices, args.scroll_keepalive), rootLogger))
+    elif (args.ingest == 'scroll'):
+        batches = track(scroll_documents(es, esIndex, batchSize, args.o, args.slice_id, args.slices, args.scroll_keepalive))
+    else:
+        batches = track(msearch_documents(es, esIndex, batchSize, args.o))
+
+    if (args.asyncio):
+        rootLogger.info('Tagging with concurrent per-shard streams...')
+        AsyncTagger(
+            es,
+            esIndex,
+            # preference pins every page of a stream to copies of the one shard
+            lambda shard: track(resume_stream(lambda cursor: stream_documents(es, esIndex, batchSize, args.o, cursor, preference=f'_shards:{shard}'), cursors.get(str(shard))), str(shard)),
+            tag,
+            write,
+            rootLogger,
+            shards=args.shards,
+            io_threads=args.io_threads,
+            should_stop=should_stop,
+            metrics=metrics
+        ).run()
+
+        exit_if_stopped() # stopped early because work hours started
+        exit_completed()
+
+    if (args.pipeline):
+        rootLogger.info('Tagging with pipelined fetch, tag and write stages...')
+        pipeline = TaggingPipeline(
+            batches,
+            tag,
+            write,
+            rootLogger,
+            queue_size=args.queue_size,
+            should_stop=should_stop,
+            metrics=metrics
+        )
+        pipeline.run()
+
+        exit_if_stopped() # pipeline stopped early because work hours started
+        exit_completed()
+
+    while (True):
+        exit_if_stopped()
         
-        rootLogger.info('Constructing new Elasticsearch query...')
+        rootLogger.info('Fetching next batch of documents...')
         start = time.time()
-        res = execute_es_query(es, esIndex, args.b, args.o)
+        res_responses = next(batches, [])
         end = time.time()
 
-        numDocsToProcess = sum([len(i['hits']['hits']) for i in res['responses']])
+        numDocsToProcess = sum([len(i['hits']['hits']) for i in res_responses])
+        metrics.observe('fetch_seconds', end-start)
+        metrics.inc('docs_fetched_total', numDocsToProcess)
         if (numDocsToProcess < 1):
             # No documents to process
-            rootLogger.info('Tagging completed. There are no more documents that require tagging. Tagger will now exit and sleep until next 6PM...')
-            sys.exit(99)
+            exit_completed()
 
-        rootLogger.info(f'{numDocsToProcess} document(s) need to be tagged. Time taken to find them: {round(end-start)}s.')
+        rootLogger.info(f'{numDocsToProcess} document(s) need to be tagged. Time taken to find them: {end-start:.3f}s.')
 
-        # 4.5 Process documents
+        # 4.5 Process documents and bulk insert their tags; actions are written as they are produced
         rootLogger.info(f'Processing {numDocsToProcess} documents...')
         start = time.time()
-
-        # Construct actions array to be passed into bulk helper
-        actions = [j for j in get_actions(res['responses'], esIndex, rootLogger, stop_words, args.f, args.i, args.lo, args.tw)]
+        learn(res_responses)
+        actions = get_actions(res_responses, esIndex, rootLogger, stop_words, args.f, args.i, args.lo, args.tw, pool, model, args.backend, args.tokenizer, cache, metrics)
+        if (controller is not None):
+            # Actions are tagged as the writer consumes them, so tagging is timed as they are produced
+            actions = controller.timed('tag', numDocsToProcess, actions)
+        written, failed = write(actions)
         end = time.time()
-        rootLogger.info(f'Time taken to process {numDocsToProcess} documents: {round(end-start)}s')
-        
-        # Bulk insertion
-        start = time.time()
-        bulk(client=es, actions=actions)
-        end = time.time()
-        rootLogger.info(f'Time taken to perform bulk insertion of tags for {numDocsToProcess} documents: {round(end-start)}s')
-
-        # Refresh documents index after all the updating
-        IndicesClient.refresh(es, index=esIndex) 
\ No newline at end of file
+        rootLogger.info(f'Time taken to process and bulk insert tags of {numDocsToProcess} documents: {end-start:.3f}s; {written} written, {failed} failed; {metrics.docs_per_sec():.1f} docs/s overall')
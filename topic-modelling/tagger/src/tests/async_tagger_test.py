@@ -0,0 +1,47 @@
+# Imports
+import logging
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+sys.path.insert(1, '../benchmarks')
+
+import tagger # tagger.py
+import async_tagger # async_tagger.py
+from fake_es import FakeElasticsearch # benchmarks/fake_es.py
+from synthetic_corpus import generate_documents, generate_hits # benchmarks/synthetic_corpus.py
+
+mockLogger = logging.getLogger()
+mockEsIndex = 'documents'
+
+def make_tagger(es, **kwargs):
+	return async_tagger.AsyncTagger(
+		es,
+		mockEsIndex,
+		lambda shard: tagger.stream_documents(es, mockEsIndex, 3, 0, preference=f'_shards:{shard}'),
+		lambda res_responses: list(tagger.get_actions(res_responses, mockEsIndex, mockLogger, frozenset(), 1000, 10, 50, 3, backend='counts', tokenizer='fast')),
+		tagger.BulkWriter(es, mockLogger).write,
+		mockLogger,
+		**kwargs
+	)
+
+# DEFINE TESTS
+def test_get_num_shards():
+	assert async_tagger.get_num_shards(FakeElasticsearch(shards=4), mockEsIndex) == 4
+
+def test_AsyncTagger():
+	hits = generate_hits(generate_documents(20, median_words=20, seed_text='alpha beta gamma delta'), start_time=0)
+	es = FakeElasticsearch(hits, latency={'search': 0.01, 'bulk': 0.01}, shards=3)
+
+	# Every document is streamed from exactly one shard and tagged once
+	assert make_tagger(es).run() == 20
+	assert es.count(index=mockEsIndex, body={'query': tagger.build_tagging_query(0)})['count'] == 0
+
+def test_AsyncTagger_should_stop():
+	hits = generate_hits(generate_documents(20, median_words=20, seed_text='alpha beta gamma delta'), start_time=0)
+	es = FakeElasticsearch(hits, shards=2)
+
+	# Stopping after the first page of each shard: the page prefetched before stopping is not written
+	assert make_tagger(es, should_stop=lambda: True).run() == 6
+	assert es.count(index=mockEsIndex, body={'query': tagger.build_tagging_query(0)})['count'] == 14
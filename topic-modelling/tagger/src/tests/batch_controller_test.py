@@ -0,0 +1,103 @@
+# Imports
+from unittest.mock import MagicMock
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import batch_controller # batch_controller.py
+import metrics # metrics.py
+
+def make_batch(contents):
+	# Batch in the form yielded by stream_documents() in tagger.py
+	return [{'hits': {'hits': [{'_id': str(i), '_source': {'content': content}} for i, content in enumerate(contents)]}}]
+
+# DEFINE TESTS
+def test_BatchController_grows():
+	controller = batch_controller.BatchController(100, max_size=1000, target_seconds=10, bulk_size=100, bulk_target_seconds=2, smoothing=1)
+
+	# Every stage well under target: sizes grow, by at most half per batch
+	controller.observe('fetch', 100, 1)
+	controller.observe('tag', 100, 2)
+	controller.observe_bulk(100, 1, 0)
+	assert controller() == 151
+	assert controller.bulk_size == 151
+
+	# Growth stops at the no. of documents the slowest stage (tag) gets through in target_seconds, and at max_size
+	controller.observe('tag', 100, 4)
+	controller.observe_bulk(100, 1, 0)
+	assert controller.size == 227
+	controller.observe('tag', 100, 4)
+	controller.observe_bulk(100, 1, 0)
+	assert controller.size == 250
+	controller.observe('tag', 100, 0.01)
+	controller.observe_bulk(100, 0.01, 0)
+	assert controller.size == 376
+	for _ in range(10):
+		controller.observe_bulk(100, 0.01, 0)
+	assert controller.size == 1000
+
+def test_BatchController_shrinks():
+	controller = batch_controller.BatchController(1000, min_size=10, target_seconds=10, bulk_size=500, bulk_target_seconds=2, smoothing=1)
+
+	# Slowest stage over target: batch size drops straight to what fits in target_seconds
+	controller.observe('tag', 1000, 40)
+	controller.observe_bulk(1000, 1, 0)
+	assert controller.size == 250
+
+	# Bulk requests over target shrink the bulk size the same way
+	controller.observe_bulk(1000, 8, 0)
+	assert controller.bulk_size == 250
+
+	# Never below min_size
+	controller.observe('tag', 10, 1000)
+	controller.observe_bulk(10, 1, 0)
+	assert controller.size == 10
+
+def test_BatchController_rejections():
+	controller = batch_controller.BatchController(400, target_seconds=10, bulk_size=400, max_rejection_rate=0.01, cooldown=2, smoothing=1)
+
+	# Rejections halve both sizes however fast the stages are
+	controller.observe_bulk(400, 0.1, 40)
+	assert (controller.size, controller.bulk_size) == (200, 200)
+
+	# Neither grows for cooldown batches, then growth resumes
+	controller.observe_bulk(200, 0.1, 0)
+	assert (controller.size, controller.bulk_size) == (200, 200)
+	controller.observe_bulk(200, 0.1, 0)
+	assert (controller.size, controller.bulk_size) == (200, 200)
+	controller.observe_bulk(200, 0.1, 0)
+	assert (controller.size, controller.bulk_size) == (301, 301)
+
+	# A rejection rate at or under max_rejection_rate is tolerated
+	controller.observe_bulk(300, 0.1, 3)
+	assert controller.size > 301
+
+def test_BatchController_memory():
+	controller = batch_controller.BatchController(100, max_size=10000, target_seconds=10, max_batch_bytes=1000 * 50, smoothing=1)
+
+	# Documents of 50 characters: a batch is capped at 1000 documents however fast the stages are
+	batches = list(controller.watch(iter([make_batch(['x' * 50] * 100)])))
+	assert len(batches) == 1
+	assert controller.bytes_per_doc == 50
+	for _ in range(20):
+		controller.observe_bulk(100, 0.001, 0)
+	assert controller.size == 1000
+
+def test_BatchController_timed():
+	controller = batch_controller.BatchController(100)
+
+	# Items pass through as is; the stage is observed once they are exhausted
+	assert list(controller.timed('tag', 2, iter(['a', 'b']))) == ['a', 'b']
+	assert 'tag' in controller.seconds_per_doc
+
+def test_BatchController_metrics():
+	registry = metrics.Metrics()
+	mockLogger = MagicMock()
+	controller = batch_controller.BatchController(100, bulk_size=200, rootLogger=mockLogger, metrics=registry, smoothing=1)
+	controller.observe_bulk(100, 0.01, 0)
+
+	# Sizes are exported as gauges, and changes are logged
+	assert registry.to_dict()['gauges'] == {'batch_size': controller.size, 'bulk_chunk_size': controller.bulk_size}
+	mockLogger.info.assert_called_once()
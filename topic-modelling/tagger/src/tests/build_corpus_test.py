@@ -0,0 +1,62 @@
+# Imports
+import pytest
+import importlib.util
+import json
+
+import sys
+sys.dont_write_bytecode = True
+
+pytest.importorskip('gensim')
+from gensim.corpora import Dictionary, MmCorpus
+
+spec = importlib.util.spec_from_file_location('build_corpus', '../../../lda/build-corpus.py')
+build_corpus = importlib.util.module_from_spec(spec)
+sys.modules['build_corpus'] = build_corpus # worker processes unpickle its functions by module name
+spec.loader.exec_module(build_corpus)
+
+def make_args(tmp_path, *argv):
+	return build_corpus.parse_args([
+		'--input', str(tmp_path / 'docs.jsonl'), '--out-dir', str(tmp_path), '--cache-dir', str(tmp_path / 'cache'),
+		'--stopwords', '--nltk-stopwords', '', '--extra-stopwords', 'the', '--no-lemmatize', '--min-count', '2', '--threshold', '1'
+	] + list(argv))
+
+@pytest.fixture
+def docs(tmp_path):
+	(tmp_path / 'cache').mkdir()
+	with open(tmp_path / 'docs.jsonl', 'w') as f:
+		for i in range(20):
+			name = 'doc' + chr(ord('a') + i)
+			f.write(json.dumps({'content': f"The {name} machine learning model, mailed to someone@example.com\n\nabout {name}'s graphs"}) + '\n')
+
+# DEFINE TESTS
+def test_clean():
+	# Emails, whitespace runs and single quotes are removed before simple_preprocess
+	assert build_corpus.clean("Mail me@example.com\n\nabout Python's  café") == ['mail', 'about', 'pythons', 'cafe']
+
+def test_parallel_map():
+	# Order is kept across processes and chunks
+	assert list(build_corpus.parallel_map(build_corpus.clean, (f'word {chr(ord("a") + i)}a' for i in range(26)), 2, 7)) == [['word', f'{chr(ord("a") + i)}a'] for i in range(26)]
+
+def test_Builder(tmp_path, docs):
+	manifest = build_corpus.Builder(make_args(tmp_path, '-w', '2')).build()
+
+	# Stopwords removed, phrases joined, and the corpus streamed to Matrix Market with its dictionary
+	texts = list(build_corpus.JsonLines(manifest['texts']))
+	assert len(texts) == 20
+	assert 'the' not in texts[0] and 'machine_learning' in texts[0]
+	id2word = Dictionary.load(manifest['id2word'])
+	corpus = MmCorpus(manifest['corpus'])
+	assert len(corpus) == 20
+	assert list(corpus)[0] == [(i, float(c)) for i, c in sorted(id2word.doc2bow(texts[0]))]
+	with open(tmp_path / 'corpus.json') as f:
+		assert json.load(f) == manifest
+
+	# Rebuilding with the same input and settings reuses every stage
+	rebuilt = build_corpus.Builder(make_args(tmp_path)).build()
+	assert rebuilt['keys'] == manifest['keys']
+	assert set(rebuilt['timings'].values()) == {0}
+
+	# Changing the phrase threshold reruns the phrases and every stage after it only
+	changed = build_corpus.Builder(make_args(tmp_path, '--threshold', '1000')).build()
+	assert [stage for stage in changed['keys'] if (changed['keys'][stage] != manifest['keys'][stage])] == ['phrases', 'lemmas', 'corpus']
+	assert 'machine_learning' not in list(build_corpus.JsonLines(changed['texts']))[0]
@@ -0,0 +1,63 @@
+# Imports
+import logging
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+sys.path.insert(1, '../benchmarks')
+
+import tagger # tagger.py
+import checkpoint # checkpoint.py
+from fake_es import FakeElasticsearch # benchmarks/fake_es.py
+from synthetic_corpus import generate_documents, generate_hits # benchmarks/synthetic_corpus.py
+
+mockLogger = logging.getLogger()
+mockEsIndex = 'documents'
+mockKey = {'index': mockEsIndex, 'o': 0}
+
+def make_es(numDocs=10):
+	return FakeElasticsearch(generate_hits(generate_documents(numDocs, median_words=20, seed_text='alpha beta gamma delta'), start_time=0))
+
+def make_batch(ids):
+	return [{'hits': {'hits': [{'_id': i, 'sort': [i]} for i in ids]}}]
+
+# DEFINE TESTS
+def test_Checkpoint(tmp_path):
+	path = str(tmp_path / 'checkpoint.json')
+	cp = checkpoint.Checkpoint(path, mockKey)
+	assert not cp.resumed
+
+	# Two batches fetched, only the first written
+	batches = cp.track(iter([make_batch(['a', 'b']), make_batch(['c'])]), 'stream')
+	next(batches)
+	cp.done(['a', 'b'], 2, 0)
+	next(batches)
+
+	# Progress survives a restart with the same key only
+	resumed = checkpoint.Checkpoint(path, mockKey)
+	assert resumed.resumed
+	assert resumed.cursors == {'stream': ['c']}
+	assert list(resumed.in_flight) == ['c']
+	assert resumed.counts == {'fetched': 3, 'written': 2, 'failed': 0}
+	assert not checkpoint.Checkpoint(path, {'index': mockEsIndex, 'o': 1}).resumed
+
+	resumed.finish()
+	assert not checkpoint.Checkpoint(path, mockKey).resumed
+
+def test_resume_stream():
+	es = make_es()
+	stream = lambda cursor: tagger.stream_documents(es, mockEsIndex, 3, 0, cursor)
+	first = [hit for batch in stream(None) for hit in batch[0]['hits']['hits']]
+
+	# Resumes after the cursor, then restarts from the top to catch documents indexed since
+	resumed = [hit['_id'] for batch in tagger.resume_stream(stream, first[4]['sort']) for hit in batch[0]['hits']['hits']]
+	assert resumed == [hit['_id'] for hit in first[5:]] + [hit['_id'] for hit in first]
+	assert [hit['_id'] for batch in tagger.resume_stream(stream, None) for hit in batch[0]['hits']['hits']] == [hit['_id'] for hit in first]
+
+def test_fetch_documents_by_id():
+	es = make_es()
+	es.indices[mockEsIndex]['synthetic_1'].update({'tags': ['tagged'], 'lastTagged': 100}) # tagged since; no longer needs tagging
+
+	ids = [hit['_id'] for batch in tagger.fetch_documents_by_id(es, mockEsIndex, ['synthetic_1', 'synthetic_2', 'synthetic_3', 'missing'], 2, 0) for hit in batch[0]['hits']['hits']]
+	assert sorted(ids) == ['synthetic_2', 'synthetic_3']
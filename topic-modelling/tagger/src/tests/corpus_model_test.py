@@ -0,0 +1,118 @@
+# Imports
+import pytest
+import os
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import corpus_model # corpus_model.py
+
+# Define parameter defaults for testing
+n_topics = 2
+max_features = 1000
+max_iter = 20
+learning_offset = 50
+top_words = 3
+
+# Preprocessed documents
+docs = [
+	'satellite research space satellite launch orbit',
+	'scholarship award engineers scientists scholarship',
+	'satellite orbit space technology research',
+	'engineers scientists defence research scholarship award',
+]
+
+# DEFINE TESTS
+def test_train_corpus_LDA():
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+
+	# Topic-word matrix should be one normalised distribution over the vocabulary per topic
+	assert model['topic_word'].shape == (n_topics, len(model['feature_names']))
+	assert model['topic_word'].sum(axis=1) == pytest.approx([1] * n_topics)
+
+def test_save_and_load_corpus_model(tmp_path):
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+	path = os.path.join(str(tmp_path), 'models', 'corpus_lda.joblib')
+
+	corpus_model.save_corpus_model(model, path)
+	loaded = corpus_model.load_corpus_model(path)
+
+	assert loaded['feature_names'].tolist() == model['feature_names'].tolist()
+	assert corpus_model.perform_corpus_LDA(docs[0], loaded, top_words) == corpus_model.perform_corpus_LDA(docs[0], model, top_words)
+
+def test_perform_corpus_LDA():
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+	tags = corpus_model.perform_corpus_LDA(docs[0], model, top_words)
+
+	# Same format as perform_LDA(): a list containing one list of tags, all of which come from the document
+	assert len(tags) == 1
+	assert len(tags[0]) == top_words
+	assert set(tags[0]) <= set(docs[0].split())
+
+	# Documents with no words in the model's vocabulary get no tags
+	assert corpus_model.perform_corpus_LDA('unseen words only', model, top_words) == [[]]
+
+def test_make_online():
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+	online = corpus_model.make_online(model, 20)
+
+	# Vocabulary padded with free slots; tags unchanged, and the original model untouched
+	assert len(online['feature_names']) == 20
+	assert online['version'] == 0
+	assert corpus_model.perform_corpus_LDA(docs[0], online, top_words) == corpus_model.perform_corpus_LDA(docs[0], model, top_words)
+	assert model['lda'].components_.shape[1] == len(model['feature_names'])
+
+def test_update_corpus_model():
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+	capacity = len(model['feature_names'])
+	online = corpus_model.make_online(model, capacity) # no free slots: new terms must evict old ones
+
+	new_docs = ['quantum entanglement quantum physics', 'quantum physics lecture']
+	updated = corpus_model.update_corpus_model(online, new_docs, min_count=2)
+
+	# Terms in at least min_count documents enter the vocabulary, which stays bounded
+	vocabulary = updated['vectorizer'].vocabulary_
+	assert 'quantum' in vocabulary and 'physics' in vocabulary
+	assert 'lecture' not in vocabulary
+	assert len(vocabulary) == capacity
+	assert updated['version'] == 1 and updated['docs_seen'] == 2
+
+	# Tags come from the updated model
+	assert set(corpus_model.perform_corpus_LDA('quantum physics', updated, top_words)[0]) == {'quantum', 'physics'}
+
+def test_save_and_load_model_snapshot(tmp_path):
+	model = corpus_model.make_online(corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0), 20)
+	directory = os.path.join(str(tmp_path), 'online')
+	assert corpus_model.load_model_snapshot(directory) is None
+
+	for i in range(3):
+		corpus_model.save_model_snapshot(model, directory, keep=2)
+		model = corpus_model.update_corpus_model(model, docs[:2], min_count=1)
+
+	# Latest snapshot is loaded; older ones pruned
+	assert corpus_model.load_model_snapshot(directory)['version'] == 2
+	assert sorted(os.listdir(directory)) == ['LATEST', 'corpus_lda-v000001.joblib', 'corpus_lda-v000002.joblib']
+
+def test_infer_corpus_LDA_matches_per_document():
+	model = corpus_model.train_corpus_LDA(docs, n_topics, max_features, max_iter, learning_offset, min_df=1, max_df=1.0)
+	batch = docs + ['unseen words only']
+	doc_topic, word_idx, tags = corpus_model.infer_corpus_LDA(batch, model, top_words)
+
+	assert doc_topic.shape == (len(batch), n_topics)
+	assert word_idx.shape == tags.shape == (len(batch), top_words)
+	for i, doc in enumerate(docs):
+		assert tags[i].tolist() == corpus_model.perform_corpus_LDA(doc, model, top_words)[0]
+	# Documents with fewer words than top_words are padded
+	assert word_idx[-1].tolist() == [-1] * top_words
+	assert tags[-1].tolist() == [''] * top_words
+
+def test_top_k_per_row():
+	import scipy.sparse as sp
+	import numpy as np
+
+	tf = sp.csr_matrix(np.array([[1, 0, 1, 1], [0, 0, 0, 0], [0, 1, 0, 0]]))
+	scores = np.array([0.1, 0.5, 0.3, 0.9]) # stored entries: (0, 0), (0, 2), (0, 3), (2, 1)
+
+	assert corpus_model.top_k_per_row(tf, scores, 2).tolist() == [[2, 3], [-1, -1], [1, -1]]
@@ -0,0 +1,50 @@
+# Imports
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import extractors # extractors.py
+
+# Define parameter defaults for testing
+top_words = 3
+
+# Preprocessed documents
+docs = [
+	'satellite research space satellite launch orbit satellite orbit',
+	'scholarship award engineers scientists scholarship research',
+	'satellite orbit space technology research',
+]
+
+# DEFINE TESTS
+def test_perform_counts():
+	# Highest counts first, ties broken alphabetically; english stopwords and 1-letter tokens are dropped like CountVectorizer
+	assert extractors.perform_counts(docs[0], top_words) == [['satellite', 'orbit', 'launch']]
+	assert extractors.perform_counts('the a of', top_words) == [[]]
+
+def test_build_idf_table():
+	idf_table = extractors.build_idf_table(docs)
+
+	# Rarer terms have a higher idf; unseen terms get the highest idf
+	assert idf_table['n_docs'] == len(docs)
+	assert idf_table['idf']['launch'] > idf_table['idf']['satellite'] > idf_table['idf']['research']
+	assert idf_table['default'] > idf_table['idf']['launch']
+
+def test_save_and_load_idf_table(tmp_path):
+	idf_table = extractors.build_idf_table(docs)
+	path = str(tmp_path / 'idf.joblib')
+
+	extractors.save_idf_table(idf_table, path)
+	assert extractors.load_idf_table(path) == idf_table
+
+def test_perform_tfidf():
+	idf_table = extractors.build_idf_table(docs)
+
+	# 'technology' only appears in this document so it ranks first; 'research' appears in every document so it ranks last
+	assert extractors.perform_tfidf(docs[2], idf_table, top_words) == [['technology', 'orbit', 'satellite']]
+
+def test_tag_agreement():
+	reference = [['a', 'b'], ['c', 'd']]
+
+	assert extractors.tag_agreement(reference, reference) == {'exact': 1.0, 'overlap': 1.0}
+	assert extractors.tag_agreement(reference, [['b', 'a'], ['c', 'e']]) == {'exact': 0.5, 'overlap': 0.75}
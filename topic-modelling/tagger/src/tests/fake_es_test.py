@@ -0,0 +1,89 @@
+# Imports
+import pytest
+import logging
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+sys.path.insert(1, '../benchmarks')
+
+import tagger # tagger.py
+from fake_es import FakeElasticsearch # benchmarks/fake_es.py
+from synthetic_corpus import generate_documents, generate_hits # benchmarks/synthetic_corpus.py
+
+mockLogger = logging.getLogger()
+mockEsIndex = 'documents'
+
+def make_es(numDocs=5):
+	hits = generate_hits(generate_documents(numDocs, median_words=20, seed_text='alpha beta gamma delta'), start_time=0)
+	hits[0]['_source']['tags'] = ['tagged']
+	hits[0]['_source']['lastTagged'] = 100
+	return FakeElasticsearch(hits)
+
+# DEFINE TESTS
+def test_generate_documents():
+	docs = generate_documents(20, median_words=50, sigma=0.5, empty_fraction=0.2, seed_text='alpha beta gamma', seed=1)
+
+	# Deterministic for the same seed; words drawn from the seed text
+	assert docs == generate_documents(20, median_words=50, sigma=0.5, empty_fraction=0.2, seed_text='alpha beta gamma', seed=1)
+	assert '' in docs
+	assert set(' '.join(docs).split()) <= {'alpha', 'beta', 'gamma'}
+
+def test_FakeElasticsearch_count():
+	es = make_es()
+
+	assert es.count(index=mockEsIndex, body={'query': {'match_all': {}}})['count'] == 5
+	assert es.count(index=mockEsIndex, body={'query': tagger.build_tagging_query(0)})['count'] == 4
+	assert es.count(index=mockEsIndex, body={'query': tagger.build_tagging_query(101)})['count'] == 5
+
+def test_FakeElasticsearch_msearch():
+	es = make_es()
+
+	# Top half newest first, bottom half oldest first; tagged document 0 is excluded
+	res = tagger.execute_es_query(es, mockEsIndex, 4, 0)
+	assert [[hit['_id'] for hit in r['hits']['hits']] for r in res['responses']] == [['synthetic_4', 'synthetic_3'], ['synthetic_1', 'synthetic_2']]
+	assert list(res['responses'][0]['hits']['hits'][0]['_source'].keys()) == ['content']
+
+def test_FakeElasticsearch_stream_and_bulk():
+	es = make_es()
+	writer = tagger.BulkWriter(es, mockLogger)
+
+	# Stream every untagged document once, writing tags back after each page
+	streamed = []
+	for res_responses in tagger.stream_documents(es, mockEsIndex, 2, 0):
+		streamed.extend([hit['_id'] for hit in res_responses[0]['hits']['hits']])
+		actions = tagger.get_actions(res_responses, mockEsIndex, mockLogger, frozenset(), 1000, 10, 50, 3, backend='counts', tokenizer='fast')
+		assert writer.write(actions) == (len(res_responses[0]['hits']['hits']), 0)
+
+	assert streamed == ['synthetic_4', 'synthetic_3', 'synthetic_2', 'synthetic_1']
+	assert es.count(index=mockEsIndex, body={'query': tagger.build_tagging_query(0)})['count'] == 0
+
+def test_FakeElasticsearch_rejections():
+	es = make_es()
+	es.reject_rate = 1.0
+
+	# Every bulk item is rejected with a 429
+	res = es.bulk('{"update": {"_index": "documents", "_id": "synthetic_1"}}\n{"doc": {"tags": []}}\n')
+	assert res['errors']
+	assert res['items'][0]['update']['status'] == 429
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_FakeElasticsearch_untaggable_documents(workers):
+	# A numeric-only and a stopword-only document fail LDA (empty vocabulary); they are written with empty tags, so msearch
+	# ingestion stops fetching them and the index runs out of documents to tag, serially as with a pool
+	es = FakeElasticsearch(generate_hits(['123 456', 'the and', 'satellite orbit satellite research'], start_time=0))
+	stop_words = frozenset(['the', 'and'])
+	writer = tagger.BulkWriter(es, mockLogger)
+	pool = tagger.TaggerPool(workers, stop_words, 1000, 10, 50, 3, mockLogger) if (workers > 0) else None
+	try:
+		batches = tagger.msearch_documents(es, mockEsIndex, 10, 0)
+		actions = tagger.get_actions(next(batches), mockEsIndex, mockLogger, stop_words, 1000, 10, 50, 3, pool)
+		assert writer.write(actions) == (3, 0)
+		assert sum(len(res['hits']['hits']) for res in next(batches)) == 0
+	finally:
+		if (pool is not None):
+			pool.shutdown()
+
+	assert es.get(index=mockEsIndex, id='synthetic_0')['_source']['tags'] == ['']
+	assert es.get(index=mockEsIndex, id='synthetic_1')['_source']['tags'] == ['']
@@ -0,0 +1,78 @@
+# Imports
+import pytest
+import pickle
+import shutil
+import glob
+import os
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+pytest.importorskip('gensim')
+import numpy as np
+
+import gensim_model # gensim_model.py
+import tagger # tagger.py
+import metrics # metrics.py
+
+# Saved gensim model of topic-modelling/lda
+model_dir = '../../../lda'
+
+@pytest.fixture(scope='module')
+def model_path(tmp_path_factory):
+	# Copied so that the topic-word matrix saved alongside the model is not written into the repo
+	directory = tmp_path_factory.mktemp('lda')
+	for path in glob.glob(os.path.join(model_dir, 'lda_model*')):
+		shutil.copy(path, str(directory))
+	return os.path.join(str(directory), 'lda_model')
+
+# DEFINE TESTS
+def test_arrays_are_memory_mapped(model_path):
+	model = gensim_model.GensimLDA(model_path)
+
+	assert isinstance(model.lda.expElogbeta, np.memmap)
+	assert isinstance(model.topic_word, np.memmap)
+	assert model.topic_word.shape == (model.lda.num_topics, len(model.lda.id2word))
+	assert model.lda.state is None
+
+def test_files(model_path):
+	model = gensim_model.GensimLDA(model_path)
+
+	# Files gensim saved, which a retrain rewrites; not the topic-word matrix derived from them
+	assert [os.path.basename(path) for path in model.files()] == ['lda_model', 'lda_model.expElogbeta.npy', 'lda_model.id2word', 'lda_model.state']
+
+def test_infer_topics(model_path):
+	model = gensim_model.GensimLDA(model_path)
+	docs = ['the police arrested him for the crime under the law', ['space', 'launch', 'orbit', 'nasa'], '']
+	doc_topic, tags = model.infer_topics(docs, top_words=3)
+
+	assert doc_topic.shape == (3, model.lda.num_topics)
+	assert doc_topic.sum(axis=1) == pytest.approx([1, 1, 1], rel=1e-5)
+	# Tags are words of the document itself
+	assert len(tags[0]) == 3 and set(tags[0]) <= set(model.tokenize(docs[0]))
+	assert set(tags[1]) <= set(docs[1])
+	assert tags[2] == []
+
+def test_pickles_as_path(model_path):
+	model = gensim_model.GensimLDA(model_path)
+	data = pickle.dumps(model)
+
+	# Only the path is pickled; the unpickled model maps the same files
+	assert len(data) < 1000
+	loaded = pickle.loads(data)
+	assert isinstance(loaded.topic_word, np.memmap)
+	assert loaded.infer_topics(['nasa space shuttle launch'])[1] == model.infer_topics(['nasa space shuttle launch'])[1]
+
+def test_tag_batch_with_gensim_backend(model_path):
+	model = gensim_model.GensimLDA(model_path)
+	docs = ['The police arrested him for the crime under the law.', ' ']
+	m = metrics.Metrics()
+	batch_tags = tagger.tag_batch(docs, frozenset(), 1000, 10, 50, 3, model, 'gensim', 'fast', metrics=m)
+
+	assert batch_tags[1] == [['']]
+	# Inference is one pass over the batch, so it is timed per batch rather than per document
+	assert m.histograms['extract_batch_seconds'].count == 1
+	assert 'extract_seconds' not in m.histograms
+	assert batch_tags[0] == tagger.tag_document(docs[0], frozenset(), 1000, 10, 50, 3, model, 'gensim', 'fast')
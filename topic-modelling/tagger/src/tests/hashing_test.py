@@ -0,0 +1,69 @@
+# Imports
+import pickle
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import hashing # hashing.py
+import corpus_model # corpus_model.py
+
+# Preprocessed documents
+docs = [
+	'satellite research space satellite launch orbit',
+	'scholarship award engineers scientists scholarship',
+	'satellite orbit space technology research',
+	'engineers scientists defence research scholarship award',
+]
+
+# DEFINE TESTS
+def test_counts_over_fixed_features():
+	vectorizer = hashing.HashedCountVectorizer(n_features=2**10)
+	tf = vectorizer.fit_transform(docs)
+
+	assert tf.shape == (len(docs), 2**10)
+	assert tf[0, vectorizer.feature('satellite')] == 2
+	# Unseen terms still have a feature, and the feature space never grows
+	assert vectorizer.transform(['unseen terms only']).shape == (1, 2**10)
+
+def test_chunked_fit_transform_matches_single_chunk():
+	tf = hashing.HashedCountVectorizer(n_features=2**10).fit_transform(docs)
+	chunked = hashing.HashedCountVectorizer(n_features=2**10, chunk_size=3).fit_transform(iter(docs))
+
+	assert (tf != chunked).nnz == 0
+
+def test_reverse_index_keeps_most_frequent_term():
+	# With a single feature every term collides; the most frequent one should name it
+	vectorizer = hashing.HashedCountVectorizer(n_features=1)
+	vectorizer.partial_fit(['orbit satellite satellite', 'satellite launch'])
+	vectorizer.partial_fit(['satellite research'])
+
+	assert vectorizer.lookup([0]) == ['satellite']
+	# A document's own term takes precedence over the reverse index
+	assert vectorizer.lookup([0], 'orbit orbit') == ['orbit']
+
+def test_vectorizer_pickles():
+	vectorizer = hashing.HashedCountVectorizer(n_features=2**10)
+	vectorizer.fit(docs)
+	loaded = pickle.loads(pickle.dumps(vectorizer))
+
+	assert loaded.lookup([vectorizer.feature('orbit')]) == ['orbit']
+	assert (loaded.transform(docs) != vectorizer.transform(docs)).nnz == 0
+
+def test_hashed_corpus_model():
+	model = corpus_model.train_corpus_LDA(docs, 2, 1000, 20, 50, hash_features=2**10)
+	tags = corpus_model.perform_corpus_LDA(docs[0], model, 3)
+
+	assert model['topic_word'].shape == (2, 2**10)
+	assert len(tags[0]) == 3
+	assert set(tags[0]) <= set(docs[0].split())
+
+def test_hashed_online_model():
+	model = corpus_model.make_online(corpus_model.train_corpus_LDA(docs, 2, 1000, 20, 50, hash_features=2**10), 0)
+	updated = corpus_model.update_corpus_model(model, ['quantum computing research', 'quantum computing chips'])
+
+	assert updated['version'] == 1
+	assert updated['topic_word'].shape == (2, 2**10)
+	# New terms are named without any vocabulary growth
+	assert updated['feature_names'][updated['vectorizer'].feature('quantum')] == 'quantum'
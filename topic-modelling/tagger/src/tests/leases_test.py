@@ -0,0 +1,115 @@
+# Imports
+import logging
+import threading
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+sys.path.insert(1, '../benchmarks')
+
+import tagger # tagger.py
+import leases # leases.py
+from fake_es import FakeElasticsearch # benchmarks/fake_es.py
+from synthetic_corpus import generate_documents, generate_hits # benchmarks/synthetic_corpus.py
+
+mockLogger = logging.getLogger()
+mockEsIndex = 'documents'
+mockLeaseIndex = 'tagger-leases'
+
+def make_es(numDocs=30):
+	return FakeElasticsearch(generate_hits(generate_documents(numDocs, median_words=20, seed_text='alpha beta gamma delta'), start_time=0))
+
+# DEFINE TESTS
+def test_scroll_documents_slices():
+	es = make_es()
+
+	# Slices are disjoint and together cover the index
+	slices = [[hit['_id'] for res_responses in tagger.scroll_documents(es, mockEsIndex, 4, 0, i, 3) for hit in res_responses[0]['hits']['hits']] for i in range(3)]
+	assert sorted(sum(slices, [])) == sorted([f'synthetic_{i}' for i in range(30)])
+	assert all([len(ids) > 0 for ids in slices])
+	assert es.scrolls == {'scroll_0': None, 'scroll_1': None, 'scroll_2': None} # every scroll cleared
+
+def test_SliceLeases_claim():
+	es = make_es()
+	a = leases.SliceLeases(es, mockLeaseIndex, 2, mockLogger, owner='a')
+	b = leases.SliceLeases(es, mockLeaseIndex, 2, mockLogger, owner='b')
+
+	# Held slices cannot be claimed by another instance
+	assert a.claim() == 0
+	assert b.claim() == 1
+	assert leases.SliceLeases(es, mockLeaseIndex, 2, mockLogger, owner='c').claim() is None
+
+	# A slice released early can be claimed right away
+	b.release(done=False)
+	assert leases.SliceLeases(es, mockLeaseIndex, 2, mockLogger, owner='c').claim() == 1
+	a.release()
+
+def test_SliceLeases_expiry():
+	es = make_es()
+	a = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, ttl=-1, owner='a') # lease expires immediately, as if a had crashed
+	b = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='b')
+
+	assert a.claim() == 0
+	a._stop_heartbeat()
+	assert b.claim() == 0
+
+	# a finds out it lost the slice on its next renewal
+	assert not a.renew()
+	assert a.lost.is_set()
+
+	# Finished slices are not claimed again by instances already running, only by ones started afterwards (e.g. next night)
+	c = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='c')
+	c.started -= 1
+	b.release()
+	assert c.claim() is None
+	d = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='d')
+	d.started += 1
+	assert d.claim() == 0
+
+def test_leased_batches():
+	es = make_es()
+	a = leases.SliceLeases(es, mockLeaseIndex, 3, mockLogger, owner='a')
+	b = leases.SliceLeases(es, mockLeaseIndex, 3, mockLogger, owner='b')
+	scan = lambda slice_id: tagger.scroll_documents(es, mockEsIndex, 4, 0, slice_id, 3)
+
+	# Two instances taking turns: every document is fetched by exactly one of them
+	seen = []
+	instances = [leases.leased_batches(a, scan, mockLogger), leases.leased_batches(b, scan, mockLogger)]
+	while (len(instances) > 0):
+		for batches in list(instances):
+			batch = next(batches, None)
+			if (batch is None):
+				instances.remove(batches)
+			else:
+				ids = [hit['_id'] for hit in batch[0]['hits']['hits']]
+				(a if (batches is instances[0]) else b).acknowledge(ids) # written, as by the tagger's write()
+				seen.extend(ids)
+
+	assert sorted(seen) == sorted([f'synthetic_{i}' for i in range(30)])
+	assert all([lease['done'] for lease in es.indices[mockLeaseIndex].values()])
+
+def test_leased_batches_waits_for_writer():
+	es = make_es()
+	a = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='a')
+	scan = lambda slice_id: tagger.scroll_documents(es, mockEsIndex, 100, 0, slice_id, 1)
+
+	# The last page has been fetched but not written (e.g. still queued in the pipeline, or lost in a crash), so the slice
+	# is released unfinished rather than marked finished; here it is claimed again, and its documents fetched again
+	batches = leases.leased_batches(a, scan, mockLogger, write_timeout=0.2)
+	ids = [hit['_id'] for hit in next(batches)[0]['hits']['hits']]
+	assert [hit['_id'] for hit in next(batches)[0]['hits']['hits']] == ids
+	batches.close()
+	assert not es.indices[mockLeaseIndex]['slice-0-of-1']['done']
+	assert leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='b').claim() == 0
+
+	# Acknowledged by the writer while waiting, from another thread as in the pipeline
+	es = make_es()
+	a = leases.SliceLeases(es, mockLeaseIndex, 1, mockLogger, owner='a')
+	batches = leases.leased_batches(a, scan, mockLogger)
+	ids = [hit['_id'] for hit in next(batches)[0]['hits']['hits']]
+	timer = threading.Timer(0.2, a.acknowledge, args=(ids,))
+	timer.start()
+	assert next(batches, None) is None
+	timer.join()
+	assert es.indices[mockLeaseIndex]['slice-0-of-1']['done']
@@ -0,0 +1,99 @@
+# Imports
+import pytest
+from unittest.mock import patch
+import urllib.request
+import logging
+import json
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import metrics # metrics.py
+import writer # writer.py
+import pipeline # pipeline.py
+import tagger # tagger.py
+
+mockLogger = logging.getLogger()
+
+# DEFINE TESTS
+def test_Histogram():
+	h = metrics.Histogram(buckets=(0.1, 1, 10))
+	for value in [0.05, 0.1, 0.5, 5, 50]:
+		h.observe(value)
+
+	# Buckets are cumulative and inclusive of their upper bound
+	assert h.cumulative() == [(0.1, 2), (1, 3), (10, 4), (float('inf'), 5)]
+	assert h.count == 5 and h.sum == pytest.approx(55.65)
+	assert h.quantile(0.5) == 1
+	assert metrics.Histogram().quantile(0.5) is None
+
+def test_Metrics_to_prometheus():
+	m = metrics.Metrics()
+	m.observe('fetch_seconds', 0.2)
+	m.inc('docs_written_total', 3)
+	m.gauge('tag_queue_depth', lambda: 2)
+
+	page = m.to_prometheus()
+	assert '# TYPE tagger_fetch_seconds histogram' in page
+	assert 'tagger_fetch_seconds_bucket{le="0.25"} 1' in page
+	assert 'tagger_fetch_seconds_bucket{le="0.1"} 0' in page
+	assert 'tagger_fetch_seconds_bucket{le="+Inf"} 1' in page
+	assert 'tagger_fetch_seconds_count 1' in page
+	assert 'tagger_docs_written_total 3' in page
+	assert 'tagger_tag_queue_depth 2.0' in page
+	assert '# TYPE tagger_docs_per_second gauge' in page
+
+def test_Metrics_serve_and_dump(tmp_path):
+	m = metrics.Metrics()
+	with m.time('bulk_seconds'):
+		pass
+
+	server = m.serve(0) # any free port
+	try:
+		with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as res:
+			assert res.status == 200
+			assert 'tagger_bulk_seconds_count 1' in res.read().decode('utf-8')
+	finally:
+		server.shutdown()
+
+	path = tmp_path / 'metrics.json'
+	m.dump(str(path))
+	dumped = json.loads(path.read_text())
+	assert dumped['histograms']['bulk_seconds']['count'] == 1
+	assert dumped['counters'] == {}
+
+@patch('writer.streaming_bulk')
+def test_BulkWriter_metrics(mock_bulk):
+	def streaming_bulk(es, actions, **kwargs):
+		for action in actions:
+			yield (action['_id'] != 'missing'), {'update': {'_id': action['_id'], 'status': 200 if (action['_id'] != 'missing') else 404}}
+	mock_bulk.side_effect = streaming_bulk
+
+	m = metrics.Metrics()
+	def actions():
+		for i in ['a', 'b', 'missing']:
+			yield {'_op_type': 'update', '_index': 'documents', '_type': '_doc', '_id': i, '_source': {'doc': {'tags': []}}}
+
+	assert writer.BulkWriter(None, mockLogger, metrics=m).write(actions()) == (2, 1)
+	assert m.counters == {'docs_written_total': 2, 'docs_failed_total': 1}
+	assert m.histograms['bulk_seconds'].count == 1
+
+def test_TaggingPipeline_metrics():
+	batches = iter([[{'hits': {'hits': [{'_id': i}]}}] for i in range(3)])
+	m = metrics.Metrics()
+
+	pipeline.TaggingPipeline(batches, lambda batch: [1], lambda actions: None, mockLogger, metrics=m).run()
+	assert m.counters['docs_fetched_total'] == 3
+	assert m.histograms['fetch_seconds'].count == 3
+	assert m.to_dict()['gauges'] == {'tag_queue_depth': 0, 'write_queue_depth': 0}
+
+def test_tag_batch_metrics():
+	m = metrics.Metrics()
+
+	tagger.tag_batch(['satellite research centre satellite', ''], frozenset(), 1000, 10, 50, 3, backend='counts', tokenizer='fast', metrics=m)
+	# Preprocessing is done over the whole batch, so is timed per batch; extraction per document
+	assert m.histograms['preprocess_batch_seconds'].count == 1
+	assert 'preprocess_seconds' not in m.histograms
+	assert m.histograms['extract_seconds'].count == 1 # empty documents are not timed
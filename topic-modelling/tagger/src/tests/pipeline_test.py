@@ -0,0 +1,75 @@
+# Imports
+import pytest
+import time
+import logging
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import pipeline # pipeline.py
+
+mockLogger = logging.getLogger()
+
+def make_batch(ids):
+	# Batch in the form yielded by stream_documents() in tagger.py
+	return [{'hits': {'hits': [{'_id': i} for i in ids]}}]
+
+def tag(batch):
+	return [hit['_id'] for res in batch for hit in res['hits']['hits']]
+
+# DEFINE TESTS
+def test_count_docs():
+	assert pipeline.count_docs(make_batch(['1', '2']) + make_batch(['3'])) == 3
+	assert pipeline.count_docs([]) == 0
+
+def test_TaggingPipeline():
+	batches = iter([make_batch(['1', '2']), make_batch(['3']), make_batch([]), make_batch(['4'])])
+	written = []
+
+	stats = pipeline.TaggingPipeline(batches, tag, written.append, mockLogger).run()
+
+	# Batches are written in order; fetching stops at the first empty batch
+	assert written == [['1', '2'], ['3']]
+	assert [stats[name].docs for name in ['fetch', 'tag', 'write']] == [3, 3, 3]
+
+def test_TaggingPipeline_backpressure():
+	fetched = []
+	written = []
+
+	def fetch():
+		for i in range(20):
+			fetched.append(i)
+			yield make_batch([str(i)])
+
+	def write(actions):
+		time.sleep(0.01)
+		written.append(actions)
+		# At most queue_size batches wait in each queue, plus one being tagged and one being written
+		assert len(fetched) - len(written) <= 2 * queue_size + 3
+
+	queue_size = 1
+	pipeline.TaggingPipeline(fetch(), tag, write, mockLogger, queue_size=queue_size).run()
+
+	assert len(written) == 20
+
+def test_TaggingPipeline_should_stop():
+	batches = iter([make_batch([str(i)]) for i in range(10)])
+	written = []
+
+	# Stop after 2 batches have been fetched; those are still tagged and written
+	p = pipeline.TaggingPipeline(batches, tag, written.append, mockLogger, should_stop=lambda: p.stats['fetch'].batches >= 2)
+	p.run()
+
+	assert written == [['0'], ['1']]
+
+def test_TaggingPipeline_error():
+	batches = iter([make_batch([str(i)]) for i in range(10)])
+
+	def write(actions):
+		raise RuntimeError('bulk failed')
+
+	# Error in any stage stops the pipeline and is raised to the caller
+	with pytest.raises(RuntimeError):
+		pipeline.TaggingPipeline(batches, tag, write, mockLogger).run()
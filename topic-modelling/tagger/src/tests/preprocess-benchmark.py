@@ -0,0 +1,53 @@
+'''
+This file benchmarks the batch preprocessing of tagger.py against the original per-document preprocess_text(),
+on copies of the long PDF-extracted speech used in tagger_test.py
+
+Usage (from the tests folder): python preprocess-benchmark.py [no. of documents]
+'''
+# Imports
+import sys
+import time
+import string
+
+sys.dont_write_bytecode = True
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+from nltk.tokenize import word_tokenize
+
+import tagger # tagger.py
+from tagger_test import doc, stopwordsPath # long PDF-extracted speech
+
+def legacy_preprocess_text(doc, stop_words):
+    '''
+    preprocess_text() as it was before batch preprocessing; kept here as the benchmark baseline
+    '''
+    tokens = word_tokenize(doc)
+    tokens = [w.lower() for w in tokens]
+    table = str.maketrans('', '', string.punctuation)
+    stripped = [w.translate(table) for w in tokens]
+    stripped_text = [word for word in stripped if word.isalpha()]
+    stripped_text = [w for w in stripped_text if not w in stop_words]
+    return ' '.join(stripped_text)
+
+def benchmark(name, fn, docs):
+    start = time.perf_counter()
+    result = fn()
+    end = time.perf_counter()
+    print(f'{name:<40} {end-start:8.3f}s  {len(docs)/(end-start):10.1f} docs/s')
+    return result
+
+if __name__ == '__main__':
+    numDocs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    docs = [doc] * numDocs
+    stop_words = tagger.load_stop_words(stopwordsPath)
+
+    print(f'Preprocessing {numDocs} documents of {len(doc)} characters with {len(stop_words)} stopwords\n')
+    legacy = benchmark('legacy preprocess_text', lambda: [legacy_preprocess_text(d, stop_words) for d in docs], docs)
+    benchmark('preprocess_text (nltk)', lambda: [tagger.preprocess_text(d, stop_words) for d in docs], docs)
+    nltk_batch = benchmark('preprocess_batch (nltk)', lambda: tagger.preprocess_batch(docs, stop_words, 'nltk'), docs)
+    fast_batch = benchmark('preprocess_batch (fast)', lambda: tagger.preprocess_batch(docs, stop_words, 'fast'), docs)
+
+    # nltk mode should be identical to the original; fast mode should only differ on words joined by punctuation
+    assert [' '.join(tokens) for tokens in nltk_batch] == legacy
+    legacy_words, fast_words = set(legacy[0].split()), set(fast_batch[0])
+    print(f'\nfast tokenizer vocabulary overlap with legacy: {len(legacy_words & fast_words) / len(legacy_words | fast_words):.1%}')
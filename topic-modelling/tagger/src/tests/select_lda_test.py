@@ -0,0 +1,54 @@
+# Imports
+import pytest
+import importlib.util
+import random
+import json
+
+import sys
+sys.dont_write_bytecode = True
+
+pytest.importorskip('gensim')
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models import CoherenceModel
+
+spec = importlib.util.spec_from_file_location('select_lda', '../../../lda/select-lda.py')
+select_lda = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(select_lda)
+
+@pytest.fixture
+def manifest(tmp_path):
+	# Corpus and texts as written by build-corpus.py
+	rng = random.Random(0)
+	vocab = ['goal', 'team', 'player', 'match', 'vote', 'party', 'election', 'minister', 'data', 'model', 'network', 'rare']
+	texts = [rng.sample(vocab[:-1], rng.randint(2, 6)) for _ in range(60)] + [['rare', 'goal']]
+	id2word = Dictionary(texts)
+	id2word.save(str(tmp_path / 'id2word'))
+	MmCorpus.serialize(str(tmp_path / 'corpus.mm'), (id2word.doc2bow(text) for text in texts), id2word=id2word)
+	with open(tmp_path / 'texts.jsonl', 'w') as f:
+		f.writelines(json.dumps(text) + '\n' for text in texts)
+	return {'corpus': str(tmp_path / 'corpus.mm'), 'id2word': str(tmp_path / 'id2word'), 'texts': str(tmp_path / 'texts.jsonl'), 'keys': {}}, texts, id2word
+
+# DEFINE TESTS
+def test_Excluding():
+	corpus = select_lda.Excluding(['a', 'b', 'c', 'd'], [1, 3])
+	assert len(corpus) == 2
+	assert list(corpus) == list(corpus) == ['a', 'c']
+
+def test_Reference(tmp_path, manifest):
+	manifest, texts, id2word = manifest
+	sample = select_lda.sample_indices(len(texts), 40, 1)
+	select_lda.build_reference(manifest, sample, str(tmp_path / 'reference'))
+	reference = select_lda.Reference(str(tmp_path / 'reference'))
+	assert reference.num_docs == 40
+
+	# Inverted index holds the sample documents containing each word
+	sampleTexts = [texts[i] for i in sample]
+	word_id = id2word.token2id['goal']
+	assert list(reference.docs(word_id)) == [i for i, text in enumerate(sampleTexts) if ('goal' in text)]
+
+	# Coherence matches gensim's over the sample, with windows spanning whole documents
+	topics = [['goal', 'team', 'player', 'match', 'vote'], ['election', 'minister', 'data', 'model', 'network']]
+	scores = reference.coherence([[id2word.token2id[word] for word in topic] for topic in topics])
+	for measure in ['c_v', 'c_npmi']:
+		expected = CoherenceModel(topics=topics, texts=sampleTexts, dictionary=id2word, coherence=measure, window_size=1000).get_coherence()
+		assert scores[measure] == pytest.approx(expected, abs=1e-6)
@@ -0,0 +1,83 @@
+# Imports
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import tag_cache # tag_cache.py
+
+params = {'f': 1000, 'i': 1000, 'lo': 50, 'tw': 10, 'stopwords': tag_cache.hash_stop_words(frozenset(['a', 'the']))}
+
+# DEFINE TESTS
+def test_hash_stop_words():
+	# Order of stopwords does not matter, contents do
+	assert tag_cache.hash_stop_words(frozenset(['a', 'the'])) == tag_cache.hash_stop_words(['the', 'a'])
+	assert tag_cache.hash_stop_words(frozenset(['a', 'the'])) != tag_cache.hash_stop_words(frozenset(['a']))
+
+def test_TagCache(tmp_path):
+	path = str(tmp_path / 'cache' / 'tags.sqlite')
+	cache = tag_cache.TagCache(path, params)
+
+	assert cache.get_many(['doc 1', 'doc 2']) == [None, None]
+	cache.put_many(['doc 1', 'doc 2'], [[['tag1']], None])
+
+	# Documents whose tagging failed (None) are not cached
+	assert cache.get_many(['doc 2', 'doc 1']) == [None, [['tag1']]]
+	assert (cache.hits, cache.misses) == (1, 3)
+	cache.close()
+
+	# Cache persists on disk, but only for the same params
+	cache = tag_cache.TagCache(path, params)
+	assert cache.get_many(['doc 1']) == [[['tag1']]]
+	cache.close()
+
+	cache = tag_cache.TagCache(path, {**params, 'tw': 5})
+	assert cache.get_many(['doc 1']) == [None]
+	cache.close()
+
+def test_TagCache_eviction(tmp_path):
+	cache = tag_cache.TagCache(str(tmp_path / 'tags.sqlite'), params, max_entries=2)
+
+	cache.put_many(['doc 1', 'doc 2'], [[['tag1']], [['tag2']]])
+	cache.get_many(['doc 1']) # doc 1 is now more recently used than doc 2
+	cache.put_many(['doc 3'], [[['tag3']]])
+
+	# Least recently used document is evicted
+	assert cache.get_many(['doc 1', 'doc 2', 'doc 3']) == [[['tag1']], None, [['tag3']]]
+	cache.close()
+
+def test_TagCache_count(tmp_path):
+	path = str(tmp_path / 'tags.sqlite')
+	cache = tag_cache.TagCache(path, params, max_entries=3)
+
+	# Re-caching a document, or the same document twice in a batch, does not add to the count
+	cache.put_many(['doc 1', 'doc 2', 'doc 2'], [[['tag1']], [['tag2']], [['tag2']]])
+	cache.put_many(['doc 1'], [[['tag1b']]])
+	assert cache.count == 2
+	cache.put_many(['doc 3', 'doc 4'], [[['tag3']], [['tag4']]])
+	assert cache.count == 3
+	assert cache.get_many(['doc 1']) == [[['tag1b']]]
+	cache.close()
+
+	# Count is read from the table on opening
+	cache = tag_cache.TagCache(path, params, max_entries=3)
+	assert cache.count == 3
+	cache.close()
+
+def test_hash_files(tmp_path):
+	paths = [str(tmp_path / 'lda_model'), str(tmp_path / 'lda_model.state')]
+	for path in paths:
+		with open(path, 'w') as f:
+			f.write('model')
+	digest = tag_cache.hash_files(paths)
+
+	# Changing any of the files changes the fingerprint
+	with open(paths[1], 'w') as f:
+		f.write('retrained')
+	assert tag_cache.hash_files(paths) != digest
+	# ...as does adding or removing a file, but not rewriting a file unchanged
+	assert tag_cache.hash_files(paths[:1]) != tag_cache.hash_files(paths)
+	digest = tag_cache.hash_files(paths)
+	with open(paths[0], 'w') as f:
+		f.write('model')
+	assert tag_cache.hash_files(paths) == digest
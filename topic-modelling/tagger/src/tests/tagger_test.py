@@ -3,6 +3,7 @@ import pytest
 from unittest.mock import MagicMock, patch
 import time
 import logging
+import pickle
 
 import sys
 # This line prevents a __pycache__ folder from appearing in src folder; neater this way
@@ -63,9 +64,68 @@ def test_connectDB(mock_es_connection):
 def test_load_stop_words():
 	stop_words = tagger.load_stop_words(stopwordsPath)
 
-	# If successfully loaded, stopwords should be a list of len > 0
-	assert isinstance(stop_words, list)
+	# If successfully loaded, stopwords should be a frozenset of len > 0, without empty strings
+	assert isinstance(stop_words, frozenset)
 	assert len(stop_words) > 0
+	assert '' not in stop_words
+
+def test_load_compiled_stop_words(tmp_path):
+	# Compiled artifact in the format written by stopwords/get-stopwords-master.py
+	blob = '\n'.join(['a', 'about', 'vis-à-vis']).encode('utf-8')
+	path = str(tmp_path / 'stopwords-master.bin')
+	with open(path, 'wb') as f:
+		f.write(tagger.STOPWORDS_HEADER.pack(tagger.STOPWORDS_MAGIC, 3, len(blob), tagger.hashlib.sha256(blob).digest()))
+		f.write(blob)
+
+	assert tagger.load_stop_words(path) == frozenset(['a', 'about', 'vis-à-vis'])
+
+	# Corrupted artifacts should fail to load rather than silently give a different set of stopwords
+	with open(path, 'r+b') as f:
+		f.seek(-1, 2)
+		f.write(b'X')
+
+	with pytest.raises(ValueError):
+		tagger.load_stop_words(path)
+
+def test_load_stop_words_profile(tmp_path):
+	# Profile compiled by stopwords/build-stopwords.py from a couple of chunks
+	import importlib.util
+	spec = importlib.util.spec_from_file_location('build_stopwords', '../../../../stopwords/build-stopwords.py')
+	build_stopwords = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(build_stopwords)
+
+	chunksDir = tmp_path / 'chunks'
+	chunksDir.mkdir()
+	(chunksDir / 'words.txt').write_text("the,a,you're,good-looking,#goodfriday")
+	(chunksDir / 'punctuation.txt').write_text('!\n?\n')
+	profiles = {'base': {'chunks': ['words.txt']}, 'full': {'extends': 'base', 'chunks': ['punct*.txt']}}
+	manifest = build_stopwords.build_profile(profiles, 'full', str(chunksDir), str(tmp_path), 3)
+
+	stop_words, loaded = tagger.load_stop_words_profile(str(tmp_path), 'full')
+	assert loaded == manifest and manifest['dropped'] == 2
+	assert set(stop_words) == {'the', 'a', 'youre', 'goodlooking', 'goodfriday'}
+
+	# "you're" is one token with the fast tokenizer, but two with nltk; both are removed, yet 'you' alone is kept
+	doc = "You're good-looking, you know. #GoodFriday"
+	assert tagger.preprocess_tokens(doc, stop_words, 'fast') == ['you', 'know']
+	assert tagger.preprocess_tokens(doc, stop_words, 'nltk') == ['you', 'know']
+
+	# Phrases survive pickling to worker processes, and are part of the stopwords fingerprint
+	assert pickle.loads(pickle.dumps(stop_words)).phrases == stop_words.phrases
+	assert tagger.hash_stop_words(stop_words) != tagger.hash_stop_words(frozenset(stop_words))
+
+	# Rebuilding unchanged chunks keeps the version; changed chunks make a new version
+	assert build_stopwords.build_profile(profiles, 'full', str(chunksDir), str(tmp_path), 3)['version'] == 1
+	(chunksDir / 'words.txt').write_text('the,a')
+	assert build_stopwords.build_profile(profiles, 'full', str(chunksDir), str(tmp_path), 3)['version'] == 2
+	assert len(tagger.load_stop_words_profile(str(tmp_path), 'full')[0]) == 2
+
+	# Pruning old versions of a profile leaves alone the artifacts of another profile whose name it prefixes
+	profiles['full-lite'] = {'chunks': ['words.txt']}
+	build_stopwords.build_profile(profiles, 'full-lite', str(chunksDir), str(tmp_path), 3)
+	(chunksDir / 'words.txt').write_text('the')
+	assert build_stopwords.build_profile(profiles, 'full', str(chunksDir), str(tmp_path), 1)['history'] == []
+	assert len(tagger.load_stop_words_profile(str(tmp_path), 'full-lite')[0]) == 2
 
 def test_preprocess_text():
 	stop_words = tagger.load_stop_words(stopwordsPath)
@@ -75,6 +135,17 @@ def test_preprocess_text():
 	assert isinstance(processed_doc, str)
 	assert len(processed_doc) < len(doc)
 
+def test_tokenize():
+	# fast tokenizer lowercases and strips punctuation in one pass, splitting on non-ASCII punctuation like word_tokenize does
+	assert tagger.tokenize('DSO’s “future-ready” staff, 1,500 of them.', 'fast') == ['dso', 's', 'futureready', 'staff', '1500', 'of', 'them']
+
+def test_preprocess_batch():
+	stop_words = ['of', 'the']
+	docs = ['The DSO’s staff, 1,500 of them.', '']
+
+	# Non-alphabetic words and stopwords are removed; one list of words per document
+	assert tagger.preprocess_batch(docs, stop_words, 'fast') == [['dso', 's', 'staff', 'them'], []]
+
 def test_perform_LDA():
 	stop_words = tagger.load_stop_words(stopwordsPath)
 	processed_doc = tagger.preprocess_text(doc, stop_words)
@@ -82,6 +153,40 @@ def test_perform_LDA():
 	# Should return a list of tags - can be 0 tags
 	assert isinstance(tagger.perform_LDA(processed_doc, max_features, max_iter, learning_offset, top_words), list)
 
+def test_extract_tags():
+	processed_doc = 'satellite orbit satellite research'
+
+	# Each backend returns tags in the same format as perform_LDA()
+	assert tagger.extract_tags(processed_doc, 'lda', None, max_features, max_iter, learning_offset, top_words) == tagger.perform_LDA(processed_doc, max_features, max_iter, learning_offset, top_words)
+	assert tagger.extract_tags(processed_doc, 'counts', None, max_features, max_iter, learning_offset, top_words) == [['satellite', 'orbit', 'research']]
+	assert tagger.extract_tags(processed_doc, 'tfidf', {'idf': {'research': 1.0}, 'default': 2.0}, max_features, max_iter, learning_offset, top_words) == [['satellite', 'orbit', 'research']]
+
+def test_tag_document():
+	stop_words = tagger.load_stop_words(stopwordsPath)
+	processed_doc = tagger.preprocess_text(doc, stop_words)
+
+	# Should match preprocessing followed by LDA; empty documents are given empty tags without running LDA
+	assert tagger.tag_document(doc, stop_words, max_features, max_iter, learning_offset, top_words) == tagger.perform_LDA(processed_doc, max_features, max_iter, learning_offset, top_words)
+	assert tagger.tag_document('   ', stop_words, max_features, max_iter, learning_offset, top_words) == [['']]
+
+	# Documents LDA cannot be fitted on (no words left after preprocessing) are given empty tags too, rather than raising
+	assert tagger.tag_document('123 456', stop_words, max_features, max_iter, learning_offset, top_words) == [['']]
+	assert tagger.tag_document('the and', frozenset(['the', 'and']), max_features, max_iter, learning_offset, top_words) == [['']]
+	assert tagger.tag_batch(['123 456', doc], stop_words, max_features, max_iter, learning_offset, top_words)[0] is None
+
+def test_TaggerPool():
+	stop_words = tagger.load_stop_words(stopwordsPath)
+	docs = [doc, '', doc[:500]]
+
+	pool = tagger.TaggerPool(2, stop_words, max_features, max_iter, learning_offset, top_words, mockLogger)
+	try:
+		batch_tags = pool.tag(docs)
+	finally:
+		pool.shutdown()
+
+	# Tags from the pool should be identical, and in the same order, as tagging each document serially
+	assert batch_tags == [tagger.tag_document(d, stop_words, max_features, max_iter, learning_offset, top_words) for d in docs]
+
 # Target which method to mock: i.e. the es connection method - elasticsearch.Elasticsearch()
 @patch('tagger.Elasticsearch')
 def test_execute_es_query(mock_es_connection):
@@ -164,10 +269,109 @@ def test_execute_es_query(mock_es_connection):
 
 	assert mock_res['response'] == 200
 
+@patch('tagger.IndicesClient')
+@patch('tagger.Elasticsearch')
+def test_msearch_documents(mock_es_connection, mock_indices_client):
+	# Same document found in both the top and bottom half of the msearch
+	temp_mock_es = mock_es_connection.return_value
+	temp_mock_es.msearch.return_value = {'responses': [{'hits': {'hits': [{'_id': '1'}, {'_id': '2'}]}}, {'hits': {'hits': [{'_id': '2'}, {'_id': '3'}]}}]}
+
+	mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
+	batches = tagger.msearch_documents(mock_es, mockEsIndex, b, o)
+
+	# Duplicate is dropped from the bottom half
+	res_responses = next(batches)
+	assert [[hit['_id'] for hit in res['hits']['hits']] for res in res_responses] == [['1', '2'], ['3']]
+	mock_indices_client.refresh.assert_not_called()
+
+	# Index is refreshed before the next query so that tagged documents are not found again
+	next(batches)
+	mock_indices_client.refresh.assert_called_once_with(mock_es, index=mockEsIndex)
+	assert mock_es.msearch.call_count == 2
+
+@patch('tagger.Elasticsearch')
+def test_stream_documents(mock_es_connection):
+	temp_mock_es = mock_es_connection.return_value
+	temp_mock_es.search.side_effect = [
+		{'hits': {'hits': [{'_id': '1', 'sort': [30, '1']}, {'_id': '2', 'sort': [20, '2']}]}},
+		{'hits': {'hits': [{'_id': '3', 'sort': [10, '3']}]}},
+		{'hits': {'hits': []}}
+	]
+
+	mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
+	pages = [[hit['_id'] for hit in res_responses[0]['hits']['hits']] for res_responses in tagger.stream_documents(mock_es, mockEsIndex, 2, o)]
+
+	# Every document streamed once, ending when a page comes back empty
+	assert pages == [['1', '2'], ['3']]
+
+	# Each page continues after the sort values of the last document of the previous page
+	bodies = [call[1]['body'] for call in mock_es.search.call_args_list]
+	assert bodies[0]['size'] == 2
+	assert bodies[0]['query'] == tagger.build_tagging_query(o)
+	assert [body.get('search_after') for body in bodies] == [None, [20, '2'], [10, '3']]
+
+@patch('tagger.Elasticsearch')
+def test_stream_documents_adaptive(mock_es_connection):
+	temp_mock_es = mock_es_connection.return_value
+	temp_mock_es.search.side_effect = [
+		{'hits': {'hits': [{'_id': '1', 'sort': [30, '1']}]}},
+		{'hits': {'hits': [{'_id': '2', 'sort': [20, '2']}]}},
+		{'hits': {'hits': []}}
+	]
+
+	# Batch size given as a function (e.g. a BatchController) is read before every page
+	sizes = iter([5, 50, 500])
+	mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
+	list(tagger.stream_documents(mock_es, mockEsIndex, lambda: next(sizes), o))
+	assert [call[1]['body']['size'] for call in mock_es.search.call_args_list] == [5, 50, 500]
+
+@patch('tagger.Elasticsearch')
+def test_scroll_documents(mock_es_connection):
+	temp_mock_es = mock_es_connection.return_value
+	temp_mock_es.search.return_value = {'_scroll_id': 'a', 'hits': {'hits': [{'_id': '1'}, {'_id': '2'}]}}
+	temp_mock_es.scroll.side_effect = [
+		{'_scroll_id': 'b', 'hits': {'hits': [{'_id': '3'}]}},
+		{'_scroll_id': 'b', 'hits': {'hits': []}}
+	]
+
+	mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
+	pages = [[hit['_id'] for hit in res_responses[0]['hits']['hits']] for res_responses in tagger.scroll_documents(mock_es, mockEsIndex, 2, o, 1, 4)]
+
+	# Every document of the slice scrolled once, ending when a page comes back empty; the scroll is then cleared
+	assert pages == [['1', '2'], ['3']]
+	assert mock_es.search.call_args[1]['body']['slice'] == {'id': 1, 'max': 4}
+	assert mock_es.search.call_args[1]['body']['query'] == tagger.build_tagging_query(o)
+	assert [call[1]['scroll_id'] for call in mock_es.scroll.call_args_list] == ['a', 'b']
+	assert mock_es.clear_scroll.call_args[1]['scroll_id'] == 'b'
+
+@patch('tagger.Elasticsearch')
+def test_sample_documents(mock_es_connection):
+	temp_mock_es = mock_es_connection.return_value
+	temp_mock_es.search.return_value = {'hits': {'hits': [{'_id': '1', '_source': {'content': 'first'}}, {'_id': '2', '_source': {'content': 'second'}}]}}
+
+	mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
+
+	# Should return only the contents of the sampled documents
+	assert tagger.sample_documents(mock_es, mockEsIndex, 2) == ['first', 'second']
+	assert mock_es.search.call_args[1]['body']['size'] == 2
+
+def test_get_actions_with_cache(tmp_path):
+	mock_res = [{'hits': {'hits': [{'_id': '1', '_source': {'content': 'satellite orbit satellite'}}, {'_id': '2', '_source': {'content': 'award scholarship award'}}]}}]
+	cache = tagger.TagCache(str(tmp_path / 'tags.sqlite'), {'tw': top_words})
+	cache.put_many(['award scholarship award'], [[['cached']]])
+
+	actions = [j for j in tagger.get_actions(mock_res, mockEsIndex, mockLogger, frozenset(), max_features, max_iter, learning_offset, top_words, backend='counts', tokenizer='fast', cache=cache)]
+
+	# Cached document gets its cached tags; the other is tagged and then cached
+	assert [action['_source']['doc']['tags'] for action in actions] == [['satellite', 'orbit'], ['cached']]
+	assert cache.get_many(['satellite orbit satellite']) == [[['satellite', 'orbit']]]
+	cache.close()
+
 @patch('tagger.Elasticsearch') # not mocking any return values but still need this to mock ES DB connection
-@patch('tagger.bulk')
+@patch('writer.streaming_bulk')
 def test_get_actions_and_bulk(mock_bulk, mock_es_connection):
-   mock_bulk.return_value = (b, [])
+   # Every action sent in the bulk request succeeds
+   mock_bulk.side_effect = lambda es, actions, **kwargs: ((True, {'update': {'_id': action['_id'], 'status': 200}}) for action in actions)
    mock_es = tagger.connectDB(mockEsIndex, mockNodes, mockLogger)
 
    # Typical es.msearch(es, b=2, o=round(time.time())) successful response, only content from _source is returned
@@ -270,5 +474,5 @@ def test_get_actions_and_bulk(mock_bulk, mock_es_connection):
       }
    }]
 
-   assert mock_bulk(mock_es, mock_actions) == (len(mock_res['responses']), [])
+   assert tagger.BulkWriter(mock_es, mockLogger).write(iter(mock_actions)) == (len(mock_res['responses']), 0)
 	
\ No newline at end of file
@@ -0,0 +1,64 @@
+# Imports
+import pytest
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import numpy as np
+
+import topic_index # topic_index.py
+
+vocab = ['goal', 'team', 'player', 'vote', 'party', 'minister', 'café']
+topic_word = np.array([
+	[0.40, 0.30, 0.20, 0.02, 0.02, 0.01, 0.05],
+	[0.01, 0.02, 0.02, 0.40, 0.30, 0.20, 0.05]
+])
+
+@pytest.fixture
+def index(tmp_path):
+	path = str(tmp_path / 'topics.bin')
+	topic_index.write_topic_index(path, topic_word, vocab, top_k=3, term_topics=2)
+	index = topic_index.TopicIndex(path, verify=True)
+	yield index
+	index.close()
+
+# DEFINE TESTS
+def test_TopicIndex_vocabulary(index):
+	assert (index.num_topics, index.top_k, index.vocab_size) == (2, 3, 7)
+
+	# Every term maps to its id and back, including non-ASCII terms; unknown terms map to -1
+	assert [index.term(index.term_id(term)) for term in vocab] == vocab
+	assert index.term_id('café') == 6
+	assert index.term_id('unknown') == -1
+
+def test_TopicIndex_topics(index):
+	# Top terms of each topic by p(term | topic)
+	assert [term for term, _ in index.topic_terms(0)] == ['goal', 'team', 'player']
+	assert [term for term, _ in index.topic_terms(1, topn=2)] == ['vote', 'party']
+	assert index.topic_terms(0)[0][1] == pytest.approx(0.40)
+
+	# Top topics of each term by p(topic | term)
+	topics = index.topics_of('goal')
+	assert [topic for topic, _ in topics] == [0, 1]
+	assert topics[0][1] == pytest.approx(0.40 / 0.41)
+	assert index.topics_of('unknown') == []
+
+def test_TopicIndex_expand(index):
+	# Query terms expand to the top terms of their topics, excluding themselves
+	assert [term for term, _ in index.expand(['goal', 'unknown'], topn=2)] == ['team', 'player']
+	assert index.expand(['unknown']) == []
+
+def test_TopicIndex_corrupted(tmp_path, index):
+	index.close()
+	path = str(tmp_path / 'topics.bin')
+	with open(path, 'r+b') as f:
+		f.seek(-1, 2)
+		f.write(b'!')
+	with pytest.raises(ValueError, match='checksum'):
+		topic_index.TopicIndex(path, verify=True)
+
+	(tmp_path / 'other.bin').write_bytes(b'not an index')
+	with pytest.raises(ValueError, match='not a topic index'):
+		topic_index.TopicIndex(str(tmp_path / 'other.bin'))
@@ -0,0 +1,63 @@
+# Imports
+import pytest
+import importlib.util
+import argparse
+
+import sys
+sys.dont_write_bytecode = True
+
+pytest.importorskip('gensim')
+from gensim.corpora import Dictionary, MmCorpus
+
+spec = importlib.util.spec_from_file_location('train_lda', '../../../lda/train-lda.py')
+train_lda = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(train_lda)
+
+@pytest.fixture
+def corpus(tmp_path):
+	texts = [['goal', 'team', 'player', 'match'], ['vote', 'party', 'election', 'minister']] * 50
+	id2word = Dictionary(texts)
+	MmCorpus.serialize(str(tmp_path / 'corpus.mm'), (id2word.doc2bow(text) for text in texts), id2word=id2word)
+	return MmCorpus(str(tmp_path / 'corpus.mm')), id2word
+
+def make_args(**kwargs):
+	return argparse.Namespace(**{'topics': 2, 'alpha': 'symmetric', 'distributed': False, 'seed': 1, 'tune_docs': 40, 'tune_workers': [1, 2], 'tune_chunksize': [10, 20], **kwargs})
+
+# DEFINE TESTS
+def test_TimedCorpus():
+	timed = train_lda.TimedCorpus([[(0, 1)], [(1, 1)]])
+
+	# Every iteration is a pass; each ends where the next starts, the last where training ended
+	assert len(timed) == 2
+	for _ in range(3):
+		assert list(timed) == [[(0, 1)], [(1, 1)]]
+	assert len(timed.starts) == 3 and len(timed.rss) == 3
+	assert timed.passes(timed.starts[-1] + 1)[-1] == 1
+
+def test_peak_rss_mb(monkeypatch):
+	assert train_lda.peak_rss_mb() > 0
+
+	# Without the resource module (Windows) or psutil, memory is reported as not measured rather than failing
+	monkeypatch.setattr(train_lda, 'resource', None)
+	monkeypatch.setitem(sys.modules, 'psutil', None)
+	assert train_lda.peak_rss_mb() is None and train_lda.peak_rss_mb(children=True) is None
+	assert train_lda.format_mb(None) == 'n/a'
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_train(corpus, workers):
+	corpus, id2word = corpus
+	model, stats = train_lda.train(make_args(), corpus, id2word, workers, 20, 3)
+
+	# Trained over the streamed corpus with LdaMulticore (or LdaModel for 1 worker), timing every pass
+	assert type(model).__name__ == ('LdaMulticore' if (workers > 1) else 'LdaModel')
+	assert len(stats['pass_seconds']) == 3
+	assert sum(stats['pass_seconds']) == pytest.approx(stats['seconds'], abs=0.5)
+	assert model.num_topics == 2
+
+def test_tune(corpus):
+	corpus, id2word = corpus
+	results = train_lda.tune(make_args(), corpus, id2word)
+
+	# Every combination is timed, fastest first
+	assert sorted((result['workers'], result['chunksize']) for result in results) == [(1, 10), (1, 20), (2, 10), (2, 20)]
+	assert [result['docs_per_sec'] for result in results] == sorted([result['docs_per_sec'] for result in results], reverse=True)
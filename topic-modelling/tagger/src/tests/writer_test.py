@@ -0,0 +1,72 @@
+# Imports
+from unittest.mock import MagicMock, patch
+import logging
+
+import sys
+sys.dont_write_bytecode = True
+
+sys.path.insert(1, '../') # Allow importing of a module not in current dir
+
+import writer # writer.py
+
+mockLogger = logging.getLogger()
+
+def make_actions(ids):
+	return ({'_op_type': 'update', '_index': 'documents', '_type': '_doc', '_id': i, '_source': {'doc': {'tags': []}}} for i in ids)
+
+def mock_streaming_bulk(statuses):
+	'''
+	Mocks streaming_bulk, answering each action with the next status listed for its document id
+	'''
+	def streaming_bulk(es, actions, **kwargs):
+		for action in actions:
+			status = statuses[action['_id']].pop(0)
+			yield (200 <= status < 300), {'update': {'_id': action['_id'], 'status': status, 'error': 'error'}}
+	return streaming_bulk
+
+# DEFINE TESTS
+@patch('writer.time.sleep')
+@patch('writer.streaming_bulk')
+def test_BulkWriter(mock_bulk, mock_sleep):
+	mock_bulk.side_effect = mock_streaming_bulk({'1': [200], '2': [429, 429, 200], '3': [404]})
+	bulk_writer = writer.BulkWriter(MagicMock(), mockLogger, chunk_size=2, max_retries=3, initial_backoff=2)
+
+	# Actions are consumed lazily from a generator; rejected document 2 is retried until written, missing document 3 is not retried
+	assert bulk_writer.write(make_actions(['1', '2', '3'])) == (2, 1)
+	assert bulk_writer.failures == {'2': 2, '3': 1}
+	assert mock_bulk.call_args_list[0][1]['chunk_size'] == 2
+
+	# Backoff doubles on every retry
+	assert [call[0][0] for call in mock_sleep.call_args_list] == [2, 4]
+
+@patch('writer.time.sleep')
+@patch('writer.streaming_bulk')
+def test_BulkWriter_gives_up(mock_bulk, mock_sleep):
+	mock_bulk.side_effect = mock_streaming_bulk({'1': [429, 429, 429]})
+	bulk_writer = writer.BulkWriter(MagicMock(), mockLogger, max_retries=2, initial_backoff=2, max_backoff=3)
+
+	# Document is given up on after max_retries; backoff is capped at max_backoff
+	assert bulk_writer.write(make_actions(['1'])) == (0, 1)
+	assert [call[0][0] for call in mock_sleep.call_args_list] == [2, 3]
+
+@patch('writer.parallel_bulk')
+def test_BulkWriter_threads(mock_bulk):
+	mock_bulk.side_effect = mock_streaming_bulk({'1': [200], '2': [200]})
+	bulk_writer = writer.BulkWriter(MagicMock(), mockLogger, threads=4)
+
+	# More than 1 thread sends bulk requests with parallel_bulk
+	assert bulk_writer.write(make_actions(['1', '2'])) == (2, 0)
+	assert mock_bulk.call_args_list[0][1]['thread_count'] == 4
+
+@patch('writer.time.sleep')
+@patch('writer.streaming_bulk')
+def test_BulkWriter_controller(mock_bulk, mock_sleep):
+	mock_bulk.side_effect = mock_streaming_bulk({'1': [200], '2': [429, 200]})
+	controller = MagicMock(bulk_size=7)
+	bulk_writer = writer.BulkWriter(MagicMock(), mockLogger, chunk_size=2, controller=controller)
+
+	# The controller's bulk size replaces chunk_size, and it is told of every document written and every rejection
+	assert bulk_writer.write(make_actions(['1', '2'])) == (2, 0)
+	assert mock_bulk.call_args_list[0][1]['chunk_size'] == 7
+	docs, seconds, rejected = controller.observe_bulk.call_args[0]
+	assert (docs, rejected) == (2, 1)
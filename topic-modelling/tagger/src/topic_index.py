@@ -0,0 +1,217 @@
+# Topic-term index: the topic-term matrix of a trained LDA model, precomputed into one compact binary file (see
+# lda/export-topic-index.py) which is memory-mapped at query time, so that "More Like This" queries can be expanded and
+# topics labelled with O(1) lookups, without loading gensim or pandas, or parsing a CSV
+#
+# Layout of the file, little-endian, every array starting on an 8 byte boundary:
+#   header:             magic bytes b'TOPICIX1', no. of topics T, top terms per topic K, top topics per term M,
+#                       vocabulary size V, no. of hash table slots S (uint32 each), length of the vocabulary blob (uint64),
+#                       SHA-256 of everything after the header (32 bytes)
+#   top_terms:          int32 [T, K], term ids of the top terms of each topic, by p(term | topic), descending
+#   top_weights:        float32 [T, K], p(term | topic) of each
+#   term_topics:        int32 [V, M], topic ids of the top topics of each term, by p(topic | term), descending
+#   term_topic_weights: float32 [V, M], p(topic | term) of each, with topics equally likely a priori
+#   vocab_offsets:      int64 [V + 1], term i is vocab[vocab_offsets[i]:vocab_offsets[i + 1]]
+#   slots:              int32 [S], open addressing hash table of term -> term id by CRC-32 of the term, linear probing;
+#                       -1 marks an empty slot
+#   vocab:              the terms in UTF-8, concatenated in order of term id
+
+# Imports
+import numpy as np
+
+import hashlib
+import struct
+import mmap
+import zlib
+import os
+
+TOPIC_INDEX_MAGIC = b'TOPICIX1'
+TOPIC_INDEX_HEADER = struct.Struct('<8sIIIIIQ32s')
+
+# Function Definitions
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+def _layout(numTopics, topK, termTopics, vocabSize, numSlots):
+    '''
+    Returns:
+        list: returns (name, dtype, shape, offset) of every array, and the offset the vocabulary blob starts at
+    '''
+    arrays, offset = [], TOPIC_INDEX_HEADER.size
+    for name, dtype, shape in [
+        ('top_terms', np.int32, (numTopics, topK)),
+        ('top_weights', np.float32, (numTopics, topK)),
+        ('term_topics', np.int32, (vocabSize, termTopics)),
+        ('term_topic_weights', np.float32, (vocabSize, termTopics)),
+        ('vocab_offsets', np.int64, (vocabSize + 1,)),
+        ('slots', np.int32, (numSlots,))
+    ]:
+        offset = _align(offset)
+        arrays.append((name, dtype, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return arrays, _align(offset)
+
+def write_topic_index(path, topic_word, vocab, top_k=30, term_topics=3):
+    '''
+    Compile the topic-term matrix of a model into a topic index file
+
+    Args:
+        path (str): file path to write to; written to a temporary file first, then renamed
+        topic_word (np.ndarray): p(term | topic), of shape (no. of topics, vocabulary size)
+        vocab (list): term of each term id
+        top_k (int): no. of top terms kept per topic
+        term_topics (int): no. of top topics kept per term
+
+    Returns:
+        str: returns the SHA-256 of the file after its header, as hex
+    '''
+    numTopics, vocabSize = topic_word.shape
+    top_k, term_topics = min(top_k, vocabSize), min(term_topics, numTopics)
+
+    # Top terms of each topic: argpartition, then only the k kept are sorted
+    top_terms = np.argpartition(-topic_word, top_k - 1, axis=1)[:, :top_k] if (top_k < vocabSize) else np.tile(np.arange(vocabSize), (numTopics, 1))
+    order = np.argsort(-np.take_along_axis(topic_word, top_terms, axis=1), axis=1, kind='stable')
+    top_terms = np.take_along_axis(top_terms, order, axis=1).astype(np.int32)
+    top_weights = np.take_along_axis(topic_word, top_terms, axis=1).astype(np.float32)
+
+    # Top topics of each term, by Bayes' rule with a uniform prior over topics
+    topic_term = (topic_word / np.maximum(topic_word.sum(axis=0), np.finfo(np.float64).tiny)).T
+    term_top = np.argsort(-topic_term, axis=1, kind='stable')[:, :term_topics].astype(np.int32)
+    term_top_weights = np.take_along_axis(topic_term, term_top, axis=1).astype(np.float32)
+
+    encoded = [term.encode('utf-8') for term in vocab]
+    vocab_offsets = np.concatenate([[0], np.cumsum([len(term) for term in encoded])]).astype(np.int64)
+
+    # Hash table at most half full, so probes stay short
+    numSlots = 1 << max(1, (2 * vocabSize - 1).bit_length())
+    slots = np.full(numSlots, -1, dtype=np.int32)
+    for term_id, term in enumerate(encoded):
+        slot = zlib.crc32(term) & (numSlots - 1)
+        while (slots[slot] >= 0):
+            slot = (slot + 1) & (numSlots - 1)
+        slots[slot] = term_id
+
+    values = {
+        'top_terms': top_terms, 'top_weights': top_weights, 'term_topics': term_top, 'term_topic_weights': term_top_weights,
+        'vocab_offsets': vocab_offsets, 'slots': slots
+    }
+    arrays, vocabOffset = _layout(numTopics, top_k, term_topics, vocabSize, numSlots)
+    body = bytearray(vocabOffset - TOPIC_INDEX_HEADER.size)
+    for name, dtype, shape, offset in arrays:
+        data = np.ascontiguousarray(values[name], dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+        start = offset - TOPIC_INDEX_HEADER.size
+        body[start:start + len(data)] = data
+    body += b''.join(encoded)
+
+    digest = hashlib.sha256(body).digest()
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(TOPIC_INDEX_HEADER.pack(TOPIC_INDEX_MAGIC, numTopics, top_k, term_topics, vocabSize, numSlots, int(vocab_offsets[-1]), digest))
+        f.write(body)
+    os.replace(f'{path}.tmp', path)
+
+    return digest.hex()
+
+# Class Definitions
+class TopicIndex:
+    '''
+    Read-only topic index, memory-mapped; arrays are views of the file, so opening it costs no parsing and processes
+    sharing it share one copy in the page cache
+
+    Args:
+        path (str): file path of the topic index
+        verify (bool): check the file against its checksum, which reads it in full
+
+    Attributes:
+        num_topics (int): no. of topics
+        top_k (int): no. of top terms per topic
+        vocab_size (int): no. of terms
+        top_terms (np.ndarray): term ids of the top terms of each topic, of shape (num_topics, top_k)
+        top_weights (np.ndarray): p(term | topic) of each
+        term_topics (np.ndarray): topic ids of the top topics of each term, of shape (vocab_size, no. of topics per term)
+        term_topic_weights (np.ndarray): p(topic | term) of each
+        digest (str): SHA-256 of the index, as hex
+    '''
+    def __init__(self, path, verify=False):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if (self._mm[:len(TOPIC_INDEX_MAGIC)] != TOPIC_INDEX_MAGIC):
+            raise ValueError(f'{path} is not a topic index')
+        _, self.num_topics, self.top_k, termTopics, self.vocab_size, numSlots, vocabLength, digest = TOPIC_INDEX_HEADER.unpack_from(self._mm)
+        self.digest = digest.hex()
+        if (verify and hashlib.sha256(self._mm[TOPIC_INDEX_HEADER.size:]).digest() != digest):
+            raise ValueError(f'{path} is corrupted: checksum does not match')
+
+        arrays, self._vocab_start = _layout(self.num_topics, self.top_k, termTopics, self.vocab_size, numSlots)
+        for name, dtype, shape, offset in arrays:
+            setattr(self, name, np.frombuffer(self._mm, dtype=np.dtype(dtype).newbyteorder('<'), count=int(np.prod(shape)), offset=offset).reshape(shape))
+        self._mask = numSlots - 1
+
+    def term(self, term_id):
+        '''
+        Returns:
+            str: returns the term of a term id
+        '''
+        return self._mm[self._vocab_start + int(self.vocab_offsets[term_id]):self._vocab_start + int(self.vocab_offsets[term_id + 1])].decode('utf-8')
+
+    def term_id(self, term):
+        '''
+        Returns:
+            int: returns the term id of a term; -1 if it is not in the vocabulary
+        '''
+        encoded = term.encode('utf-8')
+        slot = zlib.crc32(encoded) & self._mask
+        while (self.slots[slot] >= 0):
+            term_id = int(self.slots[slot])
+            if (self._mm[self._vocab_start + int(self.vocab_offsets[term_id]):self._vocab_start + int(self.vocab_offsets[term_id + 1])] == encoded):
+                return term_id
+            slot = (slot + 1) & self._mask
+        return -1
+
+    def topic_terms(self, topic, topn=None):
+        '''
+        Returns:
+            list: returns (term, p(term | topic)) of the topn (up to top_k) top terms of a topic, e.g. to label it
+        '''
+        return [(self.term(term_id), float(weight)) for term_id, weight in zip(self.top_terms[topic, :topn], self.top_weights[topic, :topn])]
+
+    def topics_of(self, term):
+        '''
+        Returns:
+            list: returns (topic, p(topic | term)) of the top topics of a term; empty if it is not in the vocabulary
+        '''
+        term_id = self.term_id(term)
+        if (term_id < 0):
+            return []
+        return [(int(topic), float(weight)) for topic, weight in zip(self.term_topics[term_id], self.term_topic_weights[term_id])]
+
+    def expand(self, terms, topn=10):
+        '''
+        Expand a query with the terms most related to it through the topics: each term scores p(topic | query term) *
+        p(term | topic), summed over the top topics of the query terms and the top terms of those topics
+
+        Args:
+            terms (list): query terms; those not in the vocabulary are ignored
+            topn (int): no. of terms to expand the query with
+
+        Returns:
+            list: returns (term, score) of the topn expansion terms, highest first, excluding the query terms
+        '''
+        term_ids = [term_id for term_id in (self.term_id(term) for term in terms) if (term_id >= 0)]
+        if (len(term_ids) < 1):
+            return []
+
+        topics = self.term_topics[term_ids].ravel()
+        candidates = self.top_terms[topics].ravel()
+        scores = (self.term_topic_weights[term_ids].ravel()[:, np.newaxis] * self.top_weights[topics]).ravel()
+        unique, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        totals[np.isin(unique, term_ids)] = -1
+
+        order = np.argsort(-totals, kind='stable')[:topn]
+        return [(self.term(int(unique[i])), float(totals[i])) for i in order if (totals[i] > 0)]
+
+    def close(self):
+        # Views of the mapping must be released before it can be closed
+        for name in ['top_terms', 'top_weights', 'term_topics', 'term_topic_weights', 'vocab_offsets', 'slots']:
+            setattr(self, name, None)
+        self._mm.close()
@@ -0,0 +1,139 @@
+# Bulk writer: streams update actions to ES in chunks as they are produced, optionally over several threads, and retries
+# documents rejected by a busy cluster with exponential backoff
+
+# Imports
+from elasticsearch.helpers import streaming_bulk, parallel_bulk
+
+from collections import Counter
+import time
+
+# Class Definitions
+class BulkWriter:
+    '''
+    Writes update actions (see get_actions() in tagger.py) to ES with the streaming_bulk helper, or parallel_bulk if
+    more than 1 thread is used. Actions are consumed lazily, so a generator of actions is never materialised in full.
+
+    Documents rejected with a 429 (the cluster's write queue is full), or lost to a failed bulk request (e.g. timeout),
+    are retried with exponential backoff; other failures (e.g. document no longer exists) are not retried.
+
+    Args:
+        es (obj): elasticsearch object reference
+        rootLogger (obj): reference of rootLogger object
+        chunk_size (int): max no. of documents per bulk request
+        max_chunk_bytes (int): max size of a bulk request in bytes
+        threads (int): no. of threads sending bulk requests; 1 uses streaming_bulk
+        max_retries (int): no. of times a rejected document is retried before giving up
+        initial_backoff (float): seconds to wait before the first retry; doubled for every subsequent retry
+        max_backoff (float): max seconds to wait before a retry
+        metrics (Metrics): optional metrics registry to record bulk latencies and written, failed and rejected document counts in
+        controller (BatchController): optional adaptive batch controller (see batch_controller.py); its bulk size replaces
+                                      chunk_size, and it is told the latency and rejections of every write
+
+    Attributes:
+        failures (Counter): document id -> no. of failed attempts to write it, over the lifetime of the writer
+    '''
+    def __init__(self, es, rootLogger, chunk_size=500, max_chunk_bytes=100 * 1024 * 1024, threads=1, max_retries=3, initial_backoff=2, max_backoff=600, metrics=None, controller=None):
+        self.es = es
+        self.rootLogger = rootLogger
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.threads = threads
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.failures = Counter()
+        self.metrics = metrics
+        self.controller = controller
+
+    def _bulk(self, actions):
+        chunk_size = self.controller.bulk_size if (self.controller is not None) else self.chunk_size
+        if (self.threads > 1):
+            return parallel_bulk(self.es, actions, thread_count=self.threads, chunk_size=chunk_size, max_chunk_bytes=self.max_chunk_bytes,
+                                 raise_on_error=False, raise_on_exception=False)
+
+        return streaming_bulk(self.es, actions, chunk_size=chunk_size, max_chunk_bytes=self.max_chunk_bytes,
+                              raise_on_error=False, raise_on_exception=False)
+
+    def _send(self, actions):
+        '''
+        Send actions once
+
+        Returns:
+            tuple: returns no. of documents written, no. of documents failed for good, list of actions to retry, and
+                   seconds spent waiting on the actions to be produced (e.g. tagged by get_actions())
+        '''
+        # Actions sent but not yet answered for; results come back in order, so this only ever holds the chunks in flight
+        in_flight = {}
+        producing = 0.0
+        def track(actions):
+            nonlocal producing
+            actions = iter(actions)
+            while (True):
+                start = time.time()
+                action = next(actions, None)
+                producing += time.time() - start
+                if (action is None):
+                    return
+                in_flight[action['_id']] = action
+                yield action
+
+        written, failed, retry = 0, 0, []
+        for ok, item in self._bulk(track(actions)):
+            op_type, info = item.popitem()
+            action = in_flight.pop(info['_id'], None)
+            if (ok):
+                written += 1
+                continue
+
+            self.failures[info['_id']] += 1
+            if (info.get('status') == 429 or 'exception' in info):
+                retry.append(action)
+                if (self.metrics is not None):
+                    self.metrics.inc('docs_rejected_total')
+            else:
+                failed += 1
+                self.rootLogger.warning(f"Failed to write tags of document {info['_id']}: {info.get('error')}")
+
+        return written, failed, retry, producing
+
+    def write(self, actions):
+        '''
+        Write update actions to ES, retrying rejected documents
+
+        Args:
+            actions (iterable): update actions; can be a generator
+
+        Returns:
+            tuple: returns no. of documents written and no. of documents which failed to be written
+        '''
+        start = time.time()
+        written, failed, retry, producing = self._send(actions)
+        rejected = len(retry)
+
+        for attempt in range(1, self.max_retries + 1):
+            if (len(retry) < 1):
+                break
+
+            backoff = min(self.max_backoff, self.initial_backoff * 2 ** (attempt - 1))
+            self.rootLogger.warning(f'{len(retry)} document(s) rejected; retrying in {backoff}s (attempt {attempt} of {self.max_retries})')
+            time.sleep(backoff)
+
+            retry_written, retry_failed, retry, _ = self._send(retry)
+            written += retry_written
+            failed += retry_failed
+            rejected += len(retry)
+
+        if (len(retry) > 0):
+            self.rootLogger.error(f'Gave up writing tags of {len(retry)} document(s) after {self.max_retries} retries')
+            failed += len(retry)
+
+        # Actions are consumed lazily, so exclude the time spent producing them; includes backoff before retries
+        seconds = time.time() - start - producing
+        if (self.metrics is not None):
+            self.metrics.observe('bulk_seconds', seconds)
+            self.metrics.inc('docs_written_total', written)
+            self.metrics.inc('docs_failed_total', failed)
+        if (self.controller is not None):
+            self.controller.observe_bulk(written + failed, seconds, rejected)
+
+        return written, failed